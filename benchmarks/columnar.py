@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''
+Benchmark for the columnar file format: compares the size of a file with log entries (one JSON object
+per line) with the same entries written by ColumnarWriter, and the time needed to scan one field and to
+load all log entries. The entries of the input file are repeated with distinct timestamps and IP addresses.
+By default, the sample log entries in tests/csp/data are used.
+
+Usage: python benchmarks/columnar.py [filename] [repetitions]
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csp.log import LogEntryParser
+from csp.tools.fileio import ColumnarWriter, ColumnarFile, ColumnarReader, LogEntryDataReader
+
+
+def writeFiles(filename, repetitions, directory):
+    """
+    Writes the repeated entries from 'filename' as JSON lines and in the columnar format into 'directory'.
+    Returns the names of both files.
+    """
+    with open(filename, "r") as f:
+        lines = [json.loads(line) for line in f if line.strip() != ""]
+    jsonFile = os.path.join(directory, "entries.dat")
+    columnarFile = os.path.join(directory, "entries.col")
+    parser = LogEntryParser()
+    writer = ColumnarWriter(columnarFile)
+    timestamp = datetime.datetime(2014, 1, 1)
+    with open(jsonFile, "w") as f:
+        for i in xrange(repetitions):
+            for data in lines:
+                timestamp += datetime.timedelta(microseconds=1234567)
+                data = dict(data)
+                data["timestamp-utc"] = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+                data["remote-addr"] = "10.%d.%d.%d" % ((i >> 16) & 255, (i >> 8) & 255, i & 255)
+                line = json.dumps(data)
+                f.write(line + "\n")
+                writer.store(parser.parseString(line))
+    writer.close()
+    return (jsonFile, columnarFile)
+
+
+def scanJSON(jsonFile):
+    with open(jsonFile, "r") as f:
+        return [json.loads(line)["policy-type"] for line in f]
+
+
+def scanColumnar(columnarFile):
+    columns = ColumnarFile(columnarFile)
+    values = columns.readColumn("policy-type")
+    columns.close()
+    return values
+
+
+def main():
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "csp", "data",
+                            "sample-logentries.dat")
+    repetitions = 20000
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    if len(sys.argv) > 2:
+        repetitions = int(sys.argv[2])
+
+    directory = tempfile.mkdtemp()
+    try:
+        (jsonFile, columnarFile) = writeFiles(filename, repetitions, directory)
+        jsonSize = os.path.getsize(jsonFile)
+        columnarSize = os.path.getsize(columnarFile)
+        print "JSON lines: %d bytes" % jsonSize
+        print "columnar:   %d bytes (%.1fx smaller)" % (columnarSize, float(jsonSize) / columnarSize)
+
+        assert scanJSON(jsonFile) == scanColumnar(columnarFile)
+        jsonScan = timeit.timeit(lambda: scanJSON(jsonFile), number=1)
+        columnarScan = timeit.timeit(lambda: scanColumnar(columnarFile), number=1)
+        print "scan policy-type:   JSON %.3f s, columnar %.3f s (%.1fx faster)" \
+                    % (jsonScan, columnarScan, jsonScan / columnarScan)
+
+        assert LogEntryDataReader().loadAll(jsonFile) == ColumnarReader().loadAll(columnarFile)
+        jsonLoad = timeit.timeit(lambda: LogEntryDataReader().loadAll(jsonFile), number=1)
+        columnarLoad = timeit.timeit(lambda: ColumnarReader().loadAll(columnarFile), number=1)
+        print "load log entries:   JSON %.3f s, columnar %.3f s (%.1fx faster)" \
+                    % (jsonLoad, columnarLoad, jsonLoad / columnarLoad)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''
+Memory benchmark for the core value types: reports the size in bytes of single URI, SourceExpression,
+Directive, Policy, Report and LogEntry objects (including everything they reference), and the average
+number of bytes per log entry when many log entries are loaded at once. Objects shared between
+log entries (such as cached policies) are counted only once.
+
+Usage: python benchmarks/memory.py [filename] [repetitions]
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csp.log import LogEntryParser
+
+
+def deepSize(obj, seen):
+    """
+    Returns the number of bytes used by 'obj' and all objects reachable from it that are not in 'seen'
+    (a set of object IDs, which is updated). Types and modules are not counted.
+    """
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for (key, value) in obj.iteritems():
+            size += deepSize(key, seen) + deepSize(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deepSize(item, seen)
+    if hasattr(obj, "__dict__"):
+        size += deepSize(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if slot != "__weakref__" and hasattr(obj, slot):
+                size += deepSize(getattr(obj, slot), seen)
+    return size
+
+
+def main():
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "csp", "data",
+                            "sample-logentries.dat")
+    repetitions = 2000
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    if len(sys.argv) > 2:
+        repetitions = int(sys.argv[2])
+
+    with open(filename, "r") as f:
+        lines = [line.strip() for line in f if line.strip() != ""]
+
+    parser = LogEntryParser()
+    entry = parser.parseString(lines[0])
+    report = entry["csp-report"]
+    policy = report["original-policy"]
+    directive = iter(policy.getDirectives()).next()
+    for (name, obj) in (("URI", report["document-uri"]),
+                        ("SourceExpression", iter(directive.getWhitelistedSourceExpressions()).next()),
+                        ("Directive", directive),
+                        ("Policy", policy),
+                        ("Report", report),
+                        ("LogEntry", entry)):
+        print "%-18s %6d bytes (object only: %d bytes)" % (name, deepSize(obj, set()), sys.getsizeof(obj))
+
+    entries = [parser.parseString(line) for _ in xrange(repetitions) for line in lines]
+    total = deepSize(entries, set()) - sys.getsizeof(entries)
+    print "%d log entries loaded: %.0f bytes per log entry" % (len(entries), float(total) / len(entries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+'''
+Benchmark for URIParser: compares the single-pass fast path with the urlparse-based parser on the
+URIs found in a file with log entries or reports (one JSON object per line, such as the files
+written by examples/csp.cgi). By default, the sample log entries in tests/csp/data are used.
+
+Usage: python benchmarks/uriparser.py [filename] [repetitions]
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csp.uri import URIParser
+import csp.defaults as defaults
+
+
+def loadURIStrings(filename):
+    """
+    Returns a list of all values of the 'uriKeys' fields in the reports contained in 'filename'.
+    """
+    uriStrings = []
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            data = json.loads(line)
+            report = data.get("csp-report", data)
+            for key in defaults.uriKeys:
+                if key in report:
+                    uriStrings.append(report[key])
+    return uriStrings
+
+
+def makeDistinct(uriStrings, repetitions):
+    """
+    Returns 'repetitions' copies of 'uriStrings' in which each URI with a host has a different fragment.
+    (The fragment is ignored by the parser, but it defeats the small result cache inside urlparse, which is
+    ineffective on real data with many distinct URIs.)
+    """
+    distinctStrings = []
+    for i in xrange(repetitions):
+        for uriString in uriStrings:
+            if "://" in uriString and "#" not in uriString:
+                uriString += "#%d" % i
+            distinctStrings.append(uriString)
+    return distinctStrings
+
+
+def benchmark(parser, uriStrings):
+    """
+    Returns the time in seconds needed to parse all 'uriStrings'.
+    """
+    def parseAll():
+        for uriString in uriStrings:
+            parser.parse(uriString)
+    return timeit.timeit(parseAll, number=1)
+
+
+def main():
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "csp", "data",
+                            "sample-logentries.dat")
+    repetitions = 20000
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    if len(sys.argv) > 2:
+        repetitions = int(sys.argv[2])
+
+    uriStrings = loadURIStrings(filename)
+    fastParser = URIParser(addScheme=False)
+    slowParser = URIParser(addScheme=False, useFastPath=False)
+    for uriString in uriStrings:
+        assert fastParser.parse(uriString) == slowParser.parse(uriString)
+
+    uriStrings = makeDistinct(uriStrings, repetitions)
+    slow = benchmark(slowParser, uriStrings)
+    fast = benchmark(fastParser, uriStrings)
+    count = len(uriStrings)
+    print "%d URIs parsed" % count
+    print "urlparse:   %.3f s (%.2f us/URI)" % (slow, slow * 1e6 / count)
+    print "fast path:  %.3f s (%.2f us/URI)" % (fast, fast * 1e6 / count)
+    print "speedup:    %.2fx" % (slow / fast)
+
+
+if __name__ == "__main__":
+    main()
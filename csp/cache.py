@@ -0,0 +1,238 @@
+'''
+Bounded caches with least-recently-used eviction. 'LRUCache' is a generic cache that counts hits,
+misses and evictions. 'MatchCache' memoizes the results of Policy.matches(.) and Directive.matches(.)
+for repeated combinations of policy/directive, resource URI and protected document URI. 'URIParseCache'
+memoizes the URIs parsed from strings and can be shared by several ReportParsers and LogEntryParsers.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import defaults
+
+
+class LRUCache(object):
+    """
+    A map with a maximum number of entries. When a new entry is added to a full cache, the least
+    recently used entry is evicted. Keys must be hashable and should be immutable.
+    """
+
+    # indices into the entries of the doubly-linked list
+    _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxSize):
+        """
+        Creates a new, empty LRUCache that holds at most 'maxSize' entries. If 'maxSize' is 0, nothing
+        will be stored (every lookup is a miss).
+        """
+        self._maxSize = maxSize
+        self._entries = {} # key -> [prev, next, key, value]
+        self._root = [] # sentinel of the doubly-linked list, most recently used entry is root[_PREV]
+        self._root[:] = [self._root, self._root, None, None]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for 'key' and marks it as recently used, or 'default' if there is no
+        such entry. Counts as a hit or miss, respectively.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return default
+        self._hits += 1
+        self._unlink(entry)
+        self._append(entry)
+        return entry[LRUCache._VALUE]
+
+    def put(self, key, value):
+        """
+        Stores 'value' for 'key', evicting the least recently used entry if the cache is full.
+        """
+        if self._maxSize <= 0:
+            return
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[LRUCache._VALUE] = value
+            self._unlink(entry)
+            self._append(entry)
+            return
+        if len(self._entries) >= self._maxSize:
+            oldest = self._root[LRUCache._NEXT]
+            self._unlink(oldest)
+            del self._entries[oldest[LRUCache._KEY]]
+            self._evictions += 1
+        entry = [None, None, key, value]
+        self._append(entry)
+        self._entries[key] = entry
+
+    def clear(self):
+        """
+        Removes all entries from this cache. (The hit, miss and eviction counters are not reset.)
+        """
+        self._entries.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def getMaxSize(self):
+        """Returns the maximum number of entries in this cache."""
+        return self._maxSize
+
+    def getHits(self):
+        """Returns the number of lookups that found an entry."""
+        return self._hits
+
+    def getMisses(self):
+        """Returns the number of lookups that did not find an entry."""
+        return self._misses
+
+    def getEvictions(self):
+        """Returns the number of entries that were evicted because the cache was full."""
+        return self._evictions
+
+    def getHitRate(self):
+        """Returns the fraction of lookups that found an entry (0.0 if there were no lookups)."""
+        lookups = self._hits + self._misses
+        if lookups == 0:
+            return 0.0
+        return float(self._hits) / lookups
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        Returns whether there is an entry for 'key' (without counting a hit or miss or changing the
+        order of eviction).
+        """
+        return key in self._entries
+
+    def _unlink(self, entry):
+        entry[LRUCache._PREV][LRUCache._NEXT] = entry[LRUCache._NEXT]
+        entry[LRUCache._NEXT][LRUCache._PREV] = entry[LRUCache._PREV]
+
+    def _append(self, entry):
+        last = self._root[LRUCache._PREV]
+        entry[LRUCache._PREV] = last
+        entry[LRUCache._NEXT] = self._root
+        last[LRUCache._NEXT] = entry
+        self._root[LRUCache._PREV] = entry
+
+
+class MatchCache(object):
+    """
+    Memoizes the results of Policy.matches(.) and Directive.matches(.). Results are cached in an LRUCache
+    keyed by the (immutable) policy or directive, resource type, resource URI and protected document URI,
+    which all have cached hash values. The 'schemePortMappings' and 'defaultSrcTypes' parameters used for
+    matching are fixed when the MatchCache is created.
+    """
+
+    def __init__(self, maxSize=defaults.matchCacheSize, schemePortMappings=defaults.schemePortMappings,
+                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes, compiled=False):
+        """
+        Creates a new MatchCache configured with the following parameters:
+        'maxSize': the maximum number of cached results.
+        'schemePortMappings': passed on to Policy.matches(.) and Directive.matches(.).
+        'defaultSrcTypes': passed on to Policy.matches(.).
+        'compiled': if set to True, results that are not in the cache are computed with the compiled
+                    version of the policy or directive (see Policy.compile() and Directive.compile()).
+        """
+        self._cache = LRUCache(maxSize)
+        self._schemePortMappings = schemePortMappings
+        self._defaultSrcTypes = defaultSrcTypes
+        self._compiled = compiled
+
+    def policyMatches(self, policy, resourceURI, resourceType, protectedDocumentURI):
+        """
+        Returns policy.matches(resourceURI, resourceType, protectedDocumentURI), using a cached result if
+        available.
+        """
+        resourceType = resourceType.lower()
+        key = (policy, resourceType, resourceURI, protectedDocumentURI)
+        result = self._cache.get(key)
+        if result is None:
+            if self._compiled:
+                policy = policy.compile()
+            result = policy.matches(resourceURI, resourceType, protectedDocumentURI, self._schemePortMappings,
+                                    self._defaultSrcTypes)
+            self._cache.put(key, result)
+        return result
+
+    def directiveMatches(self, directive, resourceURI, protectedDocumentURI):
+        """
+        Returns directive.matches(resourceURI, protectedDocumentURI), using a cached result if available.
+        """
+        key = (directive, resourceURI, protectedDocumentURI)
+        result = self._cache.get(key)
+        if result is None:
+            if self._compiled:
+                directive = directive.compile()
+            result = directive.matches(resourceURI, protectedDocumentURI, self._schemePortMappings)
+            self._cache.put(key, result)
+        return result
+
+    def getCache(self):
+        """
+        Returns the underlying LRUCache (for example, to query the hit, miss and eviction counters).
+        """
+        return self._cache
+
+    def getHits(self):
+        """Returns the number of results that were found in the cache."""
+        return self._cache.getHits()
+
+    def getMisses(self):
+        """Returns the number of results that had to be computed."""
+        return self._cache.getMisses()
+
+    def getEvictions(self):
+        """Returns the number of results that were evicted because the cache was full."""
+        return self._cache.getEvictions()
+
+
+class URIParseCache(object):
+    """
+    Memoizes the results of URIParser.parse(.). Results are cached in an LRUCache keyed by the configuration
+    of the URIParser (see URIParser.getConfigKey()) and the parsed string, so that one URIParseCache can be
+    shared by parsers with different configurations. Since URIs are immutable, the same URI object is
+    returned for repeated strings.
+    """
+
+    def __init__(self, maxSize=defaults.uriCacheSize):
+        """
+        Creates a new URIParseCache that holds at most 'maxSize' parsed URIs.
+        """
+        self._cache = LRUCache(maxSize)
+
+    def parse(self, uriParser, uriString):
+        """
+        Returns uriParser.parse(uriString), using a cached result if available.
+        """
+        key = (uriParser.getConfigKey(), uriString)
+        uri = self._cache.get(key)
+        if uri is None:
+            uri = uriParser.parse(uriString)
+            self._cache.put(key, uri)
+        return uri
+
+    def getCache(self):
+        """
+        Returns the underlying LRUCache.
+        """
+        return self._cache
+
+    def getHits(self):
+        """Returns the number of URIs that were found in the cache."""
+        return self._cache.getHits()
+
+    def getMisses(self):
+        """Returns the number of URIs that had to be parsed."""
+        return self._cache.getMisses()
+
+    def getEvictions(self):
+        """Returns the number of URIs that were evicted because the cache was full."""
+        return self._cache.getEvictions()
+
+    def getHitRate(self):
+        """Returns the fraction of URIs that were found in the cache (0.0 if nothing was parsed)."""
+        return self._cache.getHitRate()
@@ -48,4 +48,30 @@ uriKeys = ('blocked-uri', 'document-uri', 'referrer') # source-file excluded bec
 directiveKeys = ('violated-directive',)
 policyKeys = ("original-policy",)
 reportKeyNameReplacements = {'document-url': 'document-uri'}
-requiredReportKeys = ('blocked-uri', 'violated-directive', 'document-uri')
\ No newline at end of file
+requiredReportKeys = ('blocked-uri', 'violated-directive', 'document-uri')
+maxSharedKeyNames = 1000 # bounds the number of distinct key names shared between parsed reports
+
+# Cache
+
+matchCacheSize = 100000
+uriCacheSize = 100000
+policyCacheSize = 10000
+directiveCacheSize = 10000
+persistentCacheSize = 1000000 # entries in the database of a PersistentParseCache
+persistentCacheFlushSize = 1000 # new entries written to the database of a PersistentParseCache at once
+
+# File I/O
+
+readBufferSize = 1024 * 1024 # bytes buffered when streaming lines from data files
+parallelRangeSize = 16 * 1024 * 1024 # bytes of a file parsed by one worker task in ParallelDataReader
+writeBufferSize = 1024 * 1024 # bytes buffered before writing to data files
+writeBatchSize = 1000 # objects serialised at once by DataWriter.storeAll(.)
+compressionLevel = 6 # for .gz, .bz2 and .xz files (for .bz2, the block size in units of 100 kB)
+directoryReaderThreads = 16 # threads reading report files in parallel in DirectoryReader
+directoryReaderBatchSize = 1000 # report files read at once by DirectoryReader (bounds memory usage)
+segmentSize = 100000 # report files merged into one segment file by SegmentCompactor
+followPollInterval = 1.0 # seconds between checks for new data in FollowReader
+
+# Validation
+
+validatorChunkSize = 1000
@@ -8,12 +8,18 @@ of a list of whitelisted SourceExpressions (which can be empty, corresponding to
 
 from sourceexpression import SourceExpressionParser, SourceExpression, URISourceExpression
 from uri import URI
+from hosttrie import HostTrie
+from pathtree import PathRadixTree
+from cache import LRUCache
 import defaults
 
 
 class Directive(object):
     """A single CSP directive ("rule"). Immutable"""
     
+    __slots__ = ("_hash", "_str", "_compiled", "_directiveType", "_whitelistedSourceExpressions",
+                 "_isRegularDirective", "__weakref__")
+    
     _invalid = None
     _inlineStyleBaseRestriction = None
     _inlineScriptBaseRestriction = None
@@ -34,6 +40,7 @@ class Directive(object):
         """
         self._hash = None
         self._str = None
+        self._compiled = None
         self._directiveType = directiveType
         whitelistedSrcExpr = set(filter(lambda x: x != SourceExpression.INVALID(), whitelistedSourceExpressions))
         self._whitelistedSourceExpressions = frozenset(whitelistedSrcExpr)
@@ -155,11 +162,42 @@ class Directive(object):
         """
         if not self.isRegularDirective():
             return False
+        protectedURIScheme = protectedDocumentURI.getScheme()
+        if protectedURIScheme is not None:
+            protectedURIScheme = protectedURIScheme.lower()
+        return self._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings)
+
+    def matchesMany(self, resourceURIs, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings):
+        """
+        Returns a list with one boolean for each URI in the iterable 'resourceURIs' (in the same order) that
+        indicates whether the URI is allowed under this directive. The result is the same as calling matches(.)
+        for each URI, but checks that depend only on 'protectedDocumentURI' are done once for all URIs.
+        """
+        resourceURIs = list(resourceURIs)
+        if not self.isRegularDirective():
+            return [False] * len(resourceURIs)
+        protectedURIScheme = protectedDocumentURI.getScheme()
+        if protectedURIScheme is not None:
+            protectedURIScheme = protectedURIScheme.lower()
+        return [self._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings)
+                for resourceURI in resourceURIs]
+
+    def _matchesWithDocumentScheme(self, resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
         for srcExpr in self._whitelistedSourceExpressions:
-            if srcExpr.matches(resourceURI, protectedDocumentURI, schemePortMappings):
+            if srcExpr._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
                 return True
         return False
-    
+
+    def compile(self):
+        """
+        Returns a CompiledDirective for this Directive. The CompiledDirective gives the same matching results
+        as this Directive, but indexes the whitelisted source expressions by host so that matching is faster
+        for directives with many source expressions. The result is computed once and then cached.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledDirective(self)
+        return self._compiled
+
     def generateDirective(self, reportType, blockedURI):
         """
         Generates a new Directive that allows exactly the kind of event that caused the CSP violation report,
@@ -282,6 +320,8 @@ class Directive(object):
         effect (which could happen if one uses default-src and the other specifies all elementary
         types, for instance).
         """
+        if self is other:
+            return True
         if type(other) != Directive:
             return False
         if self._isRegularDirective != other._isRegularDirective:
@@ -302,6 +342,146 @@ class Directive(object):
         return self._hash
 
 
+class CompiledDirective(object):
+    """
+    Read-only matcher for a Directive, obtained by calling Directive.compile(). Immutable.
+
+    Source expressions with a specific host or a wildcard host ("*.example.com") are grouped by scheme, host
+    and port, and the groups are stored in a HostTrie. Within a group, the paths of the source expressions are
+    stored in a PathRadixTree. When matching a resource URI, only the groups found in one walk over the labels
+    of the host of the URI are considered, and the path of the URI is resolved in one descent of the
+    PathRadixTree of each group. The few source expressions that cannot be indexed by host (such as 'self'
+    or "https:") are tested individually. The matching results are the same as for Directive.matches(.).
+    """
+
+    def __init__(self, directive):
+        """
+        Creates a new CompiledDirective from the given 'directive'. (Use Directive.compile() instead of calling
+        this constructor directly.)
+        """
+        self._directive = directive
+        self._isRegularDirective = directive.isRegularDirective()
+        self._matchesAllRegularURIs = False # whitelist contains '*'
+        self._schemes = set([]) # schemes of "scheme:" source expressions
+        self._hosts = HostTrie() # host or "*." + host -> _HostSourceExpressions
+        self._unindexedURIExpressions = [] # URISourceExpressions that may match any host
+        self._otherExpressions = [] # 'self', 'unsafe-inline', 'unsafe-eval'
+        groups = {} # (scheme, host, port) -> _HostSourceExpressions
+        for srcExpr in directive.getWhitelistedSourceExpressions():
+            if srcExpr.getType() != "uri":
+                self._otherExpressions.append(srcExpr)
+                continue
+            scheme = srcExpr.getScheme()
+            host = srcExpr.getHost()
+            if scheme is None and host == "*" and srcExpr.getPort() is None and srcExpr.getPath() is None:
+                self._matchesAllRegularURIs = True
+            elif scheme is not None and host is None and srcExpr.getPort() is None and srcExpr.getPath() is None:
+                self._schemes.add(scheme)
+            elif host is not None and (host[0] != "*" or (host[:2] == "*." and len(host) > 2)):
+                key = (scheme, host, srcExpr.getPort())
+                group = groups.get(key)
+                if group is None:
+                    group = _HostSourceExpressions()
+                    groups[key] = group
+                    self._hosts.add(host, group)
+                group.add(srcExpr)
+            else:
+                self._unindexedURIExpressions.append(srcExpr)
+
+    def getDirective(self):
+        """
+        Returns the Directive that was compiled into this CompiledDirective.
+        """
+        return self._directive
+
+    def matches(self, resourceURI, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings):
+        """
+        Returns whether the given resourceURI is allowed under the compiled Directive. The parameters and
+        the result are the same as for Directive.matches(.).
+        """
+        if not self._isRegularDirective:
+            return False
+        protectedURIScheme = protectedDocumentURI.getScheme()
+        if protectedURIScheme is not None:
+            protectedURIScheme = protectedURIScheme.lower()
+        return self._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings)
+
+    def matchesMany(self, resourceURIs, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings):
+        """
+        Returns a list with one boolean for each URI in the iterable 'resourceURIs' (in the same order) that
+        indicates whether the URI is allowed under the compiled Directive. The parameters and the result are
+        the same as for Directive.matchesMany(.).
+        """
+        resourceURIs = list(resourceURIs)
+        if not self._isRegularDirective:
+            return [False] * len(resourceURIs)
+        protectedURIScheme = protectedDocumentURI.getScheme()
+        if protectedURIScheme is not None:
+            protectedURIScheme = protectedURIScheme.lower()
+        return [self._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings)
+                for resourceURI in resourceURIs]
+
+    def _matchesWithDocumentScheme(self, resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+        for srcExpr in self._otherExpressions:
+            if srcExpr._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+                return True
+        if not resourceURI.isRegularURI():
+            return False
+        if self._matchesAllRegularURIs:
+            return True
+
+        uriScheme = resourceURI.getScheme()
+        if uriScheme is not None and uriScheme.lower() in self._schemes:
+            return True
+
+        uriHost = resourceURI.getHost()
+        if uriHost is None:
+            return False
+        for group in self._hosts.lookup(uriHost.lower()):
+            if group.matches(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+                return True
+        for srcExpr in self._unindexedURIExpressions:
+            if srcExpr._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+                return True
+        return False
+
+
+class _HostSourceExpressions(object):
+    """
+    Internal helper for CompiledDirective: URISourceExpressions with the same scheme, host and port, which
+    therefore differ only in their paths.
+    """
+
+    def __init__(self):
+        self._withoutPath = []
+        self._paths = None # PathRadixTree, created for the first source expression with a path
+
+    def add(self, srcExpr):
+        if srcExpr.getPath() is None:
+            self._withoutPath.append(srcExpr)
+        else:
+            if self._paths is None:
+                self._paths = PathRadixTree()
+            self._paths.add(srcExpr.getPath(), srcExpr)
+
+    def matches(self, resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+        for srcExpr in self._withoutPath:
+            if srcExpr._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+                return True
+        if self._paths is None:
+            return False
+        uriPath = resourceURI.getPath()
+        if uriPath is None or uriPath == "":
+            uriPath = "/"
+        pathMatches = self._paths.lookup(uriPath)
+        if len(pathMatches) == 0:
+            return False
+        # all source expressions in this group differ only in the path, so if one source expression
+        # with a matching path does not match, none of the others will match either
+        return pathMatches[0]._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme,
+                                                         schemePortMappings)
+
+
 class DirectiveParser(object):
     """
     Pre-configured object that parses strings into Directives.
@@ -311,7 +491,10 @@ class DirectiveParser(object):
                  typeTranslations=defaults.directiveTypeTranslations, 
                  allowedTypes=defaults.allowedDirectiveTypes,
                  knownSchemes=defaults.supportedSchemes,
-                 strict=True):
+                 strict=True,
+                 cacheSize=defaults.directiveCacheSize,
+                 internPool=None,
+                 persistentCache=None):
         """
         Creates a new DirectiveParser object configured with the following parameters:
         'typeTranslations': a map from directive types to another directive type. Used to convert old names
@@ -322,11 +505,22 @@ class DirectiveParser(object):
         result in errors or Directive.INVALID().) All lowercase.
         'strict': if set to True, parsing errors of the directive or source expressions contained therein will
         be fixed by ignoring the invalid portion. Otherwise, any parsing error will result in Directive.INVALID().
+        'cacheSize': the maximum number of parsed directives that are cached (by directive string), so that repeated
+        directive strings are parsed only once. 0 disables the cache.
+        'internPool': if not None, an InternPool used to return shared instances of equal Directives and
+        SourceExpressions.
+        'persistentCache': if not None, a PersistentParseCache used to look up directives parsed in earlier runs
+        (when they are not in the in-memory cache) and to store newly parsed directives.
         """
         self._typeTranslations = typeTranslations.copy()
         self._allowedTypes = allowedTypes
+        self._knownSchemes = knownSchemes
         self._sourceExpressionParser = SourceExpressionParser(knownSchemes)
         self._strict = strict
+        self._cache = LRUCache(cacheSize) # directive string -> Directive
+        self._internPool = internPool
+        self._persistentCache = persistentCache
+        self._configKey = None
     
     def parse(self, stringDirective):
         """
@@ -336,8 +530,41 @@ class DirectiveParser(object):
 
         Depending on the configuration of this DirectiveParser object, may perform internal translation of the type 
         and filter certain directive types (returns Directive.INVALID() in that case).
-        """
         
+        Directives are immutable, so the same Directive object may be returned when the same string is parsed again.
+        """
+        directive = self._cache.get(stringDirective)
+        if directive is None:
+            if self._persistentCache is not None:
+                directive = self._persistentCache.get(self.getConfigKey(), stringDirective)
+                if directive is None:
+                    directive = self._parse(stringDirective)
+                    self._persistentCache.put(self.getConfigKey(), stringDirective, directive)
+            else:
+                directive = self._parse(stringDirective)
+            if self._internPool is not None:
+                directive = self._internPool.intern(directive)
+            self._cache.put(stringDirective, directive)
+        return directive
+    
+    def getCache(self):
+        """
+        Returns the LRUCache of parsed directives (for example, to query the hit, miss and eviction counters).
+        """
+        return self._cache
+    
+    def getConfigKey(self):
+        """
+        Returns a string that is equal for two DirectiveParsers if they are configured identically (and thus return
+        equal Directives for the same string), also across runs. The key is computed only once; the configuration
+        should not be changed afterwards.
+        """
+        if self._configKey is None:
+            self._configKey = repr((type(self).__name__, sorted(self._typeTranslations.iteritems()),
+                                    sorted(self._allowedTypes), sorted(self._knownSchemes), self._strict))
+        return self._configKey
+    
+    def _parse(self, stringDirective):
         # extract/translate directive type
         stringDirective = stringDirective.strip()
         if stringDirective == "inline style base restriction":
@@ -0,0 +1,89 @@
+'''
+A 'HostTrie' maps host names and wildcard host names (such as "*.example.com") to values. It
+is organised by the labels of the host names in reverse order ("com", "example", ...) so that all
+values registered for a host name or for a wildcard matching that host name can be found in one
+walk over the labels of the host name.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+
+class HostTrie(object):
+    """
+    Reverse-label trie of host names. Wildcard host names "*.example.com" match all host names that
+    end with ".example.com" (but not "example.com" itself), as in CSP source expressions.
+    """
+
+    def __init__(self):
+        """
+        Creates a new, empty HostTrie.
+        """
+        self._root = _HostTrieNode()
+        self._size = 0
+
+    def add(self, host, value):
+        """
+        Registers 'value' for the given 'host'. 'host' is a (lowercase) host name, or a wildcard host
+        name consisting of "*." followed by a host name. Several values can be registered for the same
+        host name.
+        """
+        if host[:2] == "*.":
+            node = self._getNode(host[2:])
+            if node.wildcardValues is None:
+                node.wildcardValues = []
+            node.wildcardValues.append(value)
+        else:
+            node = self._getNode(host)
+            if node.exactValues is None:
+                node.exactValues = []
+            node.exactValues.append(value)
+        self._size += 1
+
+    def lookup(self, host):
+        """
+        Returns a list of all values registered for the (lowercase) 'host' itself or for a wildcard host
+        name matching 'host'. The list is empty if there are no such values.
+        """
+        labels = host.split(".")
+        values = []
+        node = self._root
+        for i in xrange(len(labels) - 1, -1, -1):
+            node = node.children.get(labels[i])
+            if node is None:
+                return values
+            if i > 0 and node.wildcardValues is not None:
+                values.extend(node.wildcardValues)
+        if node.exactValues is not None:
+            values.extend(node.exactValues)
+        return values
+
+    def __len__(self):
+        """
+        Returns the number of values stored in this HostTrie.
+        """
+        return self._size
+
+    def _getNode(self, host):
+        """
+        Returns the node for the given (non-wildcard) host name, creating it if necessary.
+        """
+        labels = host.split(".")
+        node = self._root
+        for i in xrange(len(labels) - 1, -1, -1):
+            child = node.children.get(labels[i])
+            if child is None:
+                child = _HostTrieNode()
+                node.children[labels[i]] = child
+            node = child
+        return node
+
+
+class _HostTrieNode(object):
+    """
+    Internal node of a HostTrie, corresponding to one label of a host name.
+    """
+
+    def __init__(self):
+        self.children = {} # label -> _HostTrieNode
+        self.exactValues = None
+        self.wildcardValues = None
@@ -0,0 +1,80 @@
+'''
+An 'InternPool' is a flyweight table for immutable CSP objects: equal SourceExpressions, Directives,
+Policies and URIs share one instance. The pool holds only weak references, so objects that are no
+longer used elsewhere are removed from it automatically. Interned objects compare faster (equality
+checks short-circuit on identity) and use less memory when many equal objects are kept.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import weakref
+from directive import Directive
+from policy import Policy
+
+
+class InternPool(object):
+    """
+    Weak-reference intern table for SourceExpressions, Directives, Policies and URIs (or any other
+    immutable, hashable objects that support weak references).
+    """
+
+    def __init__(self):
+        """
+        Creates a new, empty InternPool.
+        """
+        self._pool = weakref.WeakKeyDictionary() # object -> weak reference to the same object
+        self._hits = 0
+        self._misses = 0
+
+    def intern(self, obj):
+        """
+        Returns the instance in this pool that is equal to 'obj', or adds 'obj' to the pool and returns it if
+        there is no such instance. Directives and Policies are interned recursively: if a new Directive or
+        Policy is added, it is replaced by an equal object built from the interned SourceExpressions or
+        Directives. Special singleton objects (such as Directive.INVALID()) are returned unchanged.
+        """
+        ref = self._pool.get(obj)
+        if ref is not None:
+            canonical = ref()
+            if canonical is not None:
+                self._hits += 1
+                return canonical
+        self._misses += 1
+        if type(obj) == Directive:
+            if obj.isRegularDirective():
+                obj = Directive(obj.getType(), map(self.intern, obj.getWhitelistedSourceExpressions()))
+            else:
+                return obj
+        elif type(obj) == Policy:
+            if obj != Policy.INVALID():
+                obj = Policy(map(self.intern, obj.getDirectives()))
+            else:
+                return obj
+        self._pool[obj] = weakref.ref(obj)
+        return obj
+
+    def internAll(self, objects):
+        """
+        Returns a set with the interned versions of all 'objects' (see intern(.)).
+        """
+        return set(map(self.intern, objects))
+
+    def getHits(self):
+        """Returns the number of objects for which an equal instance was found in the pool."""
+        return self._hits
+
+    def getMisses(self):
+        """Returns the number of objects that were added to the pool."""
+        return self._misses
+
+    def __len__(self):
+        """
+        Returns the number of (live) objects in this pool.
+        """
+        return len(self._pool)
+
+    def __contains__(self, obj):
+        """
+        Returns whether an object equal to 'obj' is in this pool.
+        """
+        return obj in self._pool
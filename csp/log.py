@@ -23,27 +23,42 @@ import json
 from csp.reportjsonencoder import ReportJSONEncoder
 from csp.report import ReportParser, Report
 from csp.policy import Policy
+import csp.defaults as defaults
 
 
-class LogEntry(collections.Mapping):
+class LogEntry(object):
     '''
     A LogEntry is an entry in the CSP violation report sink. It consists of a CSP Report plus
     a timestamp, the IP address of the browser, the user agent string, and the type of the
     violated policy header ('regular', 'eval', or 'inline').
     '''
 
+    # Python 2's collections.Mapping has no __slots__, so LogEntry is registered as a virtual subclass of
+    # Mapping (see below) and implements the Mapping methods itself.
+    __slots__ = ("_hash", "_str", "_entryData", "_lazyKeys", "_decoder")
+    
     _invalid = None
 
-    def __init__(self, dataDict):
+    def __init__(self, dataDict, lazyKeys=None, decoder=None):
         """
         Generates a new CSP LogEntry from the given data.
         
         'dataDict' is a dictionary with the field names of a log entry and the values MUST all be
         immutable.
+        
+        'lazyKeys': an optional iterable of keys whose values in 'dataDict' have not been decoded yet (lazy parsing).
+        Each of these values is decoded when it is accessed for the first time, by calling 'decoder' with this
+        LogEntry, the key and the raw value. The result replaces the raw value.
         """
         self._hash = None
         self._str = None
         self._entryData = dict(dataDict)
+        if lazyKeys:
+            self._lazyKeys = set(lazyKeys)
+            self._decoder = decoder
+        else:
+            self._lazyKeys = None
+            self._decoder = None
     
     @staticmethod
     def INVALID():
@@ -93,22 +108,89 @@ class LogEntry(collections.Mapping):
         return len(self._entryData)
     
     def __getitem__(self, key):
+        if self._lazyKeys is not None and key in self._lazyKeys:
+            self._decode(key)
         return self._entryData[key]
     
+    def __contains__(self, key):
+        return key in self._entryData
+    
+    def get(self, key, default=None):
+        if key in self._entryData:
+            return self[key]
+        return default
+    
+    def keys(self):
+        return self._entryData.keys()
+    
+    def values(self):
+        self._decodeAll()
+        return self._entryData.values()
+    
+    def items(self):
+        self._decodeAll()
+        return self._entryData.items()
+    
+    def iterkeys(self):
+        return self._entryData.iterkeys()
+    
+    def itervalues(self):
+        self._decodeAll()
+        return self._entryData.itervalues()
+    
+    def iteritems(self):
+        self._decodeAll()
+        return self._entryData.iteritems()
+    
+    def _decode(self, key):
+        """
+        Decodes the lazily parsed value of 'key' (which must be in self._lazyKeys).
+        """
+        self._lazyKeys.discard(key)
+        decoder = self._decoder
+        if len(self._lazyKeys) == 0:
+            self._lazyKeys = None
+            self._decoder = None
+        self._entryData[key] = decoder(self, key, self._entryData[key])
+    
+    def _decodeAll(self):
+        """
+        Decodes all lazily parsed values.
+        """
+        while self._lazyKeys is not None:
+            self._decode(iter(self._lazyKeys).next())
+    
+    def __getstate__(self):
+        self._decodeAll()
+        return self._entryData
+    
+    def __setstate__(self, state):
+        self._hash = None
+        self._str = None
+        self._entryData = state
+        self._lazyKeys = None
+        self._decoder = None
+    
     def __eq__(self, other):
         """
         Returns if this log entry is equal to another entry. This is implemented component-wise.
         """
         if type(other) != LogEntry:
             return False
+        self._decodeAll()
+        other._decodeAll()
         return self._entryData == other._entryData
     
+    def __ne__(self, other):
+        return not self == other
+    
     def __hash__(self):
         """
         Returns a hash value for this object that is guaranteed to be the same for two objects
         that are equal (the opposite is not necessarily true).
         """
         if self._hash is None:
+            self._decodeAll()
             self._hash = reduce(lambda hashSoFar, pair: hashSoFar ^ hash(pair), self._entryData.iteritems(), 0)
         return self._hash
     
@@ -126,11 +208,16 @@ class LogEntry(collections.Mapping):
             if self == LogEntry.INVALID():
                 self._str = "[invalid]"
             else:
+                self._decodeAll()
                 dat = self._entryData.copy()
-                dat["csp-report"] = dat["csp-report"]._repData
+                if "csp-report" in dat:
+                    dat["csp-report"]._decodeAll()
+                    dat["csp-report"] = dat["csp-report"]._repData
                 self._str = json.dumps(dat, sort_keys=True, cls=ReportJSONEncoder)
         return self._str
     
+collections.Mapping.register(LogEntry)
+    
 
 class LogEntryParser(object):
     """
@@ -160,7 +247,15 @@ class LogEntryParser(object):
                  ignoredDirectiveTypes=("plugin-types", "referrer", "reflected-xss", "report-uri", "sandbox"),
                  expandDefaultSrc=False,
                  defaultSrcTypes=("child-src", "connect-src", "font-src", "img-src", "media-src",
-                                  "object-src", "script-src", "style-src")):
+                                  "object-src", "script-src", "style-src"),
+                 uriCache=None,
+                 policyCacheSize=defaults.policyCacheSize,
+                 directiveCacheSize=defaults.directiveCacheSize,
+                 internPool=None,
+                 lazy=False,
+                 fields=None,
+                 reportFields=None,
+                 persistentCache=None):
         """
         Creates a new LogEntryParser object configured with the following parameters:
         
@@ -206,13 +301,44 @@ class LogEntryParser(object):
                             (See PolicyParser for details.)
         'defaultSrcTypes': [for parsed policies] when "default-src" is expanded, the elementary directive types
                             that will be added to replace the default policy. (See PolicyParser for details.)
+        'uriCache': [for parsed URIs] a URIParseCache used to memoize parsed URIs, which may be shared with other
+                            ReportParsers and LogEntryParsers. (See ReportParser for details.)
+        'policyCacheSize': [for parsed policies] the maximum number of parsed policies cached by policy string.
+                            (See PolicyParser for details.)
+        'directiveCacheSize': [for parsed directives and policies] the maximum number of parsed directives cached
+                            by directive string. (See DirectiveParser for details.)
+        'internPool': [for parsed directives and policies] an InternPool used to share equal Directives and
+                            Policies between log entries. (See ReportParser for details.)
+        'lazy': if set to True, the 'csp-report' part of log entries is parsed only when it is accessed for the
+                            first time, and then lazily as well (see ReportParser). Other fields, such as the
+                            policy type or user agent, are available without parsing the report. Since the report
+                            is validated only later, an invalid report does not cause the log entry to become
+                            LogEntry.INVALID(); the value of 'csp-report' becomes Report.INVALID() instead.
+        'fields': an iterable of the key (entry) names to be kept in parsed log entries, or None to keep all keys.
+                            If "csp-report" is not in 'fields', the report is neither parsed nor validated (but
+                            it must still be present in the log entry).
+        'reportFields': an iterable of the key (entry) names to be kept in the parsed 'csp-report', or None to
+                            keep all keys. (See ReportParser for details.)
+        'persistentCache': [for parsed directives and policies] a PersistentParseCache that keeps parsed Directives
+                            and Policies across runs. (See ReportParser for details.)
         """
         self._strict = strict
+        self._lazy = lazy
+        self._fields = None if fields is None else frozenset(fields)
+        self._keyNames = {} # key name -> shared key name object
         self._reportParser = ReportParser(uriKeys, directiveKeys, policyKeys, 
                                           keyNameReplacements, requiredKeys, strict, addSchemeToURIs, 
                                           defaultURIScheme, addPortToURIs, defaultURIPort, schemePortMappings, 
                                           portSchemeMappings, directiveTypeTranslations, allowedDirectiveTypes, 
-                                          ignoredDirectiveTypes, expandDefaultSrc, defaultSrcTypes)
+                                          ignoredDirectiveTypes, expandDefaultSrc, defaultSrcTypes,
+                                          uriCache, policyCacheSize, directiveCacheSize,
+                                          internPool, lazy, reportFields, persistentCache)
+    
+    def getReportParser(self):
+        """
+        Returns the ReportParser used to parse the 'csp-report' part of log entries.
+        """
+        return self._reportParser
             
     def parseString(self, stringLogEntry):
         """
@@ -235,11 +361,33 @@ class LogEntryParser(object):
         
         # TODO: could also parse the timestamp string etc.
         if "csp-report" in jsonLogEntry:
+            if self._fields is not None:
+                jsonLogEntry = dict((key, val) for (key, val) in jsonLogEntry.iteritems() if key in self._fields)
+                if not "csp-report" in jsonLogEntry:
+                    return LogEntry(dict(map(lambda (key, val): (self._shareKeyName(key), val),
+                                             jsonLogEntry.iteritems())))
+            if self._lazy:
+                return LogEntry(dict(map(lambda (key, val): (self._shareKeyName(key), val), jsonLogEntry.iteritems())),
+                                ("csp-report",), self._decodeReport)
             jsonLogEntry["csp-report"] = self._reportParser.parseJsonDict(jsonLogEntry["csp-report"])
             if self._strict and jsonLogEntry["csp-report"] == Report.INVALID():
                 return LogEntry.INVALID()
             else:
-                return LogEntry(jsonLogEntry)
+                return LogEntry(dict(map(lambda (key, val): (self._shareKeyName(key), val), jsonLogEntry.iteritems())))
         else:
             return LogEntry.INVALID()
     
+    def _decodeReport(self, logEntry, key, value):
+        return self._reportParser.parseJsonDict(value)
+    
+    def _shareKeyName(self, keyName):
+        """
+        Returns an equal key name string that is reused for all log entries (saves memory when many log entries
+        are loaded).
+        """
+        sharedKeyName = self._keyNames.get(keyName)
+        if sharedKeyName is not None:
+            return sharedKeyName
+        if len(self._keyNames) < defaults.maxSharedKeyNames:
+            self._keyNames[keyName] = keyName
+        return keyName
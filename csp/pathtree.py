@@ -0,0 +1,106 @@
+'''
+A 'PathRadixTree' maps the paths of source expressions to values. Paths ending in '/' match all
+paths that begin with them, other paths only match themselves, as in CSP source expressions. All
+values whose path matches a given path can be found in one descent of the tree.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+
+class PathRadixTree(object):
+    """
+    Radix tree (compressed trie) of source expression paths.
+    """
+
+    def __init__(self):
+        """
+        Creates a new, empty PathRadixTree.
+        """
+        self._root = _PathRadixTreeNode()
+        self._size = 0
+
+    def add(self, path, value):
+        """
+        Registers 'value' for the given 'path' (a non-empty unicode string). If 'path' ends with '/', the
+        value will match all paths beginning with 'path', otherwise only 'path' itself.
+        """
+        node = self._root
+        pos = 0
+        while pos < len(path):
+            edge = node.edges.get(path[pos])
+            if edge is None:
+                child = _PathRadixTreeNode()
+                node.edges[path[pos]] = (path[pos:], child)
+                node = child
+                break
+            label, child = edge
+            common = self._commonPrefixLength(label, path, pos)
+            if common < len(label):
+                # split edge at the end of the common prefix
+                middle = _PathRadixTreeNode()
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[path[pos]] = (label[:common], middle)
+                child = middle
+            node = child
+            pos += common
+        if path[-1:] == '/':
+            if node.prefixValues is None:
+                node.prefixValues = []
+            node.prefixValues.append(value)
+        else:
+            if node.exactValues is None:
+                node.exactValues = []
+            node.exactValues.append(value)
+        self._size += 1
+
+    def lookup(self, path):
+        """
+        Returns a list of all values whose path matches 'path': values registered for a path ending in '/'
+        that 'path' begins with, and values registered for exactly 'path'. The list is empty if there are
+        no such values.
+        """
+        values = []
+        node = self._root
+        pos = 0
+        while True:
+            if node.prefixValues is not None:
+                values.extend(node.prefixValues)
+            if pos == len(path):
+                if node.exactValues is not None:
+                    values.extend(node.exactValues)
+                return values
+            edge = node.edges.get(path[pos])
+            if edge is None:
+                return values
+            label, child = edge
+            if not path.startswith(label, pos):
+                return values
+            node = child
+            pos += len(label)
+
+    def __len__(self):
+        """
+        Returns the number of values stored in this PathRadixTree.
+        """
+        return self._size
+
+    def _commonPrefixLength(self, label, path, pos):
+        """
+        Returns the length of the common prefix of 'label' and 'path' starting at position 'pos'.
+        """
+        length = 0
+        maxLength = min(len(label), len(path) - pos)
+        while length < maxLength and label[length] == path[pos + length]:
+            length += 1
+        return length
+
+
+class _PathRadixTreeNode(object):
+    """
+    Internal node of a PathRadixTree.
+    """
+
+    def __init__(self):
+        self.edges = {} # first character of label -> (label, _PathRadixTreeNode)
+        self.prefixValues = None
+        self.exactValues = None
@@ -0,0 +1,215 @@
+'''
+'PersistentParseCache' stores parsed Policies and Directives in an SQLite database file, so that policy and
+directive strings parsed in one run do not need to be parsed again in later runs. Entries are keyed by the
+configuration of the parser (see PolicyParser.getConfigKey() and DirectiveParser.getConfigKey()) and the
+parsed string. Objects are stored in a compact serialised form (nested tuples of strings, encoded with
+marshal). The database is opened only when the cache is first used, and all entries for a parser
+configuration are loaded at once.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import marshal
+import sqlite3
+import time
+from directive import Directive
+from policy import Policy
+from sourceexpression import SourceExpression, SelfSourceExpression, URISourceExpression
+import defaults
+
+
+class PersistentParseCache(object):
+    """
+    Size-bounded persistent cache of parsed Policies and Directives. Can be shared by several PolicyParsers and
+    DirectiveParsers (with the same or different configurations). Not thread-safe.
+    """
+
+    formatVersion = 2 # stored in the database; entries written with another version are discarded
+
+    def __init__(self, filename, maxSize=defaults.persistentCacheSize, flushSize=defaults.persistentCacheFlushSize):
+        """
+        Creates a new PersistentParseCache backed by the SQLite database 'filename' (created if it does not exist).
+        At most 'maxSize' entries are kept in the database; when more entries are added, the least recently used
+        ones are evicted. New entries are written to the database in batches of 'flushSize' entries (and when
+        flush() or close() is called).
+        """
+        self._filename = filename
+        self._maxSize = maxSize
+        self._flushSize = flushSize
+        self._connection = None
+        self._entries = {} # config key -> {source string -> serialised object}
+        self._pending = [] # new (config key, source string, serialised object) not yet written
+        self._used = set() # (config key, source string) of entries read since the last flush
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, configKey, string):
+        """
+        Returns the Policy or Directive parsed from 'string' by a parser with the configuration 'configKey',
+        or None if it is not in the cache.
+        """
+        source = _sourceKey(string)
+        data = self._getEntries(configKey).get(source)
+        if data is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._used.add((configKey, source))
+        return _decode(marshal.loads(data))
+
+    def put(self, configKey, string, obj):
+        """
+        Stores the Policy or Directive 'obj' parsed from 'string' by a parser with the configuration 'configKey'.
+        """
+        source = _sourceKey(string)
+        data = marshal.dumps(_encode(obj))
+        self._getEntries(configKey)[source] = data
+        self._pending.append((configKey, source, data))
+        if len(self._pending) >= self._flushSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes new entries and the usage times of cached entries to the database, and evicts the least recently
+        used entries if the database contains more than the maximum number of entries.
+        """
+        if self._connection is None or (len(self._pending) == 0 and len(self._used) == 0):
+            return
+        now = int(time.time())
+        with self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO entries (config, source, value, lastUsed) "
+                                         + "VALUES (?, ?, ?, ?)",
+                                         [(configKey, buffer(source), buffer(data), now)
+                                          for (configKey, source, data) in self._pending])
+            self._connection.executemany("UPDATE entries SET lastUsed = ? WHERE config = ? AND source = ?",
+                                         [(now, configKey, buffer(source)) for (configKey, source) in self._used])
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if count > self._maxSize:
+                self._connection.execute("DELETE FROM entries WHERE rowid IN "
+                                         + "(SELECT rowid FROM entries ORDER BY lastUsed LIMIT ?)",
+                                         (count - self._maxSize,))
+        self._pending = []
+        self._used = set()
+
+    def close(self):
+        """
+        Flushes and closes the database. The cache can still be used afterwards (the database will be reopened).
+        """
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+            self._entries = {}
+
+    def getHits(self):
+        """Returns the number of lookups that found an entry."""
+        return self._hits
+
+    def getMisses(self):
+        """Returns the number of lookups that did not find an entry."""
+        return self._misses
+
+    def __getstate__(self):
+        # only the configuration (for example, to pass the cache to worker processes)
+        return (self._filename, self._maxSize, self._flushSize)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _getEntries(self, configKey):
+        """
+        Returns the dictionary with the entries for 'configKey', which are loaded from the database on first use.
+        """
+        entries = self._entries.get(configKey)
+        if entries is None:
+            if self._connection is None:
+                self._open()
+            rows = self._connection.execute("SELECT source, value FROM entries WHERE config = ?", (configKey,))
+            entries = dict((str(source), str(value)) for (source, value) in rows)
+            self._entries[configKey] = entries
+        return entries
+
+    def _open(self):
+        self._connection = sqlite3.connect(self._filename, timeout=60)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (version INTEGER)")
+            row = self._connection.execute("SELECT version FROM meta").fetchone()
+            if row is None or row[0] != PersistentParseCache.formatVersion:
+                self._connection.execute("DROP TABLE IF EXISTS entries")
+                self._connection.execute("DELETE FROM meta")
+                self._connection.execute("INSERT INTO meta (version) VALUES (?)", (PersistentParseCache.formatVersion,))
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries (config TEXT, source BLOB, value BLOB, "
+                                     + "lastUsed INTEGER, PRIMARY KEY (config, source))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entriesLastUsed ON entries (lastUsed)")
+
+
+def _sourceKey(string):
+    if isinstance(string, unicode):
+        return string.encode("utf-8")
+    return string
+
+
+def _encode(obj):
+    """
+    Returns a serialisable representation of the Policy or Directive 'obj' made of tuples and strings.
+    """
+    if type(obj) == Policy:
+        if obj == Policy.INVALID():
+            return ("P", None)
+        return ("P", tuple(_encodeDirective(directive) for directive in obj.getDirectives()))
+    return ("D", _encodeDirective(obj))
+
+
+def _encodeDirective(directive):
+    if not directive.isRegularDirective():
+        # special singletons are stored by name (they would otherwise be decoded as regular directives)
+        for (name, singleton) in _specialDirectives():
+            if directive == singleton:
+                return name
+    return (directive.getType(), tuple(_encodeSourceExpression(srcExpr)
+                                       for srcExpr in directive.getWhitelistedSourceExpressions()))
+
+
+def _encodeSourceExpression(srcExpr):
+    if type(srcExpr) == URISourceExpression:
+        return (srcExpr.getScheme(), srcExpr.getHost(), srcExpr.getPort(), srcExpr.getPath())
+    return srcExpr.getType()
+
+
+def _decode((kind, data)):
+    """
+    Returns the Policy or Directive represented by the result of _encode(.).
+    """
+    if kind == "P":
+        if data is None:
+            return Policy.INVALID()
+        return Policy(map(_decodeDirective, data))
+    return _decodeDirective(data)
+
+
+def _decodeDirective(data):
+    if type(data) == str:
+        return dict(_specialDirectives())[data]
+    return Directive(data[0], map(_decodeSourceExpression, data[1]))
+
+
+def _specialDirectives():
+    """
+    Returns a list of (name, Directive) tuples with the special (non-regular) Directive singletons.
+    """
+    return [("invalid", Directive.INVALID()),
+            ("inline-style-base-restriction", Directive.INLINE_STYLE_BASE_RESTRICTION()),
+            ("inline-script-base-restriction", Directive.INLINE_SCRIPT_BASE_RESTRICTION()),
+            ("eval-script-base-restriction", Directive.EVAL_SCRIPT_BASE_RESTRICTION())]
+
+
+def _decodeSourceExpression(data):
+    if type(data) == tuple:
+        return URISourceExpression(*data)
+    elif data == "self":
+        return SelfSourceExpression.SELF()
+    elif data == "unsafe-inline":
+        return SourceExpression.UNSAFE_INLINE()
+    elif data == "unsafe-eval":
+        return SourceExpression.UNSAFE_EVAL()
+    return SourceExpression(data)
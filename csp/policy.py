@@ -6,6 +6,7 @@ Policies can be parsed from strings using PolicyParser.
 '''
 
 from directive import Directive, DirectiveParser
+from cache import LRUCache
 from sourceexpression import URISourceExpression
 import defaults
 
@@ -15,6 +16,8 @@ class Policy(object):
     A CSP policy that consists of one or more directives. Immutable
     """
     
+    __slots__ = ("_hash", "_str", "_compiled", "_isInvalid", "_directives", "__weakref__")
+    
     _invalid = None
     _defaultSrcDirectiveIfNotSpecified = Directive("default-src", (URISourceExpression(None, "*", None, None),))
     
@@ -27,6 +30,7 @@ class Policy(object):
         """
         self._hash = None
         self._str = None
+        self._compiled = None
         self._isInvalid = False
         # eliminate directives with duplicate type and irregular directives
         onlyRegular = filter(lambda x: x.isRegularDirective(), directives)
@@ -120,25 +124,59 @@ class Policy(object):
         scheme-to-port-number look up in 'schemePortMappings' for both URIs (otherwise, False is returned).
         For details about the implementation, see http://www.w3.org/TR/2014/WD-CSP11-20140211/#matching
         """
-        if self == Policy.INVALID():
+        direct = self._getMatchingDirective(resourceType, defaultSrcTypes)
+        if direct is None:
             return False
+        return direct.matches(resourceURI, protectedDocumentURI, schemePortMappings)
+
+    def matchesMany(self, resourceURIs, resourceType, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings,
+                    defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+        """
+        Returns a list with one boolean for each URI in the iterable 'resourceURIs' (in the same order) that
+        indicates whether the URI is allowed under this Policy. The result is the same as calling matches(.)
+        for each URI, but the Directive used for matching is looked up only once, and checks that depend
+        only on 'protectedDocumentURI' are done once for all URIs.
+        """
+        resourceURIs = list(resourceURIs)
+        direct = self._getMatchingDirective(resourceType, defaultSrcTypes)
+        if direct is None:
+            return [False] * len(resourceURIs)
+        return direct.matchesMany(resourceURIs, protectedDocumentURI, schemePortMappings)
+
+    def _getMatchingDirective(self, resourceType, defaultSrcTypes):
+        """
+        Returns the Directive that is used to match resources of 'resourceType', or None if no
+        resource of that type is allowed under this Policy.
+        """
+        if self == Policy.INVALID():
+            return None
         
         # if directive of resource type is available, use it for matching
         resourceType = resourceType.lower()
         for direct in self._directives:
             if direct.getType() == resourceType:
-                return direct.matches(resourceURI, protectedDocumentURI, schemePortMappings)
+                return direct
         
         # check if type of resource admits matching with default-src per CSP 1.1 draft
         if resourceType not in defaultSrcTypes:
-            return False
+            return None
                
         # match with default-src
         # if no default directive is available, assume default-src '*' according to # http://www.w3.org/TR/2014/WD-CSP11-20140211/#default-src
         for direct in self._directives:
             if direct.getType() == "default-src":
-                return direct.matches(resourceURI, protectedDocumentURI, schemePortMappings)
-        return Policy._defaultSrcDirectiveIfNotSpecified.matches(resourceURI, protectedDocumentURI, schemePortMappings)
+                return direct
+        return Policy._defaultSrcDirectiveIfNotSpecified
+
+    def compile(self):
+        """
+        Returns a CompiledPolicy for this Policy. The CompiledPolicy gives the same matching results as this
+        Policy, but looks up the Directive for a resource type in a map and uses compiled Directives (see
+        Directive.compile()). The result is computed once and then cached.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledPolicy(self)
+        return self._compiled
         
     def withoutPaths(self, schemeOnly=defaults.schemeOnly):
         """
@@ -156,11 +194,13 @@ class Policy(object):
             pathsRemoved.append(direct.withoutPaths(schemeOnly))
         return Policy(pathsRemoved)
     
-    def asBasicPolicies(self):
+    def asBasicPolicies(self, internPool=None):
         """
         Returns a set of Policies that contain each exactly one Directive with exactly one SourceExpression.
         'Decomposes' this Policy into basic Policies and Directives.
         Returns the empty set if this policy is invalid.
+        
+        'internPool': if not None, an InternPool used to return shared instances of the basic Policies.
         """
         if self == Policy.INVALID():
             return set([])
@@ -169,20 +209,23 @@ class Policy(object):
         policies = set([])
         for direct in self._directives:
             for bDirect in direct.asBasicDirectives():
-                policies.add(Policy((bDirect,)))
+                if internPool is None:
+                    policies.add(Policy((bDirect,)))
+                else:
+                    policies.add(internPool.intern(Policy((bDirect,))))
         return policies
     
-    def compareTo(self, otherPolicy):
+    def compareTo(self, otherPolicy, internPool=None):
         """
         Compares this Policy to 'otherPolicy' and returns three sets of basic Policies (that is, Policies with
         exactly one Directive and one SourceExpression): (common basic policies, basic policies only in 'self',
         basic policies only in 'otherPolicy'). If this Policy or 'otherPolicy' is INVALID(), returns three
-        empty sets.
+        empty sets. 'internPool' is passed on to asBasicPolicies(.).
         """
         if self == Policy.INVALID() or otherPolicy == Policy.INVALID():
             return (set([]), set([]), set([]))
-        selfBasic = self.asBasicPolicies()
-        otherBasic = otherPolicy.asBasicPolicies()
+        selfBasic = self.asBasicPolicies(internPool)
+        otherBasic = otherPolicy.asBasicPolicies(internPool)
         common = selfBasic & otherBasic
         onlySelf = selfBasic - common
         onlyOther = otherBasic - common
@@ -245,6 +288,8 @@ class Policy(object):
         Returns whether the two policies have the elements. This is NOT the same as checking whether
         they have the same effect.
         """
+        if self is other:
+            return True
         if type(other) != Policy:
             return False
         return (self._isInvalid == other._isInvalid
@@ -260,6 +305,77 @@ class Policy(object):
         return self._hash
     
     
+class CompiledPolicy(object):
+    """
+    Read-only matcher for a Policy, obtained by calling Policy.compile(). Contains a map from directive
+    type to the CompiledDirective of that type. Immutable.
+    """
+
+    def __init__(self, policy):
+        """
+        Creates a new CompiledPolicy from the given 'policy'. (Use Policy.compile() instead of calling
+        this constructor directly.)
+        """
+        self._policy = policy
+        self._isInvalid = policy == Policy.INVALID()
+        self._directives = dict(map(lambda x: (x.getType(), x.compile()), policy.getDirectives()))
+        if "default-src" in self._directives:
+            self._defaultDirective = self._directives["default-src"]
+        else:
+            self._defaultDirective = Policy._defaultSrcDirectiveIfNotSpecified.compile()
+
+    def getPolicy(self):
+        """
+        Returns the Policy that was compiled into this CompiledPolicy.
+        """
+        return self._policy
+
+    def getDirective(self, directiveType):
+        """
+        Returns the CompiledDirective of the given 'directiveType' contained in this CompiledPolicy, or None.
+        """
+        return self._directives.get(directiveType.lower())
+
+    def matches(self, resourceURI, resourceType, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings,
+                    defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+        """
+        Returns whether the given resourceURI is allowed under the compiled Policy. The parameters and
+        the result are the same as for Policy.matches(.).
+        """
+        directive = self._getMatchingDirective(resourceType, defaultSrcTypes)
+        if directive is None:
+            return False
+        return directive.matches(resourceURI, protectedDocumentURI, schemePortMappings)
+
+    def matchesMany(self, resourceURIs, resourceType, protectedDocumentURI, schemePortMappings=defaults.schemePortMappings,
+                    defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+        """
+        Returns a list with one boolean for each URI in the iterable 'resourceURIs' (in the same order) that
+        indicates whether the URI is allowed under the compiled Policy. The parameters and the result are the
+        same as for Policy.matchesMany(.).
+        """
+        resourceURIs = list(resourceURIs)
+        directive = self._getMatchingDirective(resourceType, defaultSrcTypes)
+        if directive is None:
+            return [False] * len(resourceURIs)
+        return directive.matchesMany(resourceURIs, protectedDocumentURI, schemePortMappings)
+
+    def _getMatchingDirective(self, resourceType, defaultSrcTypes):
+        """
+        Returns the CompiledDirective that is used to match resources of 'resourceType', or None if no
+        resource of that type is allowed under the compiled Policy.
+        """
+        if self._isInvalid:
+            return None
+        resourceType = resourceType.lower()
+        directive = self._directives.get(resourceType)
+        if directive is None:
+            if resourceType not in defaultSrcTypes:
+                return None
+            directive = self._defaultDirective
+        return directive
+    
+    
 class PolicyParser(object):
     """
     Pre-configured object that parses strings into Policies.
@@ -272,9 +388,13 @@ class PolicyParser(object):
                  knownSchemes=defaults.supportedSchemes,
                  strict=True,
                  expandDefaultSrc=True,
-                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes,
+                 cacheSize=defaults.policyCacheSize,
+                 directiveCacheSize=defaults.directiveCacheSize,
+                 internPool=None,
+                 persistentCache=None):
         """
-        Creates a new DirectiveParser object configured with the following parameters:
+        Creates a new PolicyParser object configured with the following parameters:
         'typeTranslations': For parsing directives. A map from directive types to another directive type
         (all lowercase). Used to convert old names to the new name.
         'allowedTypes': For parsing directives. A list of directive types that are allowed. All lowercase.
@@ -292,10 +412,22 @@ class PolicyParser(object):
         That is, if an elementary type directive already exists in the policy, it will NOT be replaced. 
         (This is the behaviour for interpreting policies according to the CSP 1.1 draft.)
         'defaultSrcTypes': A list of (lowercase) directive types to be used with 'expandDefaultSrc'.
+        'cacheSize': the maximum number of parsed policies that are cached (by policy string), so that repeated
+        policy strings are parsed only once. 0 disables the cache.
+        'directiveCacheSize': the maximum number of parsed directives that are cached by the internal DirectiveParser.
+        'internPool': if not None, an InternPool used to return shared instances of equal Policies, Directives and
+        SourceExpressions.
+        'persistentCache': if not None, a PersistentParseCache used to look up policies (and directives) parsed in
+        earlier runs (when they are not in the in-memory cache) and to store newly parsed ones.
         """
         self._allowedTypes = allowedTypes
         self._ignoredTypes = ignoredTypes
-        self._directiveParser = DirectiveParser(typeTranslations, allowedTypes, knownSchemes, strict)
+        self._directiveParser = DirectiveParser(typeTranslations, allowedTypes, knownSchemes, strict,
+                                                directiveCacheSize, internPool, persistentCache)
+        self._cache = LRUCache(cacheSize) # policy string -> Policy
+        self._internPool = internPool
+        self._persistentCache = persistentCache
+        self._configKey = None
         self._strict = strict
         self._expandDefaultSrc = expandDefaultSrc
         self._defaultSrcTypes = defaultSrcTypes
@@ -308,7 +440,48 @@ class PolicyParser(object):
 
         Depending on the configuration of this PolicyParser object, may perform internal translation of the type 
         and filter certain directive types.
+        
+        Policies are immutable, so the same Policy object may be returned when the same string is parsed again.
+        """
+        policy = self._cache.get(stringPolicy)
+        if policy is None:
+            if self._persistentCache is not None:
+                policy = self._persistentCache.get(self.getConfigKey(), stringPolicy)
+                if policy is None:
+                    policy = self._parse(stringPolicy)
+                    self._persistentCache.put(self.getConfigKey(), stringPolicy, policy)
+            else:
+                policy = self._parse(stringPolicy)
+            if self._internPool is not None:
+                policy = self._internPool.intern(policy)
+            self._cache.put(stringPolicy, policy)
+        return policy
+    
+    def getCache(self):
+        """
+        Returns the LRUCache of parsed policies (for example, to query the hit, miss and eviction counters).
         """
+        return self._cache
+    
+    def getDirectiveParser(self):
+        """
+        Returns the DirectiveParser used to parse the directives of policies.
+        """
+        return self._directiveParser
+    
+    def getConfigKey(self):
+        """
+        Returns a string that is equal for two PolicyParsers if they are configured identically (and thus return
+        equal Policies for the same string), also across runs. The key is computed only once; the configuration
+        should not be changed afterwards.
+        """
+        if self._configKey is None:
+            self._configKey = repr((type(self).__name__, self._directiveParser.getConfigKey(),
+                                    sorted(self._ignoredTypes), self._strict, self._expandDefaultSrc,
+                                    sorted(self._defaultSrcTypes)))
+        return self._configKey
+    
+    def _parse(self, stringPolicy):
         directiveStrings = stringPolicy.split(";")
         directives = {} # type -> Directive
         for directiveString in directiveStrings:
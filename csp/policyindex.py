@@ -0,0 +1,157 @@
+'''
+A 'PolicyIndex' contains many Policies (for example, one Policy for each web site) and finds all
+Policies that allow a given resource. It is an inverted index from schemes, host names and wildcard
+host names to the Policies that whitelist them. Only the Policies selected by the index are matched
+exactly (using the same semantics as Policy.matches(.)).
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+from hosttrie import HostTrie
+from policy import Policy
+from uri import URI
+import defaults
+
+
+class PolicyIndex(object):
+    """
+    Inverted index of Policies, each identified by a policy ID and associated with the URI of the
+    protected document (or web site) to which the Policy applies.
+    """
+
+    def __init__(self, schemePortMappings=defaults.schemePortMappings,
+                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+        """
+        Creates a new, empty PolicyIndex. 'schemePortMappings' and 'defaultSrcTypes' are used when matching
+        resources with the indexed Policies (see Policy.matches(.) for details).
+        """
+        self._schemePortMappings = schemePortMappings
+        self._defaultSrcTypes = defaultSrcTypes
+        self._policies = {} # policy ID -> (CompiledPolicy, protected document URI)
+        self._directiveIndexes = {} # directive type -> _DirectiveIndex
+        self._policiesWithDirectiveType = {} # directive type -> set of policy IDs
+
+    def add(self, policyId, policy, protectedDocumentURI):
+        """
+        Adds 'policy' to this index. 'policyId' is a hashable identifier that must be different from the IDs
+        of all Policies added before. 'protectedDocumentURI' is the URI of the document protected by 'policy',
+        which is used for matching 'self' source expressions and scheme-less source expressions.
+        """
+        if policyId in self._policies:
+            raise ValueError("Duplicate policy ID %s" % repr(policyId))
+        self._policies[policyId] = (policy.compile(), protectedDocumentURI)
+        if policy == Policy.INVALID():
+            return # matches nothing
+        hasDefaultDirective = False
+        for directive in policy.getDirectives():
+            directiveType = directive.getType()
+            self._policiesWithDirectiveType.setdefault(directiveType, set([])).add(policyId)
+            self._getDirectiveIndex(directiveType).addDirective(policyId, directive, protectedDocumentURI)
+            if directiveType == "default-src":
+                hasDefaultDirective = True
+        if not hasDefaultDirective:
+            # Policy.matches(.) assumes default-src * if the policy has no default directive
+            self._getDirectiveIndex("default-src").addMatchesAllRegularURIs(policyId)
+
+    def getPolicy(self, policyId):
+        """
+        Returns the Policy with the given 'policyId' (raises KeyError if there is no such Policy).
+        """
+        return self._policies[policyId][0].getPolicy()
+
+    def __len__(self):
+        """
+        Returns the number of Policies in this index.
+        """
+        return len(self._policies)
+
+    def candidatePolicies(self, resourceURI, resourceType):
+        """
+        Returns a set with the IDs of all Policies that might allow 'resourceURI' of the type 'resourceType',
+        as selected by the index (without exact matching). This is a superset of matchingPolicies(.).
+        """
+        resourceType = resourceType.lower()
+        candidates = set([])
+        if resourceType in self._directiveIndexes:
+            candidates |= self._directiveIndexes[resourceType].candidates(resourceURI)
+        if resourceType in self._defaultSrcTypes and "default-src" in self._directiveIndexes:
+            defaultCandidates = self._directiveIndexes["default-src"].candidates(resourceURI)
+            defaultCandidates -= self._policiesWithDirectiveType.get(resourceType, set([]))
+            candidates |= defaultCandidates
+        return candidates
+
+    def matchingPolicies(self, resourceURI, resourceType):
+        """
+        Returns a set with the IDs of all Policies in this index that allow 'resourceURI' of the type
+        'resourceType' in the context of their protected document. The result is the same as calling
+        Policy.matches(.) for each Policy in the index.
+        """
+        matching = set([])
+        for policyId in self.candidatePolicies(resourceURI, resourceType):
+            compiledPolicy, protectedDocumentURI = self._policies[policyId]
+            if compiledPolicy.matches(resourceURI, resourceType, protectedDocumentURI, self._schemePortMappings,
+                                      self._defaultSrcTypes):
+                matching.add(policyId)
+        return matching
+
+    def _getDirectiveIndex(self, directiveType):
+        index = self._directiveIndexes.get(directiveType)
+        if index is None:
+            index = _DirectiveIndex()
+            self._directiveIndexes[directiveType] = index
+        return index
+
+
+class _DirectiveIndex(object):
+    """
+    Internal helper for PolicyIndex: inverted index of the Directives of one type.
+    """
+
+    def __init__(self):
+        self._matchAnyRegularURI = set([]) # IDs of policies that might match any regular URI
+        self._matchSpecialURIs = set([]) # IDs of policies with 'unsafe-inline' or 'unsafe-eval'
+        self._schemes = {} # scheme -> set of policy IDs
+        self._hosts = HostTrie() # host or "*." + host -> policy IDs
+
+    def addDirective(self, policyId, directive, protectedDocumentURI):
+        for srcExpr in directive.getWhitelistedSourceExpressions():
+            if srcExpr.getType() == "self":
+                # 'self' matches only the host of the protected document
+                if protectedDocumentURI.isRegularURI() and protectedDocumentURI.getHost() is not None:
+                    self._hosts.add(protectedDocumentURI.getHost().lower(), policyId)
+                else:
+                    self._matchAnyRegularURI.add(policyId)
+            elif srcExpr.getType() in ("unsafe-inline", "unsafe-eval"):
+                self._matchSpecialURIs.add(policyId)
+            elif srcExpr.getType() != "uri":
+                self._matchAnyRegularURI.add(policyId)
+                self._matchSpecialURIs.add(policyId)
+            else:
+                scheme = srcExpr.getScheme()
+                host = srcExpr.getHost()
+                if scheme is not None and host is None and srcExpr.getPort() is None and srcExpr.getPath() is None:
+                    self._schemes.setdefault(scheme, set([])).add(policyId)
+                elif host is not None and (host[0] != "*" or (host[:2] == "*." and len(host) > 2)):
+                    self._hosts.add(host, policyId)
+                else:
+                    self._matchAnyRegularURI.add(policyId)
+
+    def addMatchesAllRegularURIs(self, policyId):
+        self._matchAnyRegularURI.add(policyId)
+
+    def candidates(self, resourceURI):
+        """
+        Returns a new set with the IDs of all policies that might match 'resourceURI'.
+        """
+        if not resourceURI.isRegularURI():
+            if resourceURI == URI.INLINE() or resourceURI == URI.EVAL():
+                return set(self._matchSpecialURIs)
+            return set([])
+        candidates = set(self._matchAnyRegularURI)
+        scheme = resourceURI.getScheme()
+        if scheme is not None:
+            candidates.update(self._schemes.get(scheme.lower(), ()))
+        host = resourceURI.getHost()
+        if host is not None:
+            candidates.update(self._hosts.lookup(host.lower()))
+        return candidates
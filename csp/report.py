@@ -33,26 +33,40 @@ from uri import URIParser, URI
 from reportjsonencoder import ReportJSONEncoder
 import defaults
 
-class Report(collections.Mapping):
+class Report(object):
     """
     A CSP violation report, internally implemented similar to a dictionary, with certain keys returning objects
     instead of strings (such as 'original-policy', 'violated-directive').
     Immutable.
     """
     
+    # Python 2's collections.Mapping has no __slots__, so Report is registered as a virtual subclass of
+    # Mapping (see below) and implements the Mapping methods itself.
+    __slots__ = ("_hash", "_str", "_repData", "_lazyKeys", "_decoder")
+    
     _invalid = None
     
-    def __init__(self, dataDict):
+    def __init__(self, dataDict, lazyKeys=None, decoder=None):
         """
         Generates a new CSP violation report from the given data.
         
         'dataDict' is a dictionary with the field names of a CSP violation report as keys. The corresponding values
         can be either original or an higher-abstraction object (such as URI, Directive, Policy) and MUST all be
         immutable.
+        
+        'lazyKeys': an optional iterable of keys whose values in 'dataDict' have not been decoded yet (lazy parsing).
+        Each of these values is decoded when it is accessed for the first time, by calling 'decoder' with this
+        Report, the key and the raw value. The result replaces the raw value.
         """
         self._hash = None
         self._str = None
         self._repData = dict(dataDict)
+        if lazyKeys:
+            self._lazyKeys = set(lazyKeys)
+            self._decoder = decoder
+        else:
+            self._lazyKeys = None
+            self._decoder = None
         
     @staticmethod
     def INVALID():
@@ -111,22 +125,89 @@ class Report(collections.Mapping):
         return len(self._repData)
     
     def __getitem__(self, key):
+        if self._lazyKeys is not None and key in self._lazyKeys:
+            self._decode(key)
         return self._repData[key]
     
+    def __contains__(self, key):
+        return key in self._repData
+    
+    def get(self, key, default=None):
+        if key in self._repData:
+            return self[key]
+        return default
+    
+    def keys(self):
+        return self._repData.keys()
+    
+    def values(self):
+        self._decodeAll()
+        return self._repData.values()
+    
+    def items(self):
+        self._decodeAll()
+        return self._repData.items()
+    
+    def iterkeys(self):
+        return self._repData.iterkeys()
+    
+    def itervalues(self):
+        self._decodeAll()
+        return self._repData.itervalues()
+    
+    def iteritems(self):
+        self._decodeAll()
+        return self._repData.iteritems()
+    
+    def _decode(self, key):
+        """
+        Decodes the lazily parsed value of 'key' (which must be in self._lazyKeys).
+        """
+        self._lazyKeys.discard(key)
+        decoder = self._decoder
+        if len(self._lazyKeys) == 0:
+            self._lazyKeys = None
+            self._decoder = None
+        self._repData[key] = decoder(self, key, self._repData[key])
+    
+    def _decodeAll(self):
+        """
+        Decodes all lazily parsed values.
+        """
+        while self._lazyKeys is not None:
+            self._decode(iter(self._lazyKeys).next())
+    
+    def __getstate__(self):
+        self._decodeAll()
+        return self._repData
+    
+    def __setstate__(self, state):
+        self._hash = None
+        self._str = None
+        self._repData = state
+        self._lazyKeys = None
+        self._decoder = None
+    
     def __eq__(self, other):
         """
         Returns if this report is equal to another report. This is implemented component-wise.
         """
         if type(other) != Report:
             return False
+        self._decodeAll()
+        other._decodeAll()
         return self._repData == other._repData
     
+    def __ne__(self, other):
+        return not self == other
+    
     def __hash__(self):
         """
         Returns a hash value for this object that is guaranteed to be the same for two objects
         that are equal (the opposite is not necessarily true).
         """
         if self._hash is None:
+            self._decodeAll()
             self._hash = reduce(lambda hashSoFar, pair: hashSoFar ^ hash(pair), self._repData.iteritems(), 0)
         return self._hash
     
@@ -144,9 +225,12 @@ class Report(collections.Mapping):
             if self == Report.INVALID():
                 self._str = "[invalid]"
             else:
+                self._decodeAll()
                 self._str = json.dumps(self._repData, sort_keys=True, cls=ReportJSONEncoder)
         return self._str
     
+collections.Mapping.register(Report)
+    
 
 class ReportParser(object):
     """
@@ -170,7 +254,14 @@ class ReportParser(object):
                  allowedDirectiveTypes=defaults.allowedDirectiveTypes,
                  ignoredDirectiveTypes=defaults.ignoredDirectiveTypes,
                  expandDefaultSrc=False,
-                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes):
+                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes,
+                 uriCache=None,
+                 policyCacheSize=defaults.policyCacheSize,
+                 directiveCacheSize=defaults.directiveCacheSize,
+                 internPool=None,
+                 lazy=False,
+                 fields=None,
+                 persistentCache=None):
         """
         Creates a new ReportParser object configured with the following parameters:
         
@@ -218,6 +309,27 @@ class ReportParser(object):
                             (See PolicyParser for details.)
         'defaultSrcTypes': [for parsed policies] when "default-src" is expanded, the elementary directive types
                             that will be added to replace the default policy. (See PolicyParser for details.)
+        'uriCache': [for parsed URIs] a URIParseCache used to memoize parsed URIs, which may be shared with other
+                            ReportParsers and LogEntryParsers (None to parse each URI from scratch).
+        'policyCacheSize': [for parsed policies] the maximum number of parsed policies cached by policy string,
+                            so that repeated policies are parsed only once. (See PolicyParser for details.)
+        'directiveCacheSize': [for parsed directives and policies] the maximum number of parsed directives cached
+                            by directive string. (See DirectiveParser for details.)
+        'internPool': [for parsed directives and policies] an InternPool used to share equal Directives and
+                            Policies between reports (None to disable interning). (See InternPool for details.)
+        'lazy': if set to True, only the 'requiredKeys' and "document-uri" are parsed immediately. The values of
+                            the other 'uriKeys', 'directiveKeys' and 'policyKeys' are kept as strings and parsed
+                            when they are accessed for the first time. This is faster when many reports are
+                            discarded after looking at a few fields only. Since parsing errors in these fields are
+                            detected only later, they do not cause the Report to become Report.INVALID() and are
+                            not skipped; the field's value becomes URI.INVALID()/Directive.INVALID()/
+                            Policy.INVALID() instead.
+        'fields': an iterable of the key (entry) names to be kept in parsed reports (after key name replacement),
+                            or None to keep all keys. Other keys are neither parsed nor stored, which saves
+                            time and memory when a job needs only a few fields (for example, to skip the
+                            "original-policy"). Only the 'requiredKeys' that are in 'fields' are checked.
+        'persistentCache': [for parsed directives and policies] a PersistentParseCache that keeps parsed Directives
+                            and Policies across runs (None to disable). (See PersistentParseCache for details.)
         """
         self._strict = strict
         self._uriKeys = uriKeys
@@ -225,13 +337,35 @@ class ReportParser(object):
         self._policyKeys = policyKeys
         self._keyNameReplacements = keyNameReplacements
         self._requiredKeys = requiredKeys
+        self._uriCache = uriCache
+        self._keyNames = {} # original key name -> (shared) key name after replacement
+        self._lazy = lazy
+        if fields is None:
+            self._fields = None
+        else:
+            self._fields = frozenset(fields)
+            self._requiredKeys = tuple(key for key in requiredKeys if key in self._fields)
         
         self._uriParser = URIParser(addSchemeToURIs, defaultURIScheme, addPortToURIs, defaultURIPort,
                                     schemePortMappings, portSchemeMappings, True)
         self._directiveParser = DirectiveParser(directiveTypeTranslations, allowedDirectiveTypes, 
-                                    schemePortMappings.keys(), strict)
+                                    schemePortMappings.keys(), strict, directiveCacheSize, internPool,
+                                    persistentCache)
         self._policyParser = PolicyParser(directiveTypeTranslations, allowedDirectiveTypes, ignoredDirectiveTypes, 
-                                    schemePortMappings.keys(), strict, expandDefaultSrc, defaultSrcTypes)
+                                    schemePortMappings.keys(), strict, expandDefaultSrc, defaultSrcTypes,
+                                    policyCacheSize, directiveCacheSize, internPool, persistentCache)
+    
+    def getDirectiveParser(self):
+        """
+        Returns the DirectiveParser used for 'directiveKeys' (for example, to query its cache counters).
+        """
+        return self._directiveParser
+    
+    def getPolicyParser(self):
+        """
+        Returns the PolicyParser used for 'policyKeys' (for example, to query its cache counters).
+        """
+        return self._policyParser
     
     def parseString(self, stringReport):
         """
@@ -262,17 +396,25 @@ class ReportParser(object):
         
         # replace names
         renamedReport = dict(map(lambda (key, val): (self._replaceName(key), val), jsonReport.iteritems()))
+        if self._fields is not None:
+            selectedReport = dict((key, val) for (key, val) in renamedReport.iteritems() if key in self._fields)
+        else:
+            selectedReport = renamedReport
                 
         # convert data in report
         convertedReport = {}
         deferredSelfURIs = set([]) # all key names that have URIs that are exactly 'self' (handle after parsing everything else)
-        for (key, value) in renamedReport.iteritems():
+        lazyKeys = [] # key names whose values are parsed on first access
+        for (key, value) in selectedReport.iteritems():
+            if self._lazy and self._isLazyKey(key, value):
+                lazyKeys.append(key)
+                convertedReport[key] = value
+                continue
             if key in self._uriKeys:
                 if value.lower().strip() == "self":
                     deferredSelfURIs.add(key)
                     continue
-                else:
-                    value = self._uriParser.parse(value)
+                value = self._parseURI(value)
             elif key in self._directiveKeys:
                 value = self._directiveParser.parse(value)
             elif key in self._policyKeys:
@@ -289,18 +431,55 @@ class ReportParser(object):
         for key in deferredSelfURIs:
             if "document-uri" in self._uriKeys and "document-uri" in convertedReport:
                 convertedReport[key] = convertedReport["document-uri"]
+            elif "document-uri" in self._uriKeys and "document-uri" in renamedReport \
+                    and "document-uri" not in selectedReport:
+                # document-uri was not selected for the report, but is needed to resolve 'self'
+                documentURI = self._parseURI(renamedReport["document-uri"])
+                if documentURI != URI.INVALID():
+                    convertedReport[key] = documentURI
+                elif self._strict:
+                    return Report.INVALID()
             elif self._strict:
                 return Report.INVALID()
             
         for requiredKey in self._requiredKeys:
             if not requiredKey in convertedReport:
                 return Report.INVALID()
+        if lazyKeys:
+            return Report(convertedReport, lazyKeys, self._decodeLazyField)
         return Report(convertedReport)
+    
+    def _isLazyKey(self, key, value):
+        # 'self' URIs are resolved immediately (cheap, and the document-uri might not be kept in the report)
+        if key in self._uriKeys:
+            return key != "document-uri" and key not in self._requiredKeys and value.lower().strip() != "self"
+        return key not in self._requiredKeys and (key in self._directiveKeys or key in self._policyKeys)
+    
+    def _parseURI(self, value):
+        if self._uriCache is not None:
+            return self._uriCache.parse(self._uriParser, value)
+        return self._uriParser.parse(value)
+    
+    def _decodeLazyField(self, report, key, value):
+        """
+        Parses the raw 'value' of the field 'key' in a lazily parsed 'report' (see parseJsonDict(.)).
+        """
+        if key in self._uriKeys:
+            return self._parseURI(value)
+        elif key in self._directiveKeys:
+            return self._directiveParser.parse(value)
+        else:
+            return self._policyParser.parse(value)
 
     def _replaceName(self, oldName):
-        oldName = oldName.lower()
-        if oldName in self._keyNameReplacements:
-            return self._keyNameReplacements[oldName]
-        else:
-            return oldName
+        # reuse the same key string objects for all reports (saves memory when many reports are loaded)
+        newName = self._keyNames.get(oldName)
+        if newName is not None:
+            return newName
+        newName = oldName.lower()
+        if newName in self._keyNameReplacements:
+            newName = self._keyNameReplacements[newName]
+        if len(self._keyNames) < defaults.maxSharedKeyNames:
+            self._keyNames[oldName] = newName
+        return newName
 
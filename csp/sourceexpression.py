@@ -46,6 +46,8 @@ class SourceExpression(object):
     Immutable.
     """
     
+    __slots__ = ("_hash", "_str", "_type", "__weakref__")
+    
     _unsafeInline = None
     _unsafeEval = None
     _invalid = None
@@ -122,6 +124,14 @@ class SourceExpression(object):
             return True
         return False
     
+    def _matchesWithDocumentScheme(self, resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+        """
+        Internal variant of matches(.) for matching many resource URIs against the same 'protectedDocumentURI'.
+        'protectedURIScheme' is the lowercase scheme of 'protectedDocumentURI' (or None), computed only once
+        by the caller.
+        """
+        return self.matches(resourceURI, protectedDocumentURI, schemePortMappings)
+    
     def __repr__(self):
         """
         Returns a full representation of this URI. Equivalent to __str__().
@@ -149,6 +159,8 @@ class SourceExpression(object):
         unsafe-eval types). 'uri' should be an URI object with escaped characters already
         decoded.
         """
+        if self is other:
+            return True
         if type(other) != SourceExpression:
             return False
         return other._type == self._type
@@ -170,6 +182,8 @@ class SelfSourceExpression(SourceExpression):
     or call the static singleton method SelfSourceExpression.SELF()).
     """
     
+    __slots__ = ()
+    
     _self = None
     
     def __init__(self):
@@ -250,6 +264,8 @@ class URISourceExpression(SourceExpression):
     SourceExpression for the "scheme:" and "host"-style expressions. Immutable.
     """
     
+    __slots__ = ("_scheme", "_host", "_port", "_path")
+    
     def __init__(self, scheme, host, port, path):
         """
         Constructs a new URISourceExpression (of the "scheme:" and "host" grammar types).
@@ -296,6 +312,15 @@ class URISourceExpression(SourceExpression):
         """
         See documentation of super class SourceExpression.matches(.).
         """
+        protectedURIScheme = protectedDocumentURI.getScheme()
+        if protectedURIScheme is not None:
+            protectedURIScheme = protectedURIScheme.lower()
+        return self._matchesWithDocumentScheme(resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings)
+
+    def _matchesWithDocumentScheme(self, resourceURI, protectedDocumentURI, protectedURIScheme, schemePortMappings):
+        """
+        See documentation of super class SourceExpression._matchesWithDocumentScheme(.).
+        """
         if not resourceURI.isRegularURI():
             return False
         
@@ -328,7 +353,6 @@ class URISourceExpression(SourceExpression):
         if self._scheme is not None and self._scheme != uriScheme:
             return False
 
-        protectedURIScheme = protectedDocumentURI.getScheme().lower()
         if self._scheme is None and protectedURIScheme == "http" and uriScheme not in ('http', 'https'):
             return False
         if self._scheme is None and protectedURIScheme != "http" and protectedURIScheme != uriScheme:
@@ -395,6 +419,8 @@ class URISourceExpression(SourceExpression):
         if both URISourceExpressions have the same effect (which could be the case when omitting port 
         numbers, for instance).
         """
+        if self is other:
+            return True
         if type(other) != URISourceExpression:
             return False
         return (other._scheme == self._scheme
@@ -478,4 +504,7 @@ class SourceExpressionURIParser(URIParser):
     
     def _getRE(self):
         return SourceExpressionURIParser.netlocRE
+
+    def _getHostPortRE(self):
+        return SourceExpressionURIParser.netlocRE
     
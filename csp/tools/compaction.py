@@ -0,0 +1,136 @@
+'''
+Merges the per-report files written by examples/csp.cgi into large segment files. Each segment contains
+the log entries of many report files (one per line), sorted by 'timestamp-utc', and has a sidecar index
+with the offset and timestamp of each entry (see SegmentIndex). Segments can be read sequentially with
+DataReader.iterateSegments(.), which uses the index to skip data outside of the requested time range.
+
+Usage: python -m csp.tools.compaction [--segment-size N] [--remove | --archive DIR] SOURCEDIR SEGMENTDIR
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import csp.defaults as defaults
+from csp.tools.fileio import DirectoryReader, SegmentIndex
+
+
+class SegmentCompactor(object):
+    """
+    Merges report files from a directory into segment files with an index.
+    """
+
+    def __init__(self, segmentSize=defaults.segmentSize, threads=defaults.directoryReaderThreads):
+        """
+        Creates a new SegmentCompactor that merges up to 'segmentSize' report files into one segment. The report
+        files are read by 'threads' threads in parallel.
+        """
+        self._segmentSize = segmentSize
+        self._directoryReader = DirectoryReader(threads=threads, batchSize=segmentSize)
+
+    def compact(self, sourceDirectory, segmentDirectory, start=None, end=None, removeOriginals=False,
+                archiveDirectory=None):
+        """
+        Merges the report files in 'sourceDirectory' (see DirectoryReader) into new segment files in
+        'segmentDirectory'. Only report files with a timestamp at or after the datetime 'start' and before the
+        datetime 'end' are merged (if not None). Returns a list with the SegmentIndex of each new segment.
+
+        After a segment and its index have been written to disk, the report files merged into the segment are
+        moved to 'archiveDirectory' (if not None) or deleted if 'removeOriginals' is True. Otherwise, they are
+        left unchanged (and would be merged again by the next compaction).
+        """
+        files = self._directoryReader.listFiles(sourceDirectory, start, end)
+        contents = self._directoryReader.readFiles(files)
+        indexes = []
+        for segmentStart in xrange(0, len(files), self._segmentSize):
+            segmentFiles = files[segmentStart:segmentStart + self._segmentSize]
+            records = []
+            for _ in segmentFiles:
+                (filename, data) = contents.next()
+                fallbackTimestamp = _fileTimestamp(filename)
+                for line in data.splitlines():
+                    line = line.strip()
+                    if line != "":
+                        records.append((_entryTimestamp(line, fallbackTimestamp), line))
+            records.sort(key=lambda (timestamp, line): timestamp)
+            indexes.append(self._writeSegment(segmentDirectory, segmentFiles[0], records))
+            for filename in segmentFiles:
+                if archiveDirectory is not None:
+                    shutil.move(filename, os.path.join(archiveDirectory, os.path.basename(filename)))
+                elif removeOriginals:
+                    os.remove(filename)
+        return indexes
+
+    def _writeSegment(self, segmentDirectory, firstFile, records):
+        """
+        Writes the (timestamp, line) 'records' into a new segment file named after 'firstFile' and stores its index.
+        """
+        name = "segment_%s" % DirectoryReader.fileNameRE.match(os.path.basename(firstFile)).group(1)
+        segmentFile = os.path.join(segmentDirectory, name + ".log")
+        suffix = 1
+        while os.path.exists(segmentFile):
+            segmentFile = os.path.join(segmentDirectory, "%s-%d.log" % (name, suffix))
+            suffix += 1
+        offsets = []
+        timestamps = []
+        offset = 0
+        with open(segmentFile + ".tmp", "w") as f:
+            for (timestamp, line) in records:
+                offsets.append(offset)
+                timestamps.append(timestamp)
+                f.write(line + "\n")
+                offset += len(line) + 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(segmentFile + ".tmp", segmentFile)
+        index = SegmentIndex(segmentFile, offsets, timestamps, offset)
+        index.store()
+        return index
+
+
+def _fileTimestamp(filename):
+    """
+    Returns the timestamp in the name of a report file in the format of 'timestamp-utc'.
+    """
+    timestamp = DirectoryReader.fileNameRE.match(os.path.basename(filename)).group(1)
+    return datetime.datetime.strptime(timestamp, DirectoryReader.timestampFormat) \
+                .strftime(SegmentIndex.timestampFormat)
+
+
+def _entryTimestamp(line, fallbackTimestamp):
+    """
+    Returns the 'timestamp-utc' of the log entry in 'line', or 'fallbackTimestamp' if it cannot be determined.
+    """
+    try:
+        timestamp = json.loads(line)["timestamp-utc"]
+        if isinstance(timestamp, basestring):
+            return timestamp.encode("ascii")
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        pass
+    return fallbackTimestamp
+
+
+def main():
+    argParser = argparse.ArgumentParser(description="Merges report files written by csp.cgi into segment files.")
+    argParser.add_argument("sourceDirectory", help="directory with the report files")
+    argParser.add_argument("segmentDirectory", help="directory where segment files are written")
+    argParser.add_argument("--segment-size", type=int, default=defaults.segmentSize,
+                           help="maximum number of report files merged into one segment")
+    group = argParser.add_mutually_exclusive_group()
+    group.add_argument("--remove", action="store_true", help="delete report files after merging them")
+    group.add_argument("--archive", metavar="DIR", help="move report files to DIR after merging them")
+    args = argParser.parse_args()
+
+    compactor = SegmentCompactor(args.segment_size)
+    indexes = compactor.compact(args.sourceDirectory, args.segmentDirectory, removeOriginals=args.remove,
+                                archiveDirectory=args.archive)
+    for index in indexes:
+        print "%s: %d entries from %s to %s" % (index.getSegmentFile(), index.getCount(),
+                                                index.getMinTimestamp(), index.getMaxTimestamp())
+
+
+if __name__ == "__main__":
+    main()
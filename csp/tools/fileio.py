@@ -1,37 +1,189 @@
 '''
-Classes to read data from files and serialise objects into files.
+Classes to read data from files and serialise objects into files. Files ending in .gz, .bz2 or .xz
+are compressed and decompressed transparently (.xz requires the backports.lzma module). LogEntries can also be
+stored in a binary columnar format (see ColumnarWriter), and growing files can be followed as they
+are written (see FollowReader).
 
 @author: Tobias Lauinger <toby@ccs.neu.edu>
 '''
 
+import array
+import bisect
+import bz2
+import collections
+import datetime
+import gzip
+import heapq
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import multiprocessing.pool
+import os
+import re
+import struct
+import sys
+import time
+try:
+    from backports import lzma # lzma module of Python 3.3+ (the stdlib of Python 2 has none)
+except ImportError:
+    lzma = None
+try:
+    from scandir import scandir # os.scandir(.) in Python 3.5+
+except ImportError:
+    scandir = None
+import csp.defaults as defaults
 from csp.report import ReportParser, Report
 from csp.log import LogEntryParser, LogEntry
 from csp.policy import PolicyParser, Policy
+from csp.reportjsonencoder import ReportJSONEncoder
+
+
+def isCompressed(filename):
+    """
+    Returns whether 'filename' is compressed (based on its extension).
+    """
+    return filename.endswith((".gz", ".bz2", ".xz"))
+
+
+def openDataFile(filename, mode="r", bufferSize=defaults.readBufferSize, compressionLevel=defaults.compressionLevel):
+    """
+    Opens 'filename' for reading (mode "r") or writing (mode "w" or "a"). If the file name ends in .gz, .bz2 or .xz,
+    the data is decompressed when reading and compressed with 'compressionLevel' when writing. 'bufferSize' is the
+    number of (uncompressed) bytes buffered for reading or writing.
+    """
+    if filename.endswith(".gz"):
+        f = gzip.open(filename, mode + "b", compressionLevel)
+    elif filename.endswith(".bz2"):
+        # BZ2File is buffered internally
+        return bz2.BZ2File(filename, mode, bufferSize, compressionLevel)
+    elif filename.endswith(".xz"):
+        if lzma is None:
+            raise IOError("Cannot open %s: xz compression requires the backports.lzma module" % filename)
+        if mode == "r":
+            f = lzma.LZMAFile(filename, mode)
+        else:
+            f = lzma.LZMAFile(filename, mode, preset=compressionLevel)
+    else:
+        return open(filename, mode, bufferSize)
+    # line iteration is much faster with a buffer in front of the decompressor
+    if mode == "r":
+        return io.BufferedReader(f, bufferSize)
+    return io.BufferedWriter(f, bufferSize)
 
 
 class DataWriter(object):
     """
-    Writes objects that support __str__ into a file, one object a line.
+    Writes objects that support __str__ into a file, one object a line. Optionally, the output can be rotated
+    into a new file after a maximum size or time, and written data can be synchronised to disk periodically.
     """
     
-    def __init__(self, filename):
-        """Opens the given filename for writing. Can be used only until the file is closed."""
-        self._f = open(filename, "w")
+    def __init__(self, filename, compressionLevel=defaults.compressionLevel, bufferSize=defaults.writeBufferSize,
+                 maxFileSize=None, maxFileAge=None, syncInterval=None):
+        """
+        Opens the given filename for writing. Can be used only until the file is closed. If 'filename' ends in .gz,
+        .bz2 or .xz, the data is compressed with 'compressionLevel' (see openDataFile(.)). 'bufferSize' is the number
+        of bytes buffered before they are written to the file.
+        
+        'maxFileSize': if not None, the output is rotated into a new file when the current file contains at least
+                       this number of (uncompressed) bytes.
+        'maxFileAge': if not None, the output is rotated into a new file when the current file has been open for
+                      at least this number of seconds.
+        If either is set, the output files are named after the time when they were opened, inserted before the
+        extensions of 'filename' (for example, reports.log.gz becomes reports_2013-12-14_025835.280001.log.gz).
+        The output is rotated only when new data is written, and never while the current file is empty.
+        'syncInterval': if not None, the data is flushed and synchronised to disk (fsync) after this number of
+                        objects (and when the file is rotated or closed).
+        """
+        self._filename = filename
+        self._compressionLevel = compressionLevel
+        self._bufferSize = bufferSize
+        self._maxFileSize = maxFileSize
+        self._maxFileAge = maxFileAge
+        self._syncInterval = syncInterval
+        self._filenames = [] # all files opened so far
+        self._f = None
+        self._open()
         
     def store(self, obj):
         """Writes the given object into a line in the file (appending to everything written so far)."""
-        self._f.write(str(obj) + "\n")
+        self._write(str(obj) + "\n", 1)
+    
+    def storeMany(self, objects):
+        """
+        Writes the given objects into lines in the file (appending to everything written so far). The objects are
+        serialised and written as one batch (so that rotation and synchronisation happen only between batches).
+        """
+        if len(objects) > 0:
+            self._write("".join([str(obj) + "\n" for obj in objects]), len(objects))
        
     def storeAll(self, data):
         """Writes all the serialisable objects from the data structure to the file (appending to everything
         written so far)."""
+        batch = []
         for obj in data:
-            self.store(obj)
+            batch.append(obj)
+            if len(batch) >= defaults.writeBatchSize:
+                self.storeMany(batch)
+                batch = []
+        self.storeMany(batch)
+    
+    def flush(self):
+        """
+        Flushes the buffers and synchronises the data written so far to disk. (Not supported for .bz2 files,
+        which are complete only when they are closed.)
+        """
+        self._unsyncedObjects = 0
+        if not hasattr(self._f, "fileno"): # BZ2File
+            return
+        self._f.flush()
+        raw = getattr(self._f, "raw", None)
+        if raw is not None:
+            raw.flush() # for compressed files, also flush the compressor
+        os.fsync(self._f.fileno())
+    
+    def getFilenames(self):
+        """Returns a list with the names of all files written by this DataWriter (the current file is last)."""
+        return list(self._filenames)
     
     def close(self):
         """Closes the underlying file."""
+        if self._syncInterval is not None:
+            self.flush()
         self._f.close()
     
+    def _open(self):
+        filename = self._filename
+        if self._maxFileSize is not None or self._maxFileAge is not None:
+            (directory, name) = os.path.split(self._filename)
+            (base, extensions) = (name.split(".", 1) + [""])[:2]
+            if extensions != "":
+                extensions = "." + extensions
+            timestamp = datetime.datetime.utcnow().strftime(DirectoryReader.timestampFormat)
+            filename = os.path.join(directory, "%s_%s%s" % (base, timestamp, extensions))
+            suffix = 1
+            while os.path.exists(filename) or filename in self._filenames:
+                filename = os.path.join(directory, "%s_%s-%d%s" % (base, timestamp, suffix, extensions))
+                suffix += 1
+        self._f = openDataFile(filename, "w", self._bufferSize, self._compressionLevel)
+        self._filenames.append(filename)
+        self._openedAt = time.time()
+        self._writtenBytes = 0
+        self._unsyncedObjects = 0
+    
+    def _write(self, data, objectCount):
+        # an empty file is never rotated (which would leave an empty output file behind)
+        if self._writtenBytes > 0 and ((self._maxFileSize is not None and self._writtenBytes >= self._maxFileSize)
+                or (self._maxFileAge is not None and time.time() - self._openedAt >= self._maxFileAge)):
+            self.close()
+            self._open()
+        self._f.write(data)
+        self._writtenBytes += len(data)
+        self._unsyncedObjects += objectCount
+        if self._syncInterval is not None and self._unsyncedObjects >= self._syncInterval:
+            self.flush()
+    
     def _encodeLineBreaks(self, inputstr):
         """Encodes % and \\r and \\n."""
         return inputstr.replace("%", "%25").replace("\r", "%0D").replace("\n", "%0A")
@@ -44,30 +196,142 @@ class DataWriter(object):
 class DataReader(object):
     """
     Loads lines from a file, either line by line, or reading the entire file at once. Each
-    line read from the file is passed to a callback function as a string.
+    line read from the file is passed to a callback function as a string, or returned by an iterator.
+    Subclasses convert the lines into objects by overriding _convert(.).
     """
     
-    def __init__(self, printErrorMessages=False):
+    def __init__(self, printErrorMessages=False, bufferSize=defaults.readBufferSize):
+        """
+        Creates a new DataReader. 'bufferSize' is the number of bytes read from the file at once.
+        """
         self._printErrorMessages = printErrorMessages
+        self._bufferSize = bufferSize
+
+    def iterate(self, filename):
+        """
+        Opens 'filename' and returns an iterator over the (converted) non-empty lines. The file is read
+        lazily with buffered reads, so that files of any size can be processed at constant memory. The
+        file is closed when the iterator is exhausted or discarded. Compressed files are decompressed while reading.
+        """
+        with openDataFile(filename, "r", self._bufferSize) as f:
+            for line in f:
+                line = line.strip()
+                if line != "":
+                    obj = self._convert(line)
+                    if obj is not None:
+                        yield obj
+
+    def iterateRange(self, filename, start, end):
+        """
+        Like iterate(.), but returns only the lines of 'filename' that start at a byte offset in the range
+        ['start', 'end'). 'start' must be the offset of the beginning of a line (see findLineRanges(.)).
+        For compressed files, the offsets refer to the uncompressed data.
+        """
+        with openDataFile(filename, "r", self._bufferSize) as f:
+            f.seek(start)
+            position = start
+            while position < end:
+                line = f.readline()
+                if line == "":
+                    break
+                position += len(line)
+                line = line.strip()
+                if line != "":
+                    obj = self._convert(line)
+                    if obj is not None:
+                        yield obj
 
     def load(self, filename, callbackFunction):
         """
-        Opens 'filename' and passes each non-empty line to 'callbackFunction'. Returns nothing.
+        Opens 'filename' and passes each non-empty line (converted) to 'callbackFunction'. Returns nothing.
         """
-        f = open(filename, "r")
-        for line in f:
-            line = line.strip()
-            if line != "":
-                callbackFunction(line)
-        f.close()
+        for obj in self.iterate(filename):
+            callbackFunction(obj)
         
     def loadAll(self, filename):
         """
-        Returns a list with all the non-empty lines in 'filename'.
+        Returns a list with all the non-empty lines (converted) in 'filename'.
+        """
+        return list(self.iterate(filename))
+    
+    def iterateFromRecord(self, filename, recordNumber):
+        """
+        Like iterate(.), but starts with record (non-empty line) number 'recordNumber' (counting from 0). Uses the
+        LineIndex of 'filename' to seek directly to the record (see LineIndex.loadOrBuild(.)).
+        """
+        (start, end) = LineIndex.loadOrBuild(filename).getRange(recordNumber)
+        return self.iterateRange(filename, start, end)
+
+    def iterateRecords(self, filename, start=None, end=None, policyType=None):
+        """
+        Returns an iterator over the (converted) records with a timestamp at or after the datetime 'start' and
+        before the datetime 'end' and the given 'policyType' (None for no restriction), in file order. Only these
+        records are read from the file, using its LineIndex (see LineIndex.findRecords(.) and loadOrBuild(.)).
+        """
+        index = LineIndex.loadOrBuild(filename)
+        recordNumbers = index.findRecords(start, end, policyType)
+        with openDataFile(filename, "r", self._bufferSize) as f:
+            position = None
+            for recordNumber in recordNumbers:
+                offset = index.getOffset(recordNumber)
+                if offset != position:
+                    f.seek(offset)
+                line = f.readline()
+                position = offset + len(line)
+                obj = self._convert(line.strip())
+                if obj is not None:
+                    yield obj
+
+    def iterateSegments(self, directory, start=None, end=None):
+        """
+        Returns an iterator over the (converted) lines in the segment files in 'directory' (see SegmentIndex), in
+        timestamp order. If 'start' or 'end' are not None, returns only the lines with a timestamp at or after the
+        datetime 'start' and before the datetime 'end'. Segments outside of this time range are not opened, and
+        the other segments are read only in the byte range with matching lines. Segments whose time ranges overlap
+        (for example, from separate compaction runs) are merged by timestamp.
+        """
+        for group in SegmentIndex.groupOverlapping(SegmentIndex.listSegments(directory)):
+            if len(group) == 1:
+                (rangeStart, rangeEnd) = group[0].findRange(start, end)
+                if rangeStart < rangeEnd:
+                    for obj in self.iterateRange(group[0].getSegmentFile(), rangeStart, rangeEnd):
+                        yield obj
+            else:
+                # tuples of (timestamp, segment number, object); objects of different segments are never compared
+                segments = [self._iterateSegment(index, number, start, end) for (number, index) in enumerate(group)]
+                for (_, _, obj) in heapq.merge(*segments):
+                    yield obj
+
+    def _iterateSegment(self, index, number, start, end):
+        """
+        Returns an iterator over (timestamp, 'number', object) tuples for the (converted) lines of the segment with
+        'index' that have a timestamp at or after the datetime 'start' and before the datetime 'end'.
+        """
+        (first, last) = index.findLines(start, end)
+        if first >= last:
+            return
+        with openDataFile(index.getSegmentFile(), "r", self._bufferSize) as f:
+            f.seek(index.getOffset(first))
+            for lineNumber in xrange(first, last):
+                line = f.readline().strip()
+                if line != "":
+                    obj = self._convert(line)
+                    if obj is not None:
+                        yield (index.getTimestamp(lineNumber), number, obj)
+
+    def follow(self, path, checkpointFile=None, timeout=None, pollInterval=defaults.followPollInterval):
+        """
+        Returns an iterator over the (converted) lines of the growing file or directory 'path', including lines
+        appended later, like tail -F. If 'checkpointFile' is not None, reading resumes after the last line
+        returned in a previous run. See FollowReader.follow(.).
+        """
+        return FollowReader(self, checkpointFile, pollInterval).follow(path, timeout)
+    
+    def _convert(self, line):
+        """
+        Returns the object represented by the non-empty 'line', or None if it should be skipped.
         """
-        data = []
-        self.load(filename, lambda line: data.append(line))
-        return data
+        return line
 
 
 class ReportDataReader(DataReader):
@@ -75,21 +339,25 @@ class ReportDataReader(DataReader):
     Loads CSP violation reports from files. The file format is one JSON-encoded report per line.
     '''
 
-    def __init__(self, printErrorMessages=False):
-        DataReader.__init__(self, printErrorMessages)
-        self._parser = ReportParser()
+    def __init__(self, printErrorMessages=False, parser=None, bufferSize=defaults.readBufferSize):
+        """
+        Creates a new ReportDataReader. 'parser' is the ReportParser used to parse the lines of the file (if None, a
+        ReportParser with the default configuration will be used).
+        """
+        DataReader.__init__(self, printErrorMessages, bufferSize)
+        if parser is None:
+            parser = ReportParser()
+        self._parser = parser
         
-    def load(self, filename, callbackFunction):
+    def _convert(self, line):
         """
-        Opens 'filename' and passes each valid Report to 'callbackFunction'. Returns nothing.
+        Returns the Report in 'line', or None if it is invalid.
         """
-        def convert(line):
-            report = self._parser.parseString(line)
-            if report is not Report.INVALID():
-                callbackFunction(report)
-            elif self._printErrorMessages:
-                print "Could not parse report '%s'" % line
-        DataReader.load(self, filename, convert)
+        report = self._parser.parseString(line)
+        if report is not Report.INVALID():
+            return report
+        elif self._printErrorMessages:
+            print "Could not parse report '%s'" % line
     
 
 class LogEntryDataReader(DataReader):
@@ -98,21 +366,25 @@ class LogEntryDataReader(DataReader):
     The file format is one JSON-encoded entry per line.
     '''
 
-    def __init__(self, printErrorMessages=False):
-        DataReader.__init__(self, printErrorMessages)
-        self._parser = LogEntryParser()
+    def __init__(self, printErrorMessages=False, parser=None, bufferSize=defaults.readBufferSize):
+        """
+        Creates a new LogEntryDataReader. 'parser' is the LogEntryParser used to parse the lines of the file (if None, a
+        LogEntryParser with the default configuration will be used).
+        """
+        DataReader.__init__(self, printErrorMessages, bufferSize)
+        if parser is None:
+            parser = LogEntryParser()
+        self._parser = parser
         
-    def load(self, filename, callbackFunction):
+    def _convert(self, line):
         """
-        Opens 'filename' and passes each valid LogEntry to 'callbackFunction'. Returns nothing.
+        Returns the LogEntry in 'line', or None if it is invalid.
         """
-        def convert(line):
-            entry = self._parser.parseString(line)
-            if entry is not LogEntry.INVALID():
-                callbackFunction(entry)
-            elif self._printErrorMessages:
-                print "Could not parse log entry '%s'" % line
-        DataReader.load(self, filename, convert)
+        entry = self._parser.parseString(line)
+        if entry is not LogEntry.INVALID():
+            return entry
+        elif self._printErrorMessages:
+            print "Could not parse log entry '%s'" % line
         
         
 class PolicyDataReader(DataReader):
@@ -120,19 +392,1057 @@ class PolicyDataReader(DataReader):
     Loads files with policies (one per line).
     '''
 
-    def __init__(self, printErrorMessages=False):
-        DataReader.__init__(self, printErrorMessages)
-        self._parser = PolicyParser(expandDefaultSrc=False)
+    def __init__(self, printErrorMessages=False, parser=None, bufferSize=defaults.readBufferSize):
+        """
+        Creates a new PolicyDataReader. 'parser' is the PolicyParser used to parse the lines of the file (if None, a
+        PolicyParser that does not expand 'default-src' will be used).
+        """
+        DataReader.__init__(self, printErrorMessages, bufferSize)
+        if parser is None:
+            parser = PolicyParser(expandDefaultSrc=False)
+        self._parser = parser
         
-    def load(self, filename, callbackFunction):
+    def _convert(self, line):
+        """
+        Returns the Policy in 'line', or None if it is invalid.
+        """
+        pol = self._parser.parse(line)
+        if pol is not Policy.INVALID():
+            return pol
+        elif self._printErrorMessages:
+            print "Could not parse policy '%s'" % line
+
+
+def iterReports(filename, parser=None, printErrorMessages=False):
+    """
+    Returns an iterator over the valid Reports in 'filename' (see ReportDataReader).
+    """
+    return ReportDataReader(printErrorMessages, parser).iterate(filename)
+
+
+def iterLogEntries(filename, parser=None, printErrorMessages=False):
+    """
+    Returns an iterator over the valid LogEntries in 'filename' (see LogEntryDataReader).
+    """
+    return LogEntryDataReader(printErrorMessages, parser).iterate(filename)
+
+
+def iterPolicies(filename, parser=None, printErrorMessages=False):
+    """
+    Returns an iterator over the valid Policies in 'filename' (see PolicyDataReader).
+    """
+    return PolicyDataReader(printErrorMessages, parser).iterate(filename)
+
+
+class DirectoryReader(object):
+    """
+    Loads LogEntries from a directory with one file per report, as written by examples/csp.cgi. The files are
+    named after the time when the report was received, for example reports_2013-12-14_025835.280001.log.
+    Files are read by a pool of threads and parsed in the calling thread.
+    """
+
+    fileNameRE = re.compile(r"^reports_(\d{4}-\d{2}-\d{2}_\d{6}\.\d{6})\.log$")
+    timestampFormat = "%Y-%m-%d_%H%M%S.%f" # the timestamp in file names (sorts in chronological order)
+
+    def __init__(self, printErrorMessages=False, parser=None, threads=defaults.directoryReaderThreads,
+                 batchSize=defaults.directoryReaderBatchSize):
+        """
+        Creates a new DirectoryReader. 'parser' is the LogEntryParser used to parse the files (if None, a
+        LogEntryParser with the default configuration will be used). 'threads' files are read in parallel,
+        in batches of 'batchSize' files.
+        """
+        self._reader = LogEntryDataReader(printErrorMessages, parser)
+        self._threads = threads
+        self._batchSize = batchSize
+
+    def listFiles(self, directory, start=None, end=None):
+        """
+        Returns the paths of the report files in 'directory', in timestamp order. If 'start' or 'end' are
+        not None, returns only the files with a timestamp at or after the datetime 'start' and before the
+        datetime 'end'. The timestamps are taken from the file names; files are not opened.
+        """
+        if start is not None:
+            start = start.strftime(DirectoryReader.timestampFormat)
+        if end is not None:
+            end = end.strftime(DirectoryReader.timestampFormat)
+        if scandir is not None:
+            names = (entry.name for entry in scandir(directory))
+        else:
+            names = os.listdir(directory)
+        files = []
+        for name in names:
+            match = DirectoryReader.fileNameRE.match(name)
+            if match is None:
+                continue
+            timestamp = match.group(1)
+            if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                files.append((timestamp, name))
+        files.sort()
+        return [os.path.join(directory, name) for (_, name) in files]
+
+    def iterate(self, directory, start=None, end=None):
+        """
+        Returns an iterator over the valid LogEntries in the report files in 'directory' (see listFiles(.)),
+        in timestamp order.
+        """
+        for (_, contents) in self.readFiles(self.listFiles(directory, start, end)):
+            for line in contents.splitlines():
+                line = line.strip()
+                if line != "":
+                    entry = self._reader._convert(line)
+                    if entry is not None:
+                        yield entry
+
+    def readFiles(self, files):
+        """
+        Returns an iterator over (filename, contents) tuples for each file in the list 'files', in the same order.
+        The files are read in parallel by the threads of this DirectoryReader.
+        """
+        if len(files) == 0:
+            return
+        pool = multiprocessing.pool.ThreadPool(self._threads)
+        try:
+            for batchStart in xrange(0, len(files), self._batchSize):
+                batch = files[batchStart:batchStart + self._batchSize]
+                for (filename, contents) in zip(batch, pool.map(_readFile, batch)):
+                    yield (filename, contents)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def load(self, directory, callbackFunction, start=None, end=None):
+        """
+        Passes each valid LogEntry in the report files in 'directory' to 'callbackFunction', in timestamp order.
+        Returns nothing.
+        """
+        for entry in self.iterate(directory, start, end):
+            callbackFunction(entry)
+
+    def loadAll(self, directory, start=None, end=None):
+        """
+        Returns a list with all the valid LogEntries in the report files in 'directory', in timestamp order.
+        """
+        return list(self.iterate(directory, start, end))
+
+
+class FollowReader(object):
+    """
+    Follows a file or a directory of files that are being written, like tail -F, and returns the (converted)
+    lines as they are appended. Only complete lines (ending in a line break) are returned.
+
+    A file is identified by its inode, so that rotation is detected: when a followed file is renamed and a new
+    file is created under its name, the rest of the old file is read before the new file. A file that shrinks is
+    assumed to have been truncated and is read again from the start. In a directory, the files are read in the
+    order of their names (the timestamps in the names of report files and rotated DataWriter files sort in
+    chronological order), and a file is followed until a newer file appears. Hidden files and index sidecars are
+    ignored. Compressed files are supported only if they are complete when they are first read.
+
+    The position after the last line returned (file name, inode and byte offset) can be saved in a checkpoint file,
+    so that a restarted reader resumes where the previous one stopped. Lines that were returned after the last
+    checkpoint was saved are returned again.
+    """
+
+    def __init__(self, reader=None, checkpointFile=None, pollInterval=defaults.followPollInterval):
+        """
+        Creates a new FollowReader. 'reader' is the DataReader used to convert the lines (if None, a
+        LogEntryDataReader with the default configuration will be used). 'checkpointFile' is the name of the file
+        where the position is saved (if None, it is not saved); if it exists, reading resumes at the saved position.
+        The followed files are checked for new data every 'pollInterval' seconds.
+        """
+        if reader is None:
+            reader = LogEntryDataReader()
+        self._reader = reader
+        self._checkpointFile = checkpointFile
+        self._pollInterval = pollInterval
+        self._checkpoint = None # (filename, inode, offset) after the last line returned
+        if checkpointFile is not None and os.path.exists(checkpointFile):
+            with open(checkpointFile, "r") as f:
+                data = json.load(f)
+            self._checkpoint = (data["filename"], data["inode"], data["offset"])
+
+    def follow(self, path, timeout=None):
+        """
+        Returns an iterator over the (converted) lines of the file or directory 'path', waiting for new data when
+        all lines have been read. The iterator stops when no new data has been appended for 'timeout' seconds
+        (if None, it never stops). The checkpoint is saved whenever all available data has been read.
+        """
+        idleSince = time.time()
+        while True:
+            checkpoint = self._checkpoint
+            for obj in self.poll(path):
+                yield obj
+            if self._checkpoint != checkpoint:
+                idleSince = time.time()
+            elif timeout is not None and time.time() - idleSince >= timeout:
+                return
+            time.sleep(self._pollInterval)
+
+    def poll(self, path):
+        """
+        Returns an iterator over the (converted) lines of the file or directory 'path' that were appended after the
+        current position, without waiting for new data. The checkpoint is saved when the iterator is exhausted.
+        """
+        for (filename, offset) in self._findPending(path):
+            for obj in self._readFrom(filename, offset):
+                yield obj
+        self.saveCheckpoint()
+
+    def getCheckpoint(self):
+        """
+        Returns the position after the last line returned as a (filename, inode, offset) tuple, or None if nothing
+        has been read yet.
+        """
+        return self._checkpoint
+
+    def saveCheckpoint(self):
+        """
+        Writes the current position into the checkpoint file (if any). The file is replaced atomically.
+        """
+        if self._checkpointFile is None or self._checkpoint is None:
+            return
+        (filename, inode, offset) = self._checkpoint
+        temporaryFile = self._checkpointFile + ".tmp"
+        with open(temporaryFile, "w") as f:
+            json.dump({"filename": filename, "inode": inode, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temporaryFile, self._checkpointFile)
+
+    def _listFiles(self, path):
+        """
+        Returns the paths of the data files in 'path' (a directory or a single file) in reading order.
+        """
+        if not os.path.isdir(path):
+            return [path] if os.path.exists(path) else []
+        names = [name for name in os.listdir(path) if not name.startswith(".")
+                 and not name.endswith((SegmentIndex.indexSuffix, LineIndex.indexSuffix))]
+        names.sort()
+        return [os.path.join(path, name) for name in names if os.path.isfile(os.path.join(path, name))]
+
+    def _findPending(self, path):
+        """
+        Returns a list of (filename, offset) tuples with the files (and the offset in these files) that remain to
+        be read, in reading order.
+        """
+        files = self._listFiles(path)
+        if self._checkpoint is None:
+            return [(filename, 0) for filename in files]
+        (filename, inode, offset) = self._checkpoint
+        current = self._findFile(filename, inode, files)
+        if current is None:
+            # the file has been removed; continue with the files that follow it
+            if os.path.isdir(path):
+                name = os.path.basename(filename)
+                return [(other, 0) for other in files if os.path.basename(other) > name]
+            return [(other, 0) for other in files]
+        if not isCompressed(current) and os.path.getsize(current) < offset:
+            offset = 0 # truncated
+        if current in files:
+            position = files.index(current)
+            return [(current, offset)] + [(other, 0) for other in files[position + 1:]]
+        # rotated: the old file has been renamed, and a new file has taken its place
+        return [(current, offset)] + [(other, 0) for other in files if os.path.basename(other)
+                                      >= os.path.basename(filename) or not os.path.isdir(path)]
+
+    def _findFile(self, filename, inode, files):
+        """
+        Returns the current name of the file with 'inode' that was called 'filename', or None if it does not exist.
+        The file is searched in the directory of 'filename'.
+        """
+        if _inode(filename) == inode:
+            return filename
+        directory = os.path.dirname(filename) or "."
+        for name in os.listdir(directory):
+            candidate = os.path.join(directory, name)
+            if _inode(candidate) == inode:
+                return candidate
+        return None
+
+    def _readFrom(self, filename, offset):
+        """
+        Returns an iterator over the (converted) complete lines of 'filename' after the byte 'offset', and updates
+        the position after each line.
+        """
+        inode = _inode(filename)
+        if inode is None:
+            return
+        self._checkpoint = (filename, inode, offset)
+        with openDataFile(filename, "r", self._reader._bufferSize) as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break # still being written
+                offset += len(line)
+                self._checkpoint = (filename, inode, offset)
+                line = line.strip()
+                if line != "":
+                    obj = self._reader._convert(line)
+                    if obj is not None:
+                        yield obj
+
+
+def _inode(filename):
+    """
+    Returns the inode number of 'filename', or None if it does not exist.
+    """
+    try:
+        return os.stat(filename).st_ino
+    except OSError:
+        return None
+
+
+class SegmentIndex(object):
+    """
+    Index of a segment file, which contains many log entries (one per line) sorted by their 'timestamp-utc'
+    (see SegmentCompactor). The index is stored in a sidecar file next to the segment (the name of the segment
+    file with the suffix .index) and contains the byte offset and timestamp of each line in the segment.
+    """
+
+    fileNameRE = re.compile(r"^segment_.+\.log$")
+    indexSuffix = ".index"
+    timestampFormat = "%Y-%m-%d %H:%M:%S.%f" # format of 'timestamp-utc' in log entries
+
+    def __init__(self, segmentFile, offsets, timestamps, segmentSize):
+        """
+        Creates a new SegmentIndex for 'segmentFile' of 'segmentSize' bytes. 'offsets' and 'timestamps' are lists
+        with the byte offset and timestamp string of each line, in the order of the lines in the segment file.
+        """
+        self._segmentFile = segmentFile
+        self._offsets = offsets
+        self._timestamps = timestamps
+        self._segmentSize = segmentSize
+
+    def getSegmentFile(self):
+        return self._segmentFile
+
+    def getCount(self):
+        """Returns the number of lines in the segment."""
+        return len(self._offsets)
+
+    def getMinTimestamp(self):
+        """Returns the timestamp string of the first line in the segment (None if the segment is empty)."""
+        return self._timestamps[0] if len(self._timestamps) > 0 else None
+
+    def getMaxTimestamp(self):
+        """Returns the timestamp string of the last line in the segment (None if the segment is empty)."""
+        return self._timestamps[-1] if len(self._timestamps) > 0 else None
+
+    def getOffset(self, lineNumber):
+        """Returns the byte offset of line 'lineNumber' (counting from 0) in the segment."""
+        return self._offsets[lineNumber]
+
+    def getTimestamp(self, lineNumber):
+        """Returns the timestamp string of line 'lineNumber' (counting from 0) in the segment."""
+        return self._timestamps[lineNumber]
+
+    def findLines(self, start=None, end=None):
+        """
+        Returns the line numbers (first inclusive, last exclusive) of the lines in the segment with a timestamp
+        at or after the datetime 'start' and before the datetime 'end' (None for no limit).
+        """
+        first = 0
+        last = len(self._offsets)
+        if start is not None:
+            first = bisect.bisect_left(self._timestamps, start.strftime(SegmentIndex.timestampFormat))
+        if end is not None:
+            last = bisect.bisect_left(self._timestamps, end.strftime(SegmentIndex.timestampFormat))
+        return (first, max(first, last))
+
+    def findRange(self, start=None, end=None):
+        """
+        Returns the byte range (start inclusive, end exclusive) of the lines in the segment with a timestamp
+        at or after the datetime 'start' and before the datetime 'end' (None for no limit). The range is
+        empty (start == end) if there are no such lines.
+        """
+        (first, last) = self.findLines(start, end)
+        if first >= last:
+            return (0, 0)
+        if last < len(self._offsets):
+            return (self._offsets[first], self._offsets[last])
+        return (self._offsets[first], self._segmentSize)
+
+    def store(self):
+        """
+        Writes this index into the sidecar file of the segment (replacing it atomically if it exists).
+        """
+        indexFile = self._segmentFile + SegmentIndex.indexSuffix
+        with open(indexFile + ".tmp", "w") as f:
+            json.dump({"count": self.getCount(),
+                       "min-timestamp": self.getMinTimestamp(),
+                       "max-timestamp": self.getMaxTimestamp(),
+                       "size": self._segmentSize,
+                       "offsets": self._offsets,
+                       "timestamps": self._timestamps}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(indexFile + ".tmp", indexFile)
+
+    @staticmethod
+    def load(segmentFile):
+        """
+        Loads the index of 'segmentFile' from its sidecar file.
+        """
+        with open(segmentFile + SegmentIndex.indexSuffix, "r") as f:
+            data = json.load(f)
+        timestamps = [timestamp.encode("ascii") for timestamp in data["timestamps"]]
+        return SegmentIndex(segmentFile, data["offsets"], timestamps, data["size"])
+
+    @staticmethod
+    def listSegments(directory):
         """
-        Opens 'filename' and passes each valid Policy to 'callbackFunction'. Returns nothing.
+        Returns the SegmentIndex of each segment file in 'directory' that has an index, sorted by timestamp.
         """
-        def convert(line):
-            pol = self._parser.parse(line)
-            if pol is not Policy.INVALID():
-                callbackFunction(pol)
+        indexes = []
+        for name in os.listdir(directory):
+            if SegmentIndex.fileNameRE.match(name) and os.path.exists(os.path.join(directory, name + SegmentIndex.indexSuffix)):
+                index = SegmentIndex.load(os.path.join(directory, name))
+                if index.getCount() > 0:
+                    indexes.append(index)
+        indexes.sort(key=lambda index: (index.getMinTimestamp(), index.getMaxTimestamp()))
+        return indexes
+
+    @staticmethod
+    def groupOverlapping(indexes):
+        """
+        Splits the list of SegmentIndexes 'indexes' (sorted by timestamp, see listSegments(.)) into groups of
+        segments with overlapping time ranges. Returns a list of lists; the segments of different groups can
+        be read one after the other, whereas the lines of segments in the same group need to be merged.
+        """
+        groups = []
+        groupEnd = None
+        for index in indexes:
+            if len(groups) > 0 and index.getMinTimestamp() < groupEnd:
+                groups[-1].append(index)
+                groupEnd = max(groupEnd, index.getMaxTimestamp())
+            else:
+                groups.append([index])
+                groupEnd = index.getMaxTimestamp()
+        return groups
+
+
+def _readFile(filename):
+    with open(filename, "r") as f:
+        return f.read()
+
+
+class ColumnarWriter(object):
+    """
+    Writes LogEntries into a binary columnar file. Each field of the log entries (and of their 'csp-report') is
+    stored as a column. The column of 'timestamp-utc' is stored as 64-bit integers (microseconds since the epoch);
+    all other columns are dictionary-encoded: each distinct value is stored once, and the column consists of the
+    integer code of the value in each log entry. The file is written when the writer is closed.
+
+    File format: the magic string, the length of the header (unsigned 32-bit integer), the JSON-encoded header
+    with the number of entries and the description of each column (type and location relative to the end of the
+    header), followed by the data of the columns. All integers are little-endian.
+    """
+
+    magic = "CSPCOLUMNS1\n"
+    timestampColumns = ("timestamp-utc",)
+    missingTimestamp = -2 ** 63
+
+    def __init__(self, filename):
+        """
+        Creates a new ColumnarWriter that writes to 'filename' when it is closed.
+        """
+        self._filename = filename
+        self._count = 0
+        self._columns = {} # column name -> (dictionary of JSON-encoded value -> code, array of codes)
+
+    def store(self, logEntry):
+        """
+        Adds the given LogEntry (or another mapping, such as a Report) to the file. Nested mappings are stored
+        with one column per key, named "<key>/<nested key>".
+        """
+        for (key, value) in logEntry.iteritems():
+            if isinstance(value, collections.Mapping):
+                for (nestedKey, nestedValue) in value.iteritems():
+                    self._storeValue(key + "/" + nestedKey, nestedValue)
+            else:
+                self._storeValue(key, value)
+        self._count += 1
+        for (_, codes) in self._columns.itervalues():
+            if len(codes) < self._count:
+                codes.append(0)
+
+    def storeAll(self, data):
+        """Adds all the LogEntries from the iterable 'data' to the file."""
+        for logEntry in data:
+            self.store(logEntry)
+
+    def close(self):
+        """Writes the file."""
+        columns = []
+        sections = []
+        offset = 0
+        for name in sorted(self._columns.keys()):
+            (dictionary, codes) = self._columns[name]
+            values = sorted(dictionary.keys(), key=dictionary.get)
+            timestamps = None
+            if name in ColumnarWriter.timestampColumns:
+                timestamps = _encodeTimestamps(values)
+            if timestamps is not None:
+                data = _packTimestamps([ColumnarWriter.missingTimestamp] + timestamps, codes)
+                columns.append({"name": name, "type": "timestamp", "offset": offset, "length": len(data)})
+                sections.append(data)
+                offset += len(data)
+            else:
+                dictionaryData = "[" + ",".join(values) + "]"
+                codeType = "B" if len(values) < 2 ** 8 else ("H" if len(values) < 2 ** 16 else "I")
+                codeData = _packArray(array.array(codeType, codes))
+                columns.append({"name": name, "type": "dictionary", "codeType": codeType,
+                                "offset": offset, "length": len(codeData),
+                                "dictionaryOffset": offset + len(codeData), "dictionaryLength": len(dictionaryData)})
+                sections.extend((codeData, dictionaryData))
+                offset += len(codeData) + len(dictionaryData)
+        header = json.dumps({"count": self._count, "columns": columns})
+        with open(self._filename, "wb") as f:
+            f.write(ColumnarWriter.magic)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for data in sections:
+                f.write(data)
+
+    def _storeValue(self, name, value):
+        if not name in self._columns:
+            self._columns[name] = ({}, array.array("I", [0] * self._count))
+        (dictionary, codes) = self._columns[name]
+        encoded = json.dumps(value, cls=ReportJSONEncoder)
+        code = dictionary.get(encoded)
+        if code is None:
+            code = len(dictionary) + 1 # 0 means that the value is missing
+            dictionary[encoded] = code
+        codes.append(code)
+
+
+class ColumnarFile(object):
+    """
+    Read access to the columns of a file written by ColumnarWriter. The file is memory-mapped, and each column is
+    decoded only when it is read.
+    """
+
+    def __init__(self, filename):
+        """
+        Opens the columnar file 'filename'. Can be used only until the file is closed.
+        """
+        self._file = open(filename, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(ColumnarWriter.magic)] != ColumnarWriter.magic:
+            self.close()
+            raise IOError("%s is not a columnar file" % filename)
+        (headerLength,) = struct.unpack_from("<I", self._map, len(ColumnarWriter.magic))
+        headerStart = len(ColumnarWriter.magic) + 4
+        header = json.loads(self._map[headerStart:headerStart + headerLength])
+        self._dataStart = headerStart + headerLength
+        self._count = header["count"]
+        self._columns = dict((column["name"], column) for column in header["columns"])
+
+    def getCount(self):
+        """Returns the number of entries in the file."""
+        return self._count
+
+    def getColumnNames(self):
+        """Returns a sorted list with the names of all columns in the file."""
+        return sorted(self._columns.keys())
+
+    def readColumn(self, name):
+        """
+        Returns a list with the value of the column 'name' for each entry (None if the entry has no such value).
+        Values are decoded from JSON; timestamps are returned in the format of 'timestamp-utc'.
+        """
+        column = self._columns[name]
+        if column["type"] == "timestamp":
+            return [None if timestamp is None else _formatTimestamp(timestamp)
+                    for timestamp in self.readTimestamps(name)]
+        start = self._dataStart + column["dictionaryOffset"]
+        table = [None] + json.loads(self._map[start:start + column["dictionaryLength"]])
+        return map(table.__getitem__, self._readCodes(column))
+
+    def readTimestamps(self, name="timestamp-utc"):
+        """
+        Returns a list with the value of the timestamp column 'name' for each entry, as the number of microseconds
+        since the epoch (None if the entry has no such value). Returns None if 'name' is not a timestamp column.
+        """
+        column = self._columns[name]
+        if column["type"] != "timestamp":
+            return None
+        timestamps = struct.unpack_from("<%dq" % self._count, self._map, self._dataStart + column["offset"])
+        return [None if timestamp == ColumnarWriter.missingTimestamp else timestamp for timestamp in timestamps]
+
+    def close(self):
+        """Closes the underlying file."""
+        self._map.close()
+        self._file.close()
+
+    def _readCodes(self, column):
+        start = self._dataStart + column["offset"]
+        codes = array.array(str(column["codeType"]))
+        codes.fromstring(self._map[start:start + column["length"]])
+        if sys.byteorder == "big":
+            codes.byteswap()
+        return codes
+
+
+class ColumnarReader(object):
+    """
+    Loads LogEntries from files written by ColumnarWriter, optionally decoding only some of the columns.
+    """
+
+    def __init__(self, printErrorMessages=False, parser=None):
+        """
+        Creates a new ColumnarReader. 'parser' is the LogEntryParser used to parse the log entries (if None, a
+        LogEntryParser with the default configuration will be used). When only some columns are read, the parser
+        should be configured not to require the others (see the 'fields' and 'reportFields' of LogEntryParser).
+        """
+        if parser is None:
+            parser = LogEntryParser()
+        self._parser = parser
+        self._printErrorMessages = printErrorMessages
+
+    def iterate(self, filename, columns=None):
+        """
+        Returns an iterator over the valid LogEntries in 'filename'. If 'columns' is not None, only the given columns
+        are read: top-level keys such as "policy-type", report keys such as "csp-report/blocked-uri", or "csp-report"
+        for all report keys. The 'csp-report' of each entry is always present (but may be empty).
+        """
+        columnarFile = ColumnarFile(filename)
+        try:
+            names = columnarFile.getColumnNames()
+            if columns is not None:
+                names = [name for name in names if name in columns or name.split("/", 1)[0] in columns]
+            values = [(name.split("/", 1), columnarFile.readColumn(name)) for name in names]
+            count = columnarFile.getCount()
+        finally:
+            columnarFile.close()
+        for i in xrange(count):
+            jsonLogEntry = {"csp-report": {}}
+            for (path, column) in values:
+                value = column[i]
+                if value is not None:
+                    if len(path) == 1:
+                        jsonLogEntry[path[0]] = value
+                    else:
+                        jsonLogEntry.setdefault(path[0], {})[path[1]] = value
+            entry = self._parser.parseJsonDict(jsonLogEntry)
+            if entry is not LogEntry.INVALID():
+                yield entry
             elif self._printErrorMessages:
-                print "Could not parse policy '%s'" % line
-        DataReader.load(self, filename, convert)
+                print "Could not parse log entry %d in '%s'" % (i, filename)
+
+    def load(self, filename, callbackFunction, columns=None):
+        """
+        Passes each valid LogEntry in 'filename' to 'callbackFunction' (see iterate(.)). Returns nothing.
+        """
+        for entry in self.iterate(filename, columns):
+            callbackFunction(entry)
+
+    def loadAll(self, filename, columns=None):
+        """
+        Returns a list with all the valid LogEntries in 'filename' (see iterate(.)).
+        """
+        return list(self.iterate(filename, columns))
+
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+
+def _encodeTimestamps(values):
+    """
+    Converts the JSON-encoded timestamp strings in 'values' into microseconds since the epoch. Returns None if
+    a value is not a timestamp that can be restored exactly from the integer.
+    """
+    timestamps = []
+    for value in values:
+        try:
+            timestamp = _parseTimestamp(json.loads(value))
+        except ValueError:
+            return None
+        if timestamp is None:
+            return None
+        timestamps.append(timestamp)
+    return timestamps
+
+
+def _parseTimestamp(string):
+    """
+    Returns the timestamp 'string' (in the format of 'timestamp-utc') in microseconds since the epoch, or None if
+    it is not a timestamp that can be restored exactly from the integer.
+    """
+    if not isinstance(string, basestring):
+        return None
+    try:
+        timestamp = _timestampValue(datetime.datetime.strptime(string, SegmentIndex.timestampFormat))
+    except ValueError:
+        return None
+    if _formatTimestamp(timestamp) != string:
+        return None
+    return timestamp
+
+
+def _timestampValue(dateTime):
+    delta = dateTime - _epoch
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _formatTimestamp(timestamp):
+    return (_epoch + datetime.timedelta(microseconds=timestamp)).strftime(SegmentIndex.timestampFormat)
+
+
+def _packTimestamps(table, codes):
+    """
+    Returns the little-endian 64-bit integers 'table[code]' for each code in 'codes'.
+    """
+    return _packInt64([table[code] for code in codes])
+
+
+def _packInt64(values):
+    """
+    Returns the little-endian 64-bit integers in the list 'values'.
+    """
+    chunks = []
+    for start in xrange(0, len(values), 65536):
+        chunk = values[start:start + 65536]
+        chunks.append(struct.pack("<%dq" % len(chunk), *chunk))
+    return "".join(chunks)
+
+
+def _packArray(values):
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+class LineIndex(object):
+    """
+    Index of the lines (records) in a file with one JSON-encoded report, log entry or policy per line. For each
+    record, the index contains its byte offset, its 'timestamp-utc' and its 'policy-type' (if present), so that
+    records can be accessed by number, time range or policy type without reading the whole file. The index can
+    be stored in a sidecar file (the name of the data file with the suffix .idx); it is considered out of date
+    if the size (on disk) or modification time of the data file has changed.
+
+    Sidecar format: the magic string, the length of the header (unsigned 32-bit integer), the JSON-encoded header
+    (number of records, size of the uncompressed data, size and modification time of the data file on disk, table
+    of policy types), the offsets and timestamps (64-bit integers,
+    microseconds since the epoch) and the policy type codes (unsigned 8-bit or 16-bit integers, index into the table
+    plus 1, or 0 if missing). All integers are little-endian.
+    """
+
+    magic = "CSPLINEINDEX2\n"
+    indexSuffix = ".idx"
+
+    def __init__(self, filename, offsets, timestamps, policyTypes, fileSize, fileStamp):
+        """
+        Creates a new LineIndex for the data file 'filename' of 'fileSize' (uncompressed) bytes. 'offsets',
+        'timestamps' and 'policyTypes' are lists with the byte offset, timestamp in microseconds since the epoch
+        (or None) and policy type (or None) of each record, in file order. 'fileStamp' is the (size on disk,
+        modification time) of the data file when it was indexed (see _fileStamp(.)).
+        """
+        self._filename = filename
+        self._offsets = offsets
+        self._timestamps = timestamps
+        self._policyTypes = policyTypes
+        self._fileSize = fileSize
+        self._fileStamp = fileStamp
+
+    @staticmethod
+    def build(filename, bufferSize=defaults.readBufferSize):
+        """
+        Reads the data file 'filename' and returns a new LineIndex for it (which is not stored automatically).
+        """
+        offsets = []
+        timestamps = []
+        policyTypes = []
+        offset = 0
+        fileStamp = _fileStamp(filename) # before reading, so that concurrent changes make the index out of date
+        with openDataFile(filename, "r", bufferSize) as f:
+            for line in f:
+                stripped = line.strip()
+                if stripped != "":
+                    (timestamp, policyType) = _recordMetadata(stripped)
+                    offsets.append(offset)
+                    timestamps.append(timestamp)
+                    policyTypes.append(policyType)
+                offset += len(line)
+        return LineIndex(filename, offsets, timestamps, policyTypes, offset, fileStamp)
+
+    @staticmethod
+    def load(filename):
+        """
+        Returns the LineIndex of the data file 'filename' stored in its sidecar file, or None if there is no
+        sidecar file or if it is out of date.
+        """
+        indexFile = filename + LineIndex.indexSuffix
+        if not os.path.exists(indexFile):
+            return None
+        with open(indexFile, "rb") as f:
+            data = f.read()
+        if not data.startswith(LineIndex.magic):
+            return None
+        (headerLength,) = struct.unpack_from("<I", data, len(LineIndex.magic))
+        position = len(LineIndex.magic) + 4
+        header = json.loads(data[position:position + headerLength])
+        fileStamp = (header["diskSize"], header["modified"])
+        if fileStamp != _fileStamp(filename):
+            return None
+        position += headerLength
+        count = header["count"]
+        offsets = list(struct.unpack_from("<%dq" % count, data, position))
+        position += 8 * count
+        timestamps = [None if timestamp == ColumnarWriter.missingTimestamp else timestamp
+                      for timestamp in struct.unpack_from("<%dq" % count, data, position)]
+        position += 8 * count
+        table = [None] + [policyType.encode("ascii") for policyType in header["policyTypes"]]
+        codes = array.array(str(header["codeType"]))
+        codes.fromstring(data[position:position + count * codes.itemsize])
+        if sys.byteorder == "big":
+            codes.byteswap()
+        policyTypes = map(table.__getitem__, codes)
+        return LineIndex(filename, offsets, timestamps, policyTypes, header["size"], fileStamp)
+
+    @staticmethod
+    def loadOrBuild(filename):
+        """
+        Returns the stored LineIndex of 'filename' if it is up to date, or builds a new one (without storing it).
+        """
+        index = LineIndex.load(filename)
+        if index is None:
+            index = LineIndex.build(filename)
+        return index
+
+    def store(self):
+        """
+        Writes this index into the sidecar file of the data file (replacing it atomically if it exists).
+        """
+        table = sorted(set(policyType for policyType in self._policyTypes if policyType is not None))
+        codeTable = dict((policyType, code + 1) for (code, policyType) in enumerate(table))
+        codeType = "B" if len(table) < 2 ** 8 else "H"
+        header = json.dumps({"count": self.getCount(), "size": self._fileSize, "diskSize": self._fileStamp[0],
+                             "modified": self._fileStamp[1], "policyTypes": table, "codeType": codeType})
+        indexFile = self._filename + LineIndex.indexSuffix
+        with open(indexFile + ".tmp", "wb") as f:
+            f.write(LineIndex.magic)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(_packInt64(self._offsets))
+            f.write(_packInt64([ColumnarWriter.missingTimestamp if timestamp is None else timestamp
+                                for timestamp in self._timestamps]))
+            f.write(_packArray(array.array(codeType, [codeTable.get(policyType, 0) for policyType in self._policyTypes])))
+        os.rename(indexFile + ".tmp", indexFile)
+
+    def getCount(self):
+        """Returns the number of records in the data file."""
+        return len(self._offsets)
+
+    def getRange(self, first, last=None):
+        """
+        Returns the byte range (start inclusive, end exclusive) of the records number 'first' (counting from 0)
+        up to, but excluding, record number 'last' (or the end of the file if None).
+        """
+        if last is None or last >= len(self._offsets):
+            end = self._fileSize
+        else:
+            end = self._offsets[last]
+        if first >= len(self._offsets):
+            return (end, end)
+        return (self._offsets[first], end)
+
+    def getFileSize(self):
+        """Returns the size of the data file in bytes (for compressed files, of the uncompressed data)."""
+        return self._fileSize
+
+    def getOffset(self, recordNumber):
+        """Returns the byte offset of record number 'recordNumber' (counting from 0)."""
+        return self._offsets[recordNumber]
+
+    def findRecords(self, start=None, end=None, policyType=None):
+        """
+        Returns a list with the numbers of the records that have a timestamp at or after the datetime 'start' and
+        before the datetime 'end', and the given 'policyType' (None for no restriction). Records without timestamp
+        match only if neither 'start' nor 'end' is set.
+        """
+        if start is not None:
+            start = _timestampValue(start)
+        if end is not None:
+            end = _timestampValue(end)
+        matches = []
+        for recordNumber in xrange(len(self._offsets)):
+            if policyType is not None and self._policyTypes[recordNumber] != policyType:
+                continue
+            timestamp = self._timestamps[recordNumber]
+            if start is not None or end is not None:
+                if timestamp is None or (start is not None and timestamp < start) \
+                        or (end is not None and timestamp >= end):
+                    continue
+            matches.append(recordNumber)
+        return matches
+
+    def getShards(self, count):
+        """
+        Splits the data file into at most 'count' byte ranges with approximately the same number of records.
+        Returns a list of (start, end) tuples (start inclusive, end exclusive) that cover the file.
+        """
+        records = len(self._offsets)
+        count = max(1, min(count, records))
+        boundaries = [records * i // count for i in xrange(count + 1)]
+        return [self.getRange(boundaries[i], boundaries[i + 1]) for i in xrange(count)]
+
+
+def _recordMetadata(line):
+    """
+    Returns the timestamp (in microseconds since the epoch, or None) and the policy type (or None) of the
+    JSON-encoded record in 'line'.
+    """
+    if not line.startswith("{"):
+        return (None, None)
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return (None, None)
+    if not isinstance(data, dict):
+        return (None, None)
+    timestamp = _parseTimestamp(data.get("timestamp-utc"))
+    policyType = data.get("policy-type")
+    if isinstance(policyType, basestring):
+        try:
+            return (timestamp, policyType.encode("ascii"))
+        except UnicodeError:
+            pass
+    return (timestamp, None)
+
+
+def _fileStamp(filename):
+    """
+    Returns the size on disk and the modification time of 'filename', which identify the version of the file
+    (also for compressed files, whose uncompressed size cannot be determined without decompressing them).
+    """
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime)
+
+
+def findLineRanges(filename, rangeSize):
+    """
+    Splits 'filename' into byte ranges of approximately 'rangeSize' bytes that are aligned to line
+    boundaries. Returns a list of (start, end) tuples (start inclusive, end exclusive) that cover the file.
+    Compressed files cannot be split efficiently and are returned as a single range.
+    """
+    if isCompressed(filename):
+        return [(0, sys.maxint)]
+    fileSize = os.path.getsize(filename)
+    ranges = []
+    start = 0
+    with open(filename, "r") as f:
+        while start < fileSize:
+            if start + rangeSize >= fileSize:
+                end = fileSize
+            else:
+                # the range ends after the line that contains its last byte
+                f.seek(start + rangeSize - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+class ParallelDataReader(object):
+    """
+    Loads Reports, LogEntries or Policies from large files with a pool of worker processes. The file is split
+    into line-aligned byte ranges, and each range is read and parsed by a worker with its own parser.
+    """
+
+    # the DataReader used by workers for each type of parser
+    _readerClasses = {ReportParser: ReportDataReader,
+                      LogEntryParser: LogEntryDataReader,
+                      PolicyParser: PolicyDataReader}
+
+    pendingRangesPerProcess = 2 # ranges submitted to the workers but not yet consumed, per process
+
+    def __init__(self, processes=None, parserClass=LogEntryParser, parserArgs=None, printErrorMessages=False,
+                 rangeSize=defaults.parallelRangeSize):
+        """
+        Creates a new ParallelDataReader.
+
+        'processes': the number of worker processes (if None, the number of CPUs).
+        'parserClass': ReportParser, LogEntryParser or PolicyParser; determines the type of objects loaded.
+        'parserArgs': a dictionary with the keyword arguments used to create the parser in each worker
+                      (None for the default configuration).
+        'rangeSize': the approximate number of bytes of the file that are parsed by a worker at once.
+        """
+        if not parserClass in ParallelDataReader._readerClasses:
+            raise ValueError("Unsupported parser class %s" % parserClass)
+        self._processes = processes
+        self._readerConfig = (parserClass, parserArgs or {}, printErrorMessages)
+        self._rangeSize = rangeSize
+
+    def iterate(self, filename):
+        """
+        Returns an iterator over the valid objects in 'filename', in file order. Objects are parsed in parallel
+        and streamed back from the workers one byte range at a time.
+        """
+        for objects in self.mapRanges(filename, list):
+            for obj in objects:
+                yield obj
+
+    def load(self, filename, callbackFunction):
+        """
+        Passes each valid object in 'filename' to 'callbackFunction', in file order. Returns nothing.
+        """
+        for obj in self.iterate(filename):
+            callbackFunction(obj)
+
+    def loadAll(self, filename):
+        """
+        Returns a list with all the valid objects in 'filename', in file order.
+        """
+        return list(self.iterate(filename))
+
+    def mapRanges(self, filename, reduceFunction):
+        """
+        Returns an iterator over the results of 'reduceFunction' for each byte range of 'filename', in file order.
+        'reduceFunction' is called in the worker processes with an iterator over the valid objects in one range,
+        so that only the (small) result needs to be sent back to the main process. It must be a module-level
+        function (or another picklable callable), and its results must be picklable. If the file has an up-to-date
+        LineIndex, the ranges are split so that each contains approximately the same number of records.
+        At most ParallelDataReader.pendingRangesPerProcess ranges per worker process are submitted but not yet
+        returned, so that a slow consumer does not cause the results of the whole file to be held in memory.
+        """
+        index = LineIndex.load(filename)
+        if index is not None:
+            shards = index.getFileSize() // self._rangeSize + 1
+            ranges = index.getShards(shards)
+        else:
+            ranges = findLineRanges(filename, self._rangeSize)
+        processes = self._processes or multiprocessing.cpu_count()
+        maxPending = ParallelDataReader.pendingRangesPerProcess * processes
+        pool = multiprocessing.Pool(processes, _initWorker, self._readerConfig)
+        try:
+            tasks = iter([(filename, start, end, reduceFunction) for (start, end) in ranges])
+            pending = collections.deque(pool.apply_async(_reduceRange, (task,))
+                                        for task in itertools.islice(tasks, maxPending))
+            while len(pending) > 0:
+                yield pending.popleft().get()
+                # submit the next range only after the consumer has taken a result
+                for task in itertools.islice(tasks, 1):
+                    pending.append(pool.apply_async(_reduceRange, (task,)))
+            pool.close()
+        except:
+            # also if the iterator is discarded early: stop the workers without waiting for the remaining ranges
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
+# state of worker processes of ParallelDataReader
+_workerReader = None
+
+
+def _initWorker(parserClass, parserArgs, printErrorMessages):
+    global _workerReader
+    readerClass = ParallelDataReader._readerClasses[parserClass]
+    _workerReader = readerClass(printErrorMessages, parserClass(**parserArgs))
+
 
+def _reduceRange((filename, start, end, reduceFunction)):
+    return reduceFunction(_workerReader.iterateRange(filename, start, end))
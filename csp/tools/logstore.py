@@ -0,0 +1,259 @@
+'''
+Stores LogEntries in an SQLite database and retrieves them with indexed queries, for example all
+'script-src' violations on a given origin during a given week. Policies, directives, URIs and user
+agents are stored in separate tables (each distinct string only once), and the log entries reference
+them. The fields that are not normalised are stored as JSON. Query results are parsed back into
+LogEntries with a LogEntryParser.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import json
+import sqlite3
+from csp.directive import Directive
+from csp.log import LogEntry, LogEntryParser
+from csp.reportjsonencoder import ReportJSONEncoder
+from csp.uri import URI
+from csp.tools.fileio import iterLogEntries, SegmentIndex
+import csp.defaults as defaults
+
+
+class LogEntryStore(object):
+    """
+    SQLite database of LogEntries. Not thread-safe.
+    """
+
+    # normalised tables: table name -> (column with the string value)
+    _valueTables = {"uris": "uri", "directives": "directive", "policies": "policy", "userAgents": "userAgent"}
+
+    # fields of log entries and their 'csp-report' that are stored in the entries table
+    _entryColumns = {"timestamp-utc": "timestamp", "policy-type": "policyType", "http-user-agent": "userAgent"}
+    _reportColumns = {"document-uri": "documentURI", "blocked-uri": "blockedURI",
+                      "violated-directive": "violatedDirective", "original-policy": "originalPolicy"}
+
+    def __init__(self, filename, parser=None):
+        """
+        Opens (or creates) the database 'filename'. 'parser' is the LogEntryParser used to convert query results
+        into LogEntries (if None, a LogEntryParser with the default configuration will be used).
+        """
+        if parser is None:
+            parser = LogEntryParser()
+        self._parser = parser
+        self._connection = sqlite3.connect(filename, timeout=60)
+        self._ids = {} # table name -> {string value -> id}
+        self._createTables()
+
+    def store(self, logEntry):
+        """
+        Adds the LogEntry 'logEntry' to the database.
+        """
+        self.storeAll((logEntry,))
+
+    def storeAll(self, logEntries):
+        """
+        Adds all the LogEntries from the iterable 'logEntries' to the database (in one transaction). Returns the
+        number of log entries added.
+        """
+        count = 0
+        try:
+            with self._connection:
+                batch = []
+                for logEntry in logEntries:
+                    batch.append(self._row(logEntry))
+                    if len(batch) >= defaults.writeBatchSize:
+                        self._insert(batch)
+                        count += len(batch)
+                        batch = []
+                self._insert(batch)
+                count += len(batch)
+        except:
+            # the transaction has been rolled back, so the cached ids of values added in it are invalid
+            self._ids = {}
+            raise
+        return count
+
+    def storeFile(self, filename, parser=None):
+        """
+        Adds all valid LogEntries in 'filename' (see LogEntryDataReader) to the database. 'parser' is the
+        LogEntryParser used to parse the file (if None, a LogEntryParser with the default configuration will
+        be used). Returns the number of log entries added.
+        """
+        return self.storeAll(iterLogEntries(filename, parser))
+
+    def query(self, documentOrigin=None, blockedHost=None, directiveType=None, policyType=None, start=None,
+              end=None, limit=None):
+        """
+        Returns an iterator over the LogEntries that match all the given criteria (None for no restriction),
+        ordered by timestamp.
+
+        'documentOrigin': the scheme, host and port (if any) of the 'document-uri', as a string such as
+                          "http://seclab.nu" or as a URI.
+        'blockedHost': the host of the 'blocked-uri'.
+        'directiveType': the type of the 'violated-directive', such as "script-src".
+        'policyType': the 'policy-type' of the log entry.
+        'start', 'end': datetimes; log entries with a timestamp at or after 'start' and before 'end' match.
+        'limit': the maximum number of log entries returned.
+        """
+        (where, parameters) = self._conditions(documentOrigin, blockedHost, directiveType, policyType, start, end)
+        sql = "SELECT e.timestamp, e.policyType, a.userAgent, d.uri, b.uri, v.directive, p.policy, e.extra " \
+                + "FROM entries e LEFT JOIN userAgents a ON e.userAgent = a.id " \
+                + "LEFT JOIN uris d ON e.documentURI = d.id LEFT JOIN uris b ON e.blockedURI = b.id " \
+                + "LEFT JOIN directives v ON e.violatedDirective = v.id " \
+                + "LEFT JOIN policies p ON e.originalPolicy = p.id" + where + " ORDER BY e.timestamp, e.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        for row in self._connection.execute(sql, parameters):
+            logEntry = self._parser.parseJsonDict(self._jsonLogEntry(row))
+            if logEntry != LogEntry.INVALID():
+                yield logEntry
+
+    def count(self, documentOrigin=None, blockedHost=None, directiveType=None, policyType=None, start=None,
+              end=None):
+        """
+        Returns the number of log entries that match all the given criteria (see query(.)).
+        """
+        (where, parameters) = self._conditions(documentOrigin, blockedHost, directiveType, policyType, start, end)
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM entries e" + where, parameters).fetchone()
+        return count
+
+    def close(self):
+        """Closes the database."""
+        self._connection.close()
+
+    def _createTables(self):
+        with self._connection:
+            for (table, column) in LogEntryStore._valueTables.iteritems():
+                self._connection.execute("CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY, %s TEXT UNIQUE)"
+                                         % (table, column))
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, timestamp TEXT, "
+                                     + "policyType TEXT, userAgent INTEGER, documentURI INTEGER, documentOrigin TEXT, "
+                                     + "blockedURI INTEGER, blockedHost TEXT, violatedDirective INTEGER, "
+                                     + "directiveType TEXT, originalPolicy INTEGER, extra TEXT)")
+            for columns in (("documentOrigin", "directiveType", "timestamp"), ("blockedHost", "timestamp"),
+                            ("directiveType", "timestamp"), ("policyType", "timestamp"), ("timestamp",)):
+                self._connection.execute("CREATE INDEX IF NOT EXISTS entries_%s ON entries (%s)"
+                                         % ("_".join(columns), ", ".join(columns)))
+
+    def _row(self, logEntry):
+        """
+        Returns the values of the entries table for 'logEntry'.
+        """
+        report = logEntry.get("csp-report", {})
+        extraEntry = dict((key, value) for (key, value) in logEntry.iteritems()
+                          if key != "csp-report" and not key in LogEntryStore._entryColumns)
+        extraReport = dict((key, value) for (key, value) in report.iteritems()
+                           if not key in LogEntryStore._reportColumns)
+        documentURI = report.get("document-uri")
+        blockedURI = report.get("blocked-uri")
+        directive = report.get("violated-directive")
+        return (_string(logEntry.get("timestamp-utc")),
+                _string(logEntry.get("policy-type")),
+                self._id("userAgents", logEntry.get("http-user-agent")),
+                self._id("uris", documentURI),
+                _origin(documentURI),
+                self._id("uris", blockedURI),
+                _host(blockedURI),
+                self._id("directives", directive),
+                directive.getType() if isinstance(directive, Directive) and directive.isRegularDirective() else None,
+                self._id("policies", report.get("original-policy")),
+                json.dumps({"entry": extraEntry, "report": extraReport}, cls=ReportJSONEncoder))
+
+    def _insert(self, rows):
+        self._connection.executemany("INSERT INTO entries (timestamp, policyType, userAgent, documentURI, "
+                                     + "documentOrigin, blockedURI, blockedHost, violatedDirective, directiveType, "
+                                     + "originalPolicy, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _id(self, table, value):
+        """
+        Returns the id of (the string representation of) 'value' in the normalised 'table', adding it if necessary.
+        Returns None if 'value' is None.
+        """
+        if value is None:
+            return None
+        value = _string(value)
+        ids = self._ids.get(table)
+        if ids is None:
+            ids = dict((value, valueId) for (valueId, value)
+                       in self._connection.execute("SELECT id, %s FROM %s" % (LogEntryStore._valueTables[table], table)))
+            self._ids[table] = ids
+        valueId = ids.get(value)
+        if valueId is None:
+            valueId = self._connection.execute("INSERT INTO %s (%s) VALUES (?)"
+                                               % (table, LogEntryStore._valueTables[table]), (value,)).lastrowid
+            ids[value] = valueId
+        return valueId
+
+    def _conditions(self, documentOrigin, blockedHost, directiveType, policyType, start, end):
+        """
+        Returns the WHERE clause and its parameters for the given query criteria (see query(.)).
+        """
+        conditions = []
+        parameters = []
+        if documentOrigin is not None:
+            if isinstance(documentOrigin, URI):
+                documentOrigin = _origin(documentOrigin)
+            conditions.append("e.documentOrigin = ?")
+            parameters.append(documentOrigin)
+        for (column, value) in (("blockedHost", blockedHost), ("directiveType", directiveType),
+                                ("policyType", policyType)):
+            if value is not None:
+                conditions.append("e.%s = ?" % column)
+                parameters.append(value)
+        if start is not None:
+            conditions.append("e.timestamp >= ?")
+            parameters.append(start.strftime(SegmentIndex.timestampFormat))
+        if end is not None:
+            conditions.append("e.timestamp < ?")
+            parameters.append(end.strftime(SegmentIndex.timestampFormat))
+        if len(conditions) == 0:
+            return ("", parameters)
+        return (" WHERE " + " AND ".join(conditions), parameters)
+
+    def _jsonLogEntry(self, row):
+        """
+        Returns the log entry of a query result 'row' as a JSON dictionary (as if it had been read from a file).
+        """
+        (timestamp, policyType, userAgent, documentURI, blockedURI, directive, policy, extra) = row
+        extra = json.loads(extra)
+        jsonLogEntry = extra["entry"]
+        jsonReport = extra["report"]
+        for (key, value) in (("timestamp-utc", timestamp), ("policy-type", policyType),
+                             ("http-user-agent", userAgent)):
+            if value is not None:
+                jsonLogEntry[key] = value
+        for (key, value) in (("document-uri", documentURI), ("blocked-uri", blockedURI),
+                             ("violated-directive", directive), ("original-policy", policy)):
+            if value is not None:
+                jsonReport[key] = value
+        jsonLogEntry["csp-report"] = jsonReport
+        return jsonLogEntry
+
+
+def _string(value):
+    """
+    Returns 'value' as a (unicode) string for storing in the database, or None if 'value' is None.
+    """
+    if value is None or isinstance(value, unicode):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return value.decode("utf-8", "replace")
+
+
+def _origin(uri):
+    """
+    Returns the origin (scheme, host and port) of 'uri' as a string, or None if 'uri' has no origin.
+    """
+    if not isinstance(uri, URI) or not uri.isRegularURI() or uri.getScheme() in defaults.schemeOnly:
+        return None
+    return _string(uri.removePath())
+
+
+def _host(uri):
+    """
+    Returns the host of 'uri', or None if 'uri' has no host.
+    """
+    if not isinstance(uri, URI) or not uri.isRegularURI() or uri.getScheme() in defaults.schemeOnly:
+        return None
+    return _string(uri.getHost())
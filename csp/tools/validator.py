@@ -0,0 +1,250 @@
+'''
+Re-checks CSP violation reports against the policy contained in the report. Browsers sometimes send
+reports for resources that are actually allowed by the policy. 'ReportValidator' matches the
+'blocked-uri' of each report with the 'original-policy' for the type of the 'violated-directive' and
+classifies the report as a genuine violation, a bogus report, or a report that cannot be checked.
+Each distinct policy is parsed and compiled only once. Files with reports or log entries can be
+validated in a single process or with a pool of worker processes.
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import multiprocessing
+from csp.cache import LRUCache
+from csp.directive import Directive
+from csp.log import LogEntry, LogEntryParser
+from csp.policy import Policy, PolicyParser
+from csp.report import Report, ReportParser
+from csp.uri import URI
+from csp.tools.fileio import ReportDataReader, LogEntryDataReader, openDataFile
+import csp.defaults as defaults
+
+
+class ReportValidator(object):
+    """
+    Validates Reports and LogEntries by matching the blocked resource with the original policy.
+    Counts the verdicts of all validated Reports and LogEntries.
+    """
+
+    VIOLATION = "violation" # the policy does not allow the blocked resource (genuine report)
+    BOGUS = "bogus" # the policy allows the blocked resource
+    UNCHECKED = "unchecked" # the report does not contain enough information to be checked
+
+    def __init__(self, policyParser=None, schemePortMappings=defaults.schemePortMappings,
+                 defaultSrcTypes=defaults.defaultSrcReplacementDirectiveTypes, cacheSize=defaults.policyCacheSize):
+        """
+        Creates a new ReportValidator configured with the following parameters:
+        'policyParser': the PolicyParser used to parse 'original-policy' strings (if None, a PolicyParser with
+                        the default configuration will be used).
+        'schemePortMappings': passed on to Policy.matches(.).
+        'defaultSrcTypes': passed on to Policy.matches(.).
+        'cacheSize': the maximum number of distinct policies that are kept in parsed and compiled form.
+        """
+        if policyParser is None:
+            policyParser = PolicyParser()
+        self._config = (policyParser, schemePortMappings, defaultSrcTypes, cacheSize)
+        self._policyParser = policyParser
+        self._schemePortMappings = schemePortMappings
+        self._defaultSrcTypes = defaultSrcTypes
+        self._policies = LRUCache(cacheSize) # policy string or Policy -> CompiledPolicy
+        self._counts = ReportValidator._emptyCounts()
+
+    def validateReport(self, report, policyType=None):
+        """
+        Returns the verdict for the given 'report' (ReportValidator.VIOLATION, BOGUS or UNCHECKED).
+        'policyType' is the type of the report ('regular', 'eval' or 'inline', see LogEntry), or None if
+        unknown. For 'eval' and 'inline' reports, the blocked resource is URI.EVAL() or URI.INLINE(),
+        respectively, otherwise it is the 'blocked-uri' of the report. 'original-policy' may be a Policy
+        or a policy string (which will be parsed).
+        """
+        verdict = self._validate(report, policyType)
+        self._counts[verdict] += 1
+        return verdict
+
+    def validateLogEntry(self, entry):
+        """
+        Returns the verdict for the Report contained in the given LogEntry, using the 'policy-type' of the
+        LogEntry (see validateReport(.)).
+        """
+        if 'csp-report' not in entry:
+            self._counts[ReportValidator.UNCHECKED] += 1
+            return ReportValidator.UNCHECKED
+        return self.validateReport(entry['csp-report'], entry.get('policy-type'))
+
+    def validate(self, reportOrEntry):
+        """
+        Returns the verdict for the given Report or LogEntry.
+        """
+        if type(reportOrEntry) == LogEntry:
+            return self.validateLogEntry(reportOrEntry)
+        else:
+            return self.validateReport(reportOrEntry)
+
+    def validateAll(self, reportsOrEntries):
+        """
+        Generator that validates each Report or LogEntry in the iterable 'reportsOrEntries' and yields
+        (Report or LogEntry, verdict) tuples.
+        """
+        for reportOrEntry in reportsOrEntries:
+            yield (reportOrEntry, self.validate(reportOrEntry))
+
+    def validateFile(self, filename, callbackFunction=None, logEntries=True, processes=1,
+                     chunkSize=defaults.validatorChunkSize):
+        """
+        Validates all valid Reports or LogEntries in 'filename' (one per line, see ReportDataReader and
+        LogEntryDataReader) and returns a dictionary with the number of reports for each verdict. 'original-policy'
+        strings are not parsed by the data reader, but by this ReportValidator (once for each distinct policy).
+
+        'callbackFunction': if not None, will be called with each (Report or LogEntry, verdict) in file order.
+        'logEntries': whether the file contains LogEntries (if True) or Reports (if False).
+        'processes': the number of worker processes. If larger than 1, the file is parsed and validated in
+                     chunks of 'chunkSize' lines by a pool of worker processes, each with its own ReportValidator.
+        """
+        counts = ReportValidator._emptyCounts()
+        if processes <= 1:
+            def handle(reportOrEntry):
+                verdict = self.validate(reportOrEntry)
+                counts[verdict] += 1
+                if callbackFunction is not None:
+                    callbackFunction(reportOrEntry, verdict)
+            _createDataReader(logEntries).load(filename, handle)
+            return counts
+
+        pool = multiprocessing.Pool(processes, _initWorker, (self._config, logEntries, callbackFunction is not None))
+        try:
+            for results in pool.imap(_validateLines, _readChunks(filename, chunkSize)):
+                for (reportOrEntry, verdict) in results:
+                    counts[verdict] += 1
+                    self._counts[verdict] += 1
+                    if callbackFunction is not None:
+                        callbackFunction(reportOrEntry, verdict)
+        finally:
+            pool.close()
+            pool.join()
+        return counts
+
+    def getCounts(self):
+        """
+        Returns a dictionary with the number of reports validated so far for each verdict.
+        """
+        return self._counts.copy()
+
+    def _validate(self, report, policyType):
+        if report == Report.INVALID():
+            return ReportValidator.UNCHECKED
+        violated = report.get('violated-directive')
+        blocked = report.get('blocked-uri')
+        documentURI = report.get('document-uri')
+        originalPolicy = report.get('original-policy')
+        if (type(violated) != Directive or violated == Directive.INVALID()
+            or type(documentURI) != URI or not documentURI.isRegularURI()
+            or originalPolicy is None):
+            return ReportValidator.UNCHECKED
+
+        if policyType == 'inline':
+            resourceURI = URI.INLINE()
+        elif policyType == 'eval':
+            resourceURI = URI.EVAL()
+        elif type(blocked) == URI and (blocked.isRegularURI() or blocked in (URI.INLINE(), URI.EVAL())):
+            resourceURI = blocked
+        elif violated in (Directive.INLINE_SCRIPT_BASE_RESTRICTION(), Directive.INLINE_STYLE_BASE_RESTRICTION()):
+            resourceURI = URI.INLINE()
+        elif violated == Directive.EVAL_SCRIPT_BASE_RESTRICTION():
+            resourceURI = URI.EVAL()
+        else:
+            return ReportValidator.UNCHECKED
+
+        compiledPolicy = self._compiledPolicy(originalPolicy)
+        if compiledPolicy is None:
+            return ReportValidator.UNCHECKED
+        if compiledPolicy.matches(resourceURI, violated.getType(), documentURI, self._schemePortMappings,
+                                  self._defaultSrcTypes):
+            return ReportValidator.BOGUS
+        else:
+            return ReportValidator.VIOLATION
+
+    def _compiledPolicy(self, originalPolicy):
+        """
+        Returns the CompiledPolicy for the given Policy or policy string, or None if the policy is invalid.
+        """
+        compiledPolicy = self._policies.get(originalPolicy)
+        if compiledPolicy is None:
+            if type(originalPolicy) == Policy:
+                policy = originalPolicy
+            else:
+                policy = self._policyParser.parse(originalPolicy)
+            compiledPolicy = policy.compile()
+            self._policies.put(originalPolicy, compiledPolicy)
+        if compiledPolicy.getPolicy() == Policy.INVALID():
+            return None
+        return compiledPolicy
+
+    @staticmethod
+    def _emptyCounts():
+        return {ReportValidator.VIOLATION: 0, ReportValidator.BOGUS: 0, ReportValidator.UNCHECKED: 0}
+
+
+def _createParser(logEntries):
+    """
+    Returns a LogEntryParser or ReportParser that does not parse 'original-policy' (this is done by the
+    ReportValidator to parse each distinct policy only once).
+    """
+    if logEntries:
+        return LogEntryParser(policyKeys=())
+    else:
+        return ReportParser(policyKeys=())
+
+
+def _createDataReader(logEntries):
+    if logEntries:
+        return LogEntryDataReader(parser=_createParser(True))
+    else:
+        return ReportDataReader(parser=_createParser(False))
+
+
+def _readChunks(filename, chunkSize):
+    """
+    Generator that yields lists of at most 'chunkSize' non-empty lines from 'filename'.
+    """
+    chunk = []
+    with openDataFile(filename) as f:
+        for line in f:
+            line = line.strip()
+            if line != "":
+                chunk.append(line)
+                if len(chunk) >= chunkSize:
+                    yield chunk
+                    chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+# state of worker processes in the process pool mode of ReportValidator.validateFile(.)
+_workerValidator = None
+_workerParser = None
+_workerReturnObjects = False
+
+
+def _initWorker(validatorConfig, logEntries, returnObjects):
+    global _workerValidator, _workerParser, _workerReturnObjects
+    _workerValidator = ReportValidator(*validatorConfig)
+    _workerParser = _createParser(logEntries)
+    _workerReturnObjects = returnObjects
+
+
+def _validateLines(lines):
+    """
+    Parses and validates the given lines in a worker process. Returns a list of (Report or LogEntry, verdict)
+    tuples for the valid lines; the Report or LogEntry is None unless requested by the main process.
+    """
+    results = []
+    for line in lines:
+        reportOrEntry = _workerParser.parseString(line)
+        if reportOrEntry is Report.INVALID() or reportOrEntry is LogEntry.INVALID():
+            continue
+        verdict = _workerValidator.validate(reportOrEntry)
+        if _workerReturnObjects:
+            results.append((reportOrEntry, verdict))
+        else:
+            results.append((None, verdict))
+    return results
@@ -18,6 +18,8 @@ class URI(object):
     that can be accessed by calling the respective class method (INVALID(), EMPTY(), etc.).
     """
     
+    __slots__ = ("_hash", "_str", "_scheme", "_host", "_port", "_path", "_query", "_isRegularURI", "__weakref__")
+    
     _invalid = None
     _empty = None
     _inline = None
@@ -198,6 +200,8 @@ class URI(object):
         """
         Returns True if both URI objects represent the same URI (component-wise equality).
         """
+        if self is other:
+            return True
         if type(other) != URI:
             return False
         return (self._scheme == other._scheme 
@@ -222,11 +226,13 @@ class URIParser(object):
     Pre-configured object that parses strings into URIs.
     """
     
+    schemeRE = re.compile(r"""[A-Za-z0-9+.-]+\Z""")
+    hostPortRE = re.compile(r"""^(?P<host>[A-Za-z0-9._-]+)(:(?P<port>[0-9]+))?$""", re.IGNORECASE)
     netlocRE = re.compile(r"""^((?P<user>[A-Za-z0-9`~\!#\$%^&*\(\)_+=\{\}\[\]\\\|;"<>,\./\?-]+)(:(?P<password>[A-Za-z0-9`~\!#\$%^&*\(\)_+=\{\}\[\]\\\|;"<>,\./\?-]+))?@)?(?P<host>[A-Za-z0-9._-]+)(:(?P<port>[0-9]+))?$""", re.IGNORECASE)
     
     def __init__(self, addScheme=True, defaultScheme=defaults.defaultURIScheme, addPort=False, 
                  defaultPort=defaults.defaultURIPort, schemePortMappings=defaults.schemePortMappings,
-                 portSchemeMappings=defaults.portSchemeMappings, decodeEscapedCharacters=True):
+                 portSchemeMappings=defaults.portSchemeMappings, decodeEscapedCharacters=True, useFastPath=True):
         """
         Creates a new URIParser object configured with the following parameters:
         addScheme: if set to True, the scheme will be added to the URI if not present in the parsed string. If a port
@@ -241,6 +247,8 @@ class URIParser(object):
         portSchemeMappings: a mapping from port numbers to (lowercase) scheme names.
         decodeEscapedCharacters: if set to True, %-encoded characters in the path component will be decoded after the
                                  URI has been split. This does NOT include the query parameters.
+        useFastPath: if set to True, common http/https URIs and URIs without scheme are parsed in a single pass
+                     instead of using urlparse. The resulting URI objects are identical.
         """
         self.addScheme = addScheme
         self.defaultScheme = defaultScheme
@@ -249,11 +257,32 @@ class URIParser(object):
         self.schemePortMappings = schemePortMappings.copy()
         self.portSchemeMappings = portSchemeMappings.copy()
         self.decodeEscapedCharacters = decodeEscapedCharacters
+        self.useFastPath = useFastPath
         self._convertPortToInt = True
+        self._configKey = None
+        
+    def getConfigKey(self):
+        """
+        Returns a hashable key that is equal for two URIParsers if and only if they are configured identically
+        (and thus return equal URIs for the same string). The key is computed only once; the configuration
+        should not be changed afterwards.
+        """
+        if self._configKey is None:
+            self._configKey = (type(self), self.addScheme, self.defaultScheme, self.addPort, self.defaultPort,
+                               frozenset(self.schemePortMappings.iteritems()),
+                               frozenset(self.portSchemeMappings.iteritems()),
+                               self.decodeEscapedCharacters, self._convertPortToInt)
+        return self._configKey
         
     def _getRE(self):
         return URIParser.netlocRE
     
+    def _getHostPortRE(self):
+        """
+        Returns the regular expression for netloc parts without user name and password (used by the fast path).
+        """
+        return URIParser.hostPortRE
+    
     def parse(self, uriString):
         """
         Parses the given 'uriString' according to the parameters set in the constructor of this URIParser and returns
@@ -275,19 +304,81 @@ class URIParser(object):
         """
         
         uriString = uriString.strip()
+        lowerURIString = uriString.lower()
         
         # empty URI
-        if uriString == "" or uriString.lower() == "null":
+        if uriString == "" or lowerURIString == "null":
             return URI.EMPTY()
         
         # (known) scheme only, nothing else
-        if uriString.lower() in self.schemePortMappings:
-            return URI(uriString.lower(), "", None, None, None)
-        elif uriString[-1:] == ":" and uriString[:-1].lower() in self.schemePortMappings:
-            return URI(uriString[:-1].lower(), "", None, None, None)
-        elif uriString[-3:] == "://" and uriString[:-3].lower() in self.schemePortMappings:
-            return URI(uriString[:-3].lower(), "", None, None, None)
+        if lowerURIString in self.schemePortMappings:
+            return URI(lowerURIString, "", None, None, None)
+        elif lowerURIString[-1:] == ":" and lowerURIString[:-1] in self.schemePortMappings:
+            return URI(lowerURIString[:-1], "", None, None, None)
+        elif lowerURIString[-3:] == "://" and lowerURIString[:-3] in self.schemePortMappings:
+            return URI(lowerURIString[:-3], "", None, None, None)
+        
+        if self.useFastPath:
+            uri = self._parseFast(uriString, lowerURIString)
+            if uri is not None:
+                return uri
+        return self._parseSlow(uriString)
+    
+    def _parseFast(self, uriString, lowerURIString):
+        """
+        Single-pass parser for the common cases of http/https URIs and URIs without scheme. Returns None for
+        all other (or unusual) URIs, which must be parsed with _parseSlow(.). The results are identical to those
+        of _parseSlow(.).
+        """
+        if lowerURIString.startswith("http://"):
+            scheme = lowerURIString[:4]
+            netlocStart = 7
+        elif lowerURIString.startswith("https://"):
+            scheme = lowerURIString[:5]
+            netlocStart = 8
+        else:
+            if uriString[:2] == "//":
+                return None
+            colon = uriString.find(":")
+            if (colon > 0 and URIParser.schemeRE.match(uriString, 0, colon) is not None
+                and (uriString[colon + 1:colon + 3] == "//"
+                     or lowerURIString[:colon] in defaults.schemesWithNoDoubleSlash)):
+                return None # would be parsed as a scheme by urlparse
+            # parsed by _parseSlow(.) as if it had the http scheme
+            scheme = None
+            netlocStart = 0
+        
+        # the netloc ends with the first '/', '?' or '#'
+        netlocEnd = len(uriString)
+        for delimiter in "/?#":
+            pos = uriString.find(delimiter, netlocStart, netlocEnd)
+            if pos >= 0:
+                netlocEnd = pos
+        netloc = uriString[netlocStart:netlocEnd]
+        if "@" in netloc:
+            return None
+        netlocMatch = self._getHostPortRE().match(netloc)
+        if netlocMatch is None:
+            return None
+        
+        path = uriString[netlocEnd:]
+        fragmentStart = path.find("#")
+        if fragmentStart >= 0:
+            path = path[:fragmentStart]
+        query = ""
+        queryStart = path.find("?")
+        if queryStart >= 0:
+            query = path[queryStart + 1:]
+            path = path[:queryStart]
+        if ";" in path:
+            return None # urlparse removes parameters from the path
         
+        return self._createURI(scheme, netlocMatch, path, query)
+    
+    def _parseSlow(self, uriString):
+        """
+        Parses URIs of any form using urlparse (see parse(.) for details).
+        """
         res = urlparse.urlparse(uriString, allow_fragments=True)
         scheme = res.scheme.lower()
         netloc = res.netloc
@@ -316,6 +407,12 @@ class URIParser(object):
         netlocMatch = self._getRE().match(netloc)
         if netlocMatch is None:
             return URI.INVALID() # probably using an unsupported symbol
+        return self._createURI(scheme, netlocMatch, path, query)
+    
+    def _createURI(self, scheme, netlocMatch, path, query):
+        """
+        Creates the URI from the split components ('netlocMatch' is the match of the netloc regular expression).
+        """
         host = netlocMatch.group("host").lower()
         port = netlocMatch.group("port") # number or None
         if port is not None and self._convertPortToInt:
@@ -337,7 +434,10 @@ class URIParser(object):
         
         if self.decodeEscapedCharacters:
             # urllib.unquote cannot handle unicode strings
-            path = urllib.unquote(path.encode("ascii")).decode("utf8")
+            if "%" in path:
+                path = urllib.unquote(path.encode("ascii")).decode("utf8")
+            else:
+                path = path.encode("ascii").decode("utf8")
         if path == "":
             path = None
             
@@ -345,4 +445,3 @@ class URIParser(object):
             query = None
             
         return URI(scheme, host, port, path, query)
-
@@ -0,0 +1,132 @@
+'''
+Tests for cache.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import unittest
+from csp.cache import LRUCache, MatchCache, URIParseCache
+from csp.policy import Policy
+from csp.directive import Directive
+from csp.sourceexpression import URISourceExpression
+from csp.uri import URI, URIParser
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def testLRUCache_getPut(self):
+        cache = LRUCache(10)
+        assert cache.get("a") is None
+        assert cache.get("a", 42) == 42
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        assert "a" in cache
+        assert len(cache) == 1
+        assert cache.getHits() == 1
+        assert cache.getMisses() == 2
+
+    def testLRUCache_evictLeastRecentlyUsed(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3) # evicts "b"
+        assert "a" in cache and "c" in cache and "b" not in cache
+        cache.put("a", 4) # update, no eviction
+        cache.put("d", 5) # evicts "c"
+        assert "c" not in cache
+        assert cache.get("a") == 4
+        assert len(cache) == 2
+        assert cache.getEvictions() == 2
+
+    def testLRUCache_zeroSize(self):
+        cache = LRUCache(0)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def testLRUCache_hitRate(self):
+        cache = LRUCache(2)
+        assert cache.getHitRate() == 0.0
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        assert cache.getHitRate() == 0.5
+
+    def testLRUCache_clear(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.clear()
+        assert len(cache) == 0
+        cache.put("b", 2)
+        cache.put("c", 3)
+        assert cache.get("b") == 2
+        assert cache.getEvictions() == 0
+
+
+class MatchCacheTest(unittest.TestCase):
+
+    directive = Directive("img-src", (URISourceExpression("http", "seclab.nu", None, None),))
+    policy = Policy((directive,))
+    documentURI = URI("http", "seclab.ccs.neu.edu", None, None, None)
+    matchingURI = URI("http", "seclab.nu", None, "/image.png", None)
+    otherURI = URI("http", "example.com", None, None, None)
+
+    def testMatchCache_policyMatches(self):
+        for compiled in (False, True):
+            cache = MatchCache(10, compiled=compiled)
+            for _ in range(3):
+                assert cache.policyMatches(MatchCacheTest.policy, MatchCacheTest.matchingURI, "img-src",
+                                           MatchCacheTest.documentURI)
+                assert not cache.policyMatches(MatchCacheTest.policy, MatchCacheTest.otherURI, "IMG-SRC",
+                                               MatchCacheTest.documentURI)
+            assert cache.getMisses() == 2
+            assert cache.getHits() == 4
+
+    def testMatchCache_directiveMatches(self):
+        cache = MatchCache(1)
+        equalDirective = Directive("img-src", (URISourceExpression("http", "seclab.nu", None, None),))
+        assert cache.directiveMatches(MatchCacheTest.directive, MatchCacheTest.matchingURI, MatchCacheTest.documentURI)
+        assert cache.directiveMatches(equalDirective, MatchCacheTest.matchingURI, MatchCacheTest.documentURI)
+        assert not cache.directiveMatches(equalDirective, MatchCacheTest.otherURI, MatchCacheTest.documentURI)
+        assert cache.getHits() == 1
+        assert cache.getMisses() == 2
+        assert cache.getEvictions() == 1
+        assert len(cache.getCache()) == 1
+
+
+
+class URIParseCacheTest(unittest.TestCase):
+
+    def testURIParseCache_parse(self):
+        cache = URIParseCache(10)
+        parser = URIParser(addScheme=False)
+        uri = cache.parse(parser, u"http://seclab.nu/path")
+        assert uri == parser.parse(u"http://seclab.nu/path")
+        assert cache.parse(URIParser(addScheme=False), u"http://seclab.nu/path") is uri
+        assert cache.getHits() == 1
+        assert cache.getMisses() == 1
+        assert cache.getHitRate() == 0.5
+
+    def testURIParseCache_parserConfiguration(self):
+        cache = URIParseCache(10)
+        uriWithPort = cache.parse(URIParser(addPort=True), u"http://seclab.nu")
+        uriWithoutPort = cache.parse(URIParser(addPort=False), u"http://seclab.nu")
+        assert uriWithPort == URI("http", "seclab.nu", 80, None, None)
+        assert uriWithoutPort == URI("http", "seclab.nu", None, None, None)
+        assert cache.getMisses() == 2
+        assert URIParser(addPort=True).getConfigKey() == URIParser(addPort=True).getConfigKey()
+        assert URIParser(addPort=True).getConfigKey() != URIParser(addPort=False).getConfigKey()
+
+    def testURIParseCache_eviction(self):
+        cache = URIParseCache(1)
+        parser = URIParser()
+        cache.parse(parser, u"http://seclab.nu")
+        cache.parse(parser, u"http://example.com")
+        cache.parse(parser, u"http://seclab.nu")
+        assert cache.getEvictions() == 2
+        assert len(cache.getCache()) == 1
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
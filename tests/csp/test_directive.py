@@ -124,6 +124,76 @@ class DirectiveTest(unittest.TestCase):
         assert not directive2.matches(DirectiveTest.sampleURI2, selfURI)
         assert not directive3.matches(DirectiveTest.sampleURI1, selfURI)
         assert not directive3.matches(DirectiveTest.sampleURI2, selfURI)
+
+    def testDirective_compile_sameResults(self):
+        """Compiled directives must give the same matching results as the original directives."""
+        srcExprs = [URISourceExpression(None, "*", None, None),
+                    URISourceExpression("https", None, None, None),
+                    URISourceExpression("http", "seclab.nu", "*", None),
+                    URISourceExpression(None, "*.seclab.nu", None, None),
+                    URISourceExpression("https", "*.ccs.neu.edu", 443, "/path/"),
+                    URISourceExpression(None, "*", 8080, None),
+                    URISourceExpression(None, "*nu", None, None),
+                    SelfSourceExpression.SELF(),
+                    SourceExpression.UNSAFE_INLINE()]
+        uris = [URI.EMPTY(), URI.INVALID(), URI.INLINE(), URI.EVAL(),
+                URI("http", "seclab.nu", 80, None, None),
+                URI("https", "seclab.nu", None, "/path", None),
+                URI("http", "www.seclab.nu", None, None, None),
+                URI("http", "wwwseclab.nu", None, None, None),
+                URI("https", "seclab.ccs.neu.edu", 443, "/path/file", None),
+                URI("https", "seclab.ccs.neu.edu", 443, "/other", None),
+                URI("http", "seclab.ccs.neu.edu", 8080, None, None),
+                URI("chrome-extension", "abcdef", None, None, None),
+                URI(None, "seclab.nu", None, None, None)]
+        selfURIs = [DirectiveTest.sampleURI1, URI("https", "seclab.ccs.neu.edu", None, None, None)]
+        directives = [Directive("img-src", srcExprs), Directive("img-src", []), Directive.INVALID(),
+                      Directive.INLINE_STYLE_BASE_RESTRICTION()]
+        directives += [Directive("img-src", [srcExpr]) for srcExpr in srcExprs]
+        for directive in directives:
+            compiled = directive.compile()
+            assert compiled.getDirective() == directive
+            for uri in uris:
+                for selfURI in selfURIs:
+                    assert compiled.matches(uri, selfURI) == directive.matches(uri, selfURI)
+
+    def testDirective_compile_sameResults_paths(self):
+        """Compiled directives with many paths on the same host must give the same results as the original."""
+        srcExprs = [URISourceExpression("http", "seclab.nu", None, u"/scripts/"),
+                    URISourceExpression("http", "seclab.nu", None, u"/scripts/lib/a.js"),
+                    URISourceExpression("http", "seclab.nu", None, u"/img/logo.png"),
+                    URISourceExpression("https", "seclab.nu", None, u"/secure/"),
+                    URISourceExpression("http", "seclab.nu", 8080, u"/alt.js"),
+                    URISourceExpression("http", "*.seclab.nu", None, u"/sub/"),
+                    URISourceExpression("http", "www.seclab.nu", None, None),
+                    URISourceExpression("http", "www.seclab.nu", None, u"/www.js")]
+        directive = Directive("script-src", srcExprs)
+        compiled = directive.compile()
+        selfURI = DirectiveTest.sampleURI1
+        for scheme in ("http", "https"):
+            for host in ("seclab.nu", "www.seclab.nu", "a.seclab.nu"):
+                for port in (None, 80, 443, 8080):
+                    for path in (None, u"/", u"/scripts/", u"/scripts/x.js", u"/scripts/lib/a.js", u"/img/logo.png",
+                                 u"/img/logo.png2", u"/secure/a", u"/alt.js", u"/sub/a.js", u"/www.js", u"/scripts"):
+                        uri = URI(scheme, host, port, path, None)
+                        assert compiled.matches(uri, selfURI) == directive.matches(uri, selfURI)
+
+    def testDirective_matchesMany(self):
+        directive = Directive("object-src", [DirectiveTest.sampleSrcExpr1a, DirectiveTest.sampleSrcExpr2])
+        uris = [DirectiveTest.sampleURI1, DirectiveTest.sampleURI2, URI.INLINE(), DirectiveTest.sampleURI1]
+        selfURI = DirectiveTest.sampleURI2
+        expected = [directive.matches(uri, selfURI) for uri in uris]
+        assert expected == [True, False, False, True]
+        assert directive.matchesMany(uris, selfURI) == expected
+        assert directive.matchesMany(iter(uris), selfURI) == expected
+        assert directive.compile().matchesMany(uris, selfURI) == expected
+        assert directive.matchesMany([], selfURI) == []
+        assert Directive.INVALID().matchesMany(uris, selfURI) == [False] * 4
+        assert Directive.INVALID().compile().matchesMany(uris, selfURI) == [False] * 4
+
+    def testDirective_compile_cached(self):
+        directive = Directive("object-src", [DirectiveTest.sampleSrcExpr1a, DirectiveTest.sampleSrcExpr2])
+        assert directive.compile() is directive.compile()
         
     def testDirective_generateDirective_regular(self):
         violated = Directive("object-src", [DirectiveTest.sampleSrcExpr1a, DirectiveTest.sampleSrcExpr2])
@@ -400,6 +470,16 @@ class DirectiveTest(unittest.TestCase):
         assert DirectiveParser().parse(firefoxViolatedDirective) \
                 == Directive.EVAL_SCRIPT_BASE_RESTRICTION()
 
+    def testDirectiveParser_parse_cache(self):
+        """Repeated directive strings are parsed only once."""
+        parser = DirectiveParser()
+        directive = parser.parse("img-src 'self' http://seclab.nu")
+        assert parser.parse("img-src 'self' http://seclab.nu") is directive
+        assert parser.parse("img-src 'self'") != directive
+        assert parser.getCache().getHits() == 1
+        assert parser.getCache().getMisses() == 2
+        assert DirectiveParser(cacheSize=0).parse("img-src 'self' http://seclab.nu") == directive
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
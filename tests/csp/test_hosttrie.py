@@ -0,0 +1,58 @@
+'''
+Tests for hosttrie.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import unittest
+from csp.hosttrie import HostTrie
+
+
+class HostTrieTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = HostTrie()
+        self.trie.add("seclab.nu", 1)
+        self.trie.add("*.seclab.nu", 2)
+        self.trie.add("www.seclab.nu", 3)
+        self.trie.add("*.www.seclab.nu", 4)
+        self.trie.add("seclab.nu", 5)
+        self.trie.add("*.neu.edu", 6)
+
+    def testHostTrie_len(self):
+        assert len(HostTrie()) == 0
+        assert len(self.trie) == 6
+
+    def testHostTrie_lookup_exact(self):
+        assert sorted(self.trie.lookup("seclab.nu")) == [1, 5]
+
+    def testHostTrie_lookup_wildcard(self):
+        assert sorted(self.trie.lookup("abc.seclab.nu")) == [2]
+        assert sorted(self.trie.lookup("a.b.c.seclab.nu")) == [2]
+        assert sorted(self.trie.lookup("seclab.ccs.neu.edu")) == [6]
+
+    def testHostTrie_lookup_exactAndWildcard(self):
+        assert sorted(self.trie.lookup("www.seclab.nu")) == [2, 3]
+        assert sorted(self.trie.lookup("abc.www.seclab.nu")) == [2, 4]
+
+    def testHostTrie_lookup_noMatch(self):
+        assert self.trie.lookup("neu.edu") == [] # wildcard does not match the host itself
+        assert self.trie.lookup("wwwseclab.nu") == [] # must be a true subdomain, not just substring
+        assert self.trie.lookup("nu") == []
+        assert self.trie.lookup("seclab.nu.example.com") == []
+        assert self.trie.lookup("") == []
+
+    def testHostTrie_lookup_sameAsSuffixComparison(self):
+        """Wildcards match exactly the hosts that end with the wildcard host without the '*'."""
+        trie = HostTrie()
+        wildcards = ["*.a.b", "*.b", "*..b", "*.b."]
+        for wildcard in wildcards:
+            trie.add(wildcard, wildcard)
+        for host in ["a.b", "x.a.b", "b", ".b", "..b", "x..b", "b.", "x.b.", "xa.b", "a.b.c"]:
+            expected = sorted([w for w in wildcards if host.endswith(w[1:])])
+            assert sorted(trie.lookup(host)) == expected
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
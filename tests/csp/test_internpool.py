@@ -0,0 +1,87 @@
+'''
+Tests for internpool.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import gc
+import unittest
+from csp.internpool import InternPool
+from csp.directive import Directive, DirectiveParser
+from csp.policy import Policy, PolicyParser
+from csp.report import ReportParser
+from csp.sourceexpression import SourceExpression, SelfSourceExpression, URISourceExpression
+
+
+class InternPoolTest(unittest.TestCase):
+
+    def testInternPool_sourceExpressions(self):
+        pool = InternPool()
+        expr1 = URISourceExpression("http", "seclab.nu", None, None)
+        expr2 = URISourceExpression("http", "seclab.nu", None, None)
+        assert pool.intern(expr1) is expr1
+        assert pool.intern(expr2) is expr1
+        assert pool.intern(SelfSourceExpression.SELF()) is SelfSourceExpression.SELF()
+        assert len(pool) == 2
+        assert expr2 in pool
+        assert pool.getHits() == 1
+        assert pool.getMisses() == 2
+
+    def testInternPool_directivesRecursive(self):
+        pool = InternPool()
+        expr = pool.intern(URISourceExpression("http", "seclab.nu", None, None))
+        directive1 = Directive("img-src", (URISourceExpression("http", "seclab.nu", None, None),))
+        directive2 = Directive("img-src", (URISourceExpression("http", "seclab.nu", None, None),))
+        interned = pool.intern(directive1)
+        assert interned == directive1
+        assert pool.intern(directive2) is interned
+        assert iter(interned.getWhitelistedSourceExpressions()).next() is expr
+        assert pool.intern(Directive.INVALID()) is Directive.INVALID()
+
+    def testInternPool_policies(self):
+        pool = InternPool()
+        policy1 = PolicyParser().parse("img-src 'self' http://seclab.nu; script-src 'self'")
+        policy2 = PolicyParser().parse("script-src 'self'; img-src http://seclab.nu 'self'")
+        assert policy1 is not policy2
+        assert pool.intern(policy1) is pool.intern(policy2)
+        assert pool.intern(Policy.INVALID()) is Policy.INVALID()
+
+    def testInternPool_weakReferences(self):
+        pool = InternPool()
+        pool.intern(URISourceExpression("http", "seclab.nu", None, None))
+        gc.collect()
+        assert len(pool) == 0
+        expr = URISourceExpression("http", "seclab.nu", None, None)
+        assert pool.intern(expr) is expr
+
+    def testInternPool_parsers(self):
+        pool = InternPool()
+        directive1 = DirectiveParser(internPool=pool).parse("img-src 'self'")
+        directive2 = DirectiveParser(internPool=pool).parse("img-src  'self' ")
+        assert directive1 is directive2
+        policy = PolicyParser(internPool=pool, expandDefaultSrc=False).parse("img-src 'self'")
+        assert iter(policy.getDirectives()).next() is directive1
+        report = """{"blocked-uri": "http://seclab.nu/image.png", "document-uri": "http://seclab.nu/",""" \
+                    + """ "violated-directive": "img-src 'self'", "original-policy": "img-src 'self'"}"""
+        cspReport = ReportParser(internPool=pool).parseString(report)
+        assert cspReport["violated-directive"] is directive1
+        assert cspReport["original-policy"] is policy
+
+    def testInternPool_asBasicPolicies(self):
+        pool = InternPool()
+        policy = PolicyParser().parse("img-src 'self' http://seclab.nu; script-src 'self' 'unsafe-inline'")
+        otherPolicy = PolicyParser().parse("img-src 'self'; script-src 'unsafe-inline' http://seclab.nu")
+        basic = policy.asBasicPolicies(pool)
+        assert basic == policy.asBasicPolicies()
+        assert pool.intern(Policy((Directive("img-src", (SelfSourceExpression.SELF(),)),))) in basic
+        (common, onlySelf, onlyOther) = policy.compareTo(otherPolicy, pool)
+        assert (common, onlySelf, onlyOther) == policy.compareTo(otherPolicy)
+        assert len(common) == 2
+        for basicPolicy in common:
+            assert any(basicPolicy is other for other in basic)
+        assert SourceExpression.UNSAFE_INLINE() in pool
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
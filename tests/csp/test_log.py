@@ -88,6 +88,26 @@ class LogEntryTest(unittest.TestCase):
         print LogEntryTest.cspLogEntry._entryData
         print parsed._entryData['csp-report'] == LogEntryTest.cspLogEntry._entryData['csp-report']
         assert parsed == LogEntryTest.cspLogEntry
+
+    def testLogEntryParser_parse_lazy(self):
+        parsed = LogEntryParser(strict=True, lazy=True).parseString(LogEntryTest.strLogEntry)
+        assert type(parsed["csp-report"]) == Report
+        assert parsed._lazyKeys is None
+        assert parsed == LogEntryTest.cspLogEntry
+        assert str(LogEntryParser(lazy=True).parseString(LogEntryTest.strLogEntry)) == str(LogEntryTest.cspLogEntry)
+        invalid = LogEntryParser(strict=True, lazy=True).parseString("""{"csp-report": {}, "policy-type": "regular"}""")
+        assert invalid["policy-type"] == "regular"
+        assert invalid["csp-report"] == Report.INVALID()
+
+    def testLogEntryParser_parse_fields(self):
+        parser = LogEntryParser(strict=True, fields=("policy-type", "csp-report"), reportFields=("blocked-uri",))
+        parsed = parser.parseString(LogEntryTest.strLogEntry)
+        assert sorted(parsed.keys()) == ["csp-report", "policy-type"]
+        assert parsed["csp-report"] == Report({"blocked-uri": LogEntryTest.cspLogEntry["csp-report"]["blocked-uri"]})
+        noReport = LogEntryParser(strict=True, fields=("policy-type",)).parseString(LogEntryTest.strLogEntry)
+        assert noReport == LogEntry({"policy-type": LogEntryTest.cspLogEntry["policy-type"]})
+        assert str(noReport) == repr(noReport) == """{"policy-type": "inline"}"""
+        assert parser.parseString("""{"policy-type": "regular"}""") == LogEntry.INVALID()
         
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for pathtree.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import unittest
+from csp.pathtree import PathRadixTree
+
+
+class PathRadixTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = PathRadixTree()
+        self.tree.add(u"/", 1)
+        self.tree.add(u"/scripts/", 2)
+        self.tree.add(u"/scripts/a.js", 3)
+        self.tree.add(u"/scripts/ab.js", 4)
+        self.tree.add(u"/script", 5)
+        self.tree.add(u"/scripts/lib/", 6)
+        self.tree.add(u"/scripts/a.js", 7)
+
+    def testPathRadixTree_len(self):
+        assert len(PathRadixTree()) == 0
+        assert len(self.tree) == 7
+
+    def testPathRadixTree_lookup_exact(self):
+        assert sorted(self.tree.lookup(u"/script")) == [1, 5]
+        assert sorted(self.tree.lookup(u"/scripts/a.js")) == [1, 2, 3, 7]
+        assert sorted(self.tree.lookup(u"/scripts/ab.js")) == [1, 2, 4]
+
+    def testPathRadixTree_lookup_prefix(self):
+        assert sorted(self.tree.lookup(u"/scripts/")) == [1, 2]
+        assert sorted(self.tree.lookup(u"/scripts/lib/x/y.js")) == [1, 2, 6]
+        assert sorted(self.tree.lookup(u"/scripts/a.jsx")) == [1, 2]
+        assert sorted(self.tree.lookup(u"/other")) == [1]
+
+    def testPathRadixTree_lookup_noMatch(self):
+        tree = PathRadixTree()
+        tree.add(u"/a/", 1)
+        tree.add(u"/a/b", 2)
+        assert tree.lookup(u"/a") == []
+        assert tree.lookup(u"/b") == []
+        assert tree.lookup(u"") == []
+
+    def testPathRadixTree_lookup_sameAsPathComparison(self):
+        """Same results as comparing each path individually (prefix match for paths ending in '/')."""
+        paths = [u"/", u"/a", u"/a/", u"/ab/", u"/a/b", u"/a/bc", u"/a/b/", u"/b/c/d/", u"/ä/ö"]
+        tree = PathRadixTree()
+        for path in paths:
+            tree.add(path, path)
+        for uriPath in paths + [u"/a/b/c", u"/ab", u"/abc/d", u"/b/c/d", u"/b/c/d/e", u"/ä/", u"/ä/ö/"]:
+            expected = sorted([p for p in paths if (p[-1:] == u"/" and uriPath.startswith(p)) or p == uriPath])
+            assert sorted(tree.lookup(uriPath)) == expected
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
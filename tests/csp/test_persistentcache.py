@@ -0,0 +1,102 @@
+'''
+Tests for persistentcache.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import pickle
+import sqlite3
+import unittest
+from csp.directive import Directive, DirectiveParser
+from csp.log import LogEntryParser
+from csp.persistentcache import PersistentParseCache
+from csp.policy import Policy, PolicyParser
+import pytest
+
+
+class PersistentParseCacheTest(unittest.TestCase):
+
+    policies = ["default-src 'self'; img-src http://seclab.nu:* data:; script-src 'unsafe-inline' 'unsafe-eval'",
+                "default-src 'none'; style-src *.seclab.nu/path/",
+                "img-src http://seclab.nu/%C3%A9t%C3%A9/",
+                "img-src 'none'; script-src 'unsafe-inline' *; \u0000"]
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def testPersistentParseCache_acrossRuns(self):
+        """Policies parsed in one run are returned from the database in the next run."""
+        cache = PersistentParseCache("cache.db")
+        parsed = map(PolicyParser(persistentCache=cache).parse, PersistentParseCacheTest.policies)
+        assert parsed[-1] is Policy.INVALID()
+        assert cache.getHits() == 0
+        cache.close()
+
+        cache = PersistentParseCache("cache.db")
+        parser = PolicyParser(persistentCache=cache)
+        assert map(parser.parse, PersistentParseCacheTest.policies) == parsed
+        assert cache.getHits() == len(PersistentParseCacheTest.policies)
+        assert parser.parse(PersistentParseCacheTest.policies[-1]) is Policy.INVALID()
+        assert str(parser.parse(PersistentParseCacheTest.policies[0])) == str(parsed[0])
+        otherParser = PolicyParser(expandDefaultSrc=False, persistentCache=cache)
+        assert otherParser.getConfigKey() != parser.getConfigKey()
+        otherParser.parse(PersistentParseCacheTest.policies[0])
+        assert cache.getMisses() == 1
+        cache.close()
+
+    def testPersistentParseCache_directives(self):
+        """Directives are cached by DirectiveParser, also through a LogEntryParser."""
+        cache = PersistentParseCache("cache.db")
+        parser = DirectiveParser(persistentCache=cache)
+        directive = parser.parse("script-src 'self' https:")
+        assert parser.parse("foo-src 'self'") is Directive.INVALID()
+        cache.close()
+        parser = DirectiveParser(persistentCache=cache)
+        assert parser.parse("script-src 'self' https:") == directive
+        assert parser.parse("foo-src 'self'") is Directive.INVALID()
+        assert cache.getHits() == 2
+        entryParser = LogEntryParser(persistentCache=cache)
+        assert entryParser.getReportParser().getPolicyParser().getDirectiveParser()._persistentCache is cache
+
+    def testPersistentParseCache_specialDirectives(self):
+        """The Firefox base restriction directives are returned as the same singletons from a reopened cache."""
+        strings = {"inline style base restriction": Directive.INLINE_STYLE_BASE_RESTRICTION(),
+                   "inline script base restriction": Directive.INLINE_SCRIPT_BASE_RESTRICTION(),
+                   "eval script base restriction": Directive.EVAL_SCRIPT_BASE_RESTRICTION()}
+        cache = PersistentParseCache("cache.db")
+        parser = DirectiveParser(persistentCache=cache)
+        for (string, directive) in strings.iteritems():
+            assert parser.parse(string) is directive
+        cache.close()
+        parser = DirectiveParser(persistentCache=cache)
+        for (string, directive) in strings.iteritems():
+            assert parser.parse(string) is directive
+        assert cache.getHits() == len(strings)
+
+    def testPersistentParseCache_eviction(self):
+        """The database holds at most the maximum number of entries."""
+        cache = PersistentParseCache("cache.db", maxSize=2, flushSize=1)
+        parser = PolicyParser(persistentCache=cache)
+        for policy in PersistentParseCacheTest.policies:
+            parser.parse(policy)
+        cache.close()
+        connection = sqlite3.connect("cache.db")
+        assert connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 2
+        connection.close()
+
+    def testPersistentParseCache_pickle(self):
+        """Only the configuration is pickled (for worker processes)."""
+        cache = PersistentParseCache("cache.db", maxSize=10)
+        PolicyParser(persistentCache=cache).parse(PersistentParseCacheTest.policies[0])
+        cache.flush()
+        copy = pickle.loads(pickle.dumps(cache, 2))
+        assert copy.get(PolicyParser().getConfigKey(), PersistentParseCacheTest.policies[0]) \
+                    == PolicyParser().parse(PersistentParseCacheTest.policies[0])
+        cache.close()
+        copy.close()
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
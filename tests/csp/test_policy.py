@@ -127,6 +127,44 @@ class PolicyTest(unittest.TestCase):
         selfURI = PolicyTest.sampleURI1a
         assert not pol.matches(URI.INLINE(), "script-src", selfURI)
         assert not pol.matches(URI.EVAL(), "script-src", selfURI)
+
+    def testPolicy_compile_sameResults(self):
+        """Compiled policies must give the same matching results as the original policies."""
+        policies = [Policy.INVALID(),
+                    Policy(()),
+                    Policy((PolicyTest.sampleDirective1a, PolicyTest.sampleDirective5)),
+                    Policy((PolicyTest.sampleDirective1a,)),
+                    Policy((PolicyTest.sampleDirective5, PolicyTest.sampleDirective6)),
+                    Policy((PolicyTest.sampleDirective2, PolicyTest.sampleDirective3, PolicyTest.sampleDirective9))]
+        uris = [URI.INLINE(), URI.EVAL(), URI.EMPTY(), PolicyTest.sampleURI1a, PolicyTest.sampleURI2,
+                URI("https", "abc.seclab.nu", 443, "/path", "some-query")]
+        resourceTypes = ("script-src", "style-src", "img-src", "connect-src", "form-action", "IMG-SRC")
+        for pol in policies:
+            compiled = pol.compile()
+            assert compiled.getPolicy() == pol
+            for uri in uris:
+                for resourceType in resourceTypes:
+                    for selfURI in (PolicyTest.sampleURI1a, PolicyTest.sampleURI2):
+                        assert compiled.matches(uri, resourceType, selfURI) == pol.matches(uri, resourceType, selfURI)
+
+    def testPolicy_matchesMany(self):
+        pol = Policy((PolicyTest.sampleDirective1a, PolicyTest.sampleDirective5))
+        uris = [URI("https", "abc.seclab.nu", 443, "/path", "some-query"), PolicyTest.sampleURI1a,
+                URI.EMPTY(), PolicyTest.sampleURI2]
+        selfURI = PolicyTest.sampleURI2
+        for resourceType in ("connect-src", "script-src", "form-action"):
+            expected = [pol.matches(uri, resourceType, selfURI) for uri in uris]
+            assert pol.matchesMany(uris, resourceType, selfURI) == expected
+            assert pol.compile().matchesMany(uris, resourceType, selfURI) == expected
+        assert pol.matchesMany(uris, "connect-src", selfURI) == [True, False, False, True]
+        assert pol.matchesMany(uris, "form-action", selfURI) == [False] * 4
+        assert Policy.INVALID().matchesMany(uris, "script-src", selfURI) == [False] * 4
+        assert Policy.INVALID().compile().matchesMany(uris, "script-src", selfURI) == [False] * 4
+
+    def testPolicy_compile_getDirective(self):
+        compiled = Policy((PolicyTest.sampleDirective1a, PolicyTest.sampleDirective5)).compile()
+        assert compiled.getDirective("connect-src").getDirective() == PolicyTest.sampleDirective5
+        assert compiled.getDirective("img-src") is None
         
     def testPolicyParser_parse_normal(self):
         simplePolicy = """connect-src 'self' https://abc.seclab.nu/path chrome-extension:; img-src 'none'"""
@@ -178,6 +216,23 @@ class PolicyTest(unittest.TestCase):
         assert cspPolicy == Policy([PolicyTest.sampleDirective5,
                                     Directive("font-src", [PolicyTest.sampleSourceExpression1,
                                                            PolicyTest.sampleSourceExpression2])])
+
+    def testPolicyParser_parse_cache(self):
+        """Repeated policy strings are parsed only once; the cache evicts the least recently used policy."""
+        policy1 = """img-src 'none'; script-src 'self'"""
+        policy2 = """img-src *"""
+        parser = PolicyParser(cacheSize=1)
+        cspPolicy = parser.parse(policy1)
+        assert parser.parse(policy1) is cspPolicy
+        assert parser.parse(policy2) == Policy([PolicyTest.sampleDirective3])
+        assert parser.parse(policy1) == cspPolicy
+        assert parser.getCache().getHits() == 1
+        assert parser.getCache().getMisses() == 3
+        assert parser.getCache().getEvictions() == 2
+        assert parser.getDirectiveParser().getCache().getHits() == 2
+        uncachedParser = PolicyParser(cacheSize=0)
+        assert uncachedParser.parse(policy1) == cspPolicy
+        assert uncachedParser.parse(policy1) is not uncachedParser.parse(policy1)
           
     def testPolicy_combinedPolicy_normal(self):
         pol1 = Policy([PolicyTest.sampleDirective6, PolicyTest.sampleDirective2, PolicyTest.sampleDirective3])
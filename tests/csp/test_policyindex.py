@@ -0,0 +1,81 @@
+'''
+Tests for policyindex.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import unittest
+import pytest
+from csp.policyindex import PolicyIndex
+from csp.policy import Policy, PolicyParser
+from csp.uri import URI
+
+
+class PolicyIndexTest(unittest.TestCase):
+
+    policyStrings = {"a": "default-src 'none'; img-src http://seclab.nu *.cdn.example.com",
+                     "b": "default-src 'self'; script-src 'unsafe-inline' https:",
+                     "c": "script-src http://static.example.com/js/",
+                     "d": "img-src *; style-src 'self' 'unsafe-inline'",
+                     "e": "default-src https://seclab.nu:*; connect-src 'none'",
+                     "f": "default-src 'none'"}
+    documentURIs = {"a": URI("http", "seclab.nu", None, "/index.html", None),
+                    "b": URI("https", "example.com", None, None, None),
+                    "c": URI("http", "example.com", None, None, None),
+                    "d": URI("http", "www.seclab.nu", None, None, None),
+                    "e": URI("https", "seclab.nu", None, None, None),
+                    "f": URI("http", "seclab.ccs.neu.edu", None, None, None)}
+    resourceURIs = [URI.INLINE(), URI.EVAL(), URI.EMPTY(),
+                    URI("http", "seclab.nu", None, "/img.png", None),
+                    URI("https", "seclab.nu", 443, "/img.png", None),
+                    URI("https", "seclab.nu", 8443, None, None),
+                    URI("http", "a.cdn.example.com", None, "/x.png", None),
+                    URI("http", "cdn.example.com", None, "/x.png", None),
+                    URI("https", "example.com", None, "/script.js", None),
+                    URI("http", "static.example.com", None, "/js/lib.js", None),
+                    URI("http", "static.example.com", None, "/css/site.css", None),
+                    URI("http", "www.seclab.nu", None, "/style.css", None),
+                    URI("data", "image/png;base64,AAAA", None, None, None)]
+    resourceTypes = ("img-src", "script-src", "style-src", "connect-src", "font-src", "form-action")
+
+    def setUp(self):
+        self.index = PolicyIndex()
+        self.policies = {}
+        parser = PolicyParser(expandDefaultSrc=False)
+        for policyId, policyString in PolicyIndexTest.policyStrings.iteritems():
+            self.policies[policyId] = parser.parse(policyString)
+            self.index.add(policyId, self.policies[policyId], PolicyIndexTest.documentURIs[policyId])
+
+    def testPolicyIndex_len(self):
+        assert len(PolicyIndex()) == 0
+        assert len(self.index) == 6
+        assert self.index.getPolicy("c") == self.policies["c"]
+
+    def testPolicyIndex_matchingPolicies_sameAsPolicyMatches(self):
+        for uri in PolicyIndexTest.resourceURIs:
+            for resourceType in PolicyIndexTest.resourceTypes:
+                expected = set([policyId for (policyId, pol) in self.policies.iteritems()
+                                if pol.matches(uri, resourceType, PolicyIndexTest.documentURIs[policyId])])
+                assert self.index.matchingPolicies(uri, resourceType) == expected
+                assert expected <= self.index.candidatePolicies(uri, resourceType)
+
+    def testPolicyIndex_matchingPolicies_examples(self):
+        assert self.index.matchingPolicies(URI("http", "a.cdn.example.com", None, None, None), "img-src") \
+            == set(["a", "c", "d"])
+        assert self.index.matchingPolicies(URI.INLINE(), "script-src") == set(["b"])
+
+    def testPolicyIndex_candidatePolicies_selective(self):
+        """Policies that do not mention a host are not candidates for that host."""
+        candidates = self.index.candidatePolicies(URI("http", "static.example.com", None, "/js/a.js", None), "script-src")
+        assert "a" not in candidates and "f" not in candidates
+
+    def testPolicyIndex_add_invalidAndDuplicate(self):
+        self.index.add("invalid", Policy.INVALID(), URI("http", "seclab.nu", None, None, None))
+        assert "invalid" not in self.index.matchingPolicies(URI("http", "seclab.nu", None, None, None), "img-src")
+        with pytest.raises(ValueError):
+            self.index.add("a", self.policies["b"], URI("http", "seclab.nu", None, None, None))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -11,6 +11,7 @@ from csp.policy import Policy
 from csp.directive import Directive
 from csp.sourceexpression import SourceExpression, SelfSourceExpression, URISourceExpression
 from csp.uri import URI
+from csp.cache import URIParseCache
 import pytest
 import json
 
@@ -228,6 +229,67 @@ class ReportTest(unittest.TestCase):
         assert cspReport == expected
 
 
+    def testReportParser_parse_uriCache(self):
+        """Parsers sharing a URIParseCache return the same URI objects for repeated strings."""
+        report = """{"blocked-uri": "http://seclab.nu/image.png", "document-uri": "http://seclab.nu/",""" \
+                    + """ "violated-directive": "img-src 'none'"}"""
+        cache = URIParseCache()
+        parser1 = ReportParser(uriCache=cache)
+        parser2 = ReportParser(uriCache=cache)
+        cspReport1 = parser1.parseString(report)
+        cspReport2 = parser2.parseString(report)
+        assert cspReport1 == ReportParser().parseString(report)
+        assert cspReport1["blocked-uri"] is cspReport2["blocked-uri"]
+        assert cache.getMisses() == 2
+        assert cache.getHits() == 2
+        assert ReportParser(addPortToURIs=True, uriCache=cache).parseString(report)["blocked-uri"].getPort() == 80
+
+    def testReportParser_parse_lazy(self):
+        """Optional fields are parsed on first access; the result equals the eagerly parsed report."""
+        report = """{"blocked-uri": "http://seclab.nu/image.png", "document-uri": "http://seclab.nu/",""" \
+                    + """ "referrer": "self", "violated-directive": "img-src 'none'",""" \
+                    + """ "original-policy": "img-src 'none'; script-src 'self'"}"""
+        cspReport = ReportParser(requiredKeys=("document-uri",), lazy=True).parseString(report)
+        assert cspReport._lazyKeys == set(["blocked-uri", "violated-directive", "original-policy"])
+        assert cspReport["document-uri"] == URI("http", "seclab.nu", None, "/")
+        assert cspReport.get("violated-directive") == Directive("img-src", ())
+        assert cspReport["referrer"] is cspReport["document-uri"]
+        assert "original-policy" in cspReport._lazyKeys
+        assert cspReport == ReportParser(requiredKeys=("document-uri",)).parseString(report)
+        assert cspReport._lazyKeys is None
+        assert str(ReportParser(lazy=True).parseString(report)) == str(cspReport)
+
+    def testReportParser_parse_lazyInvalid(self):
+        """Invalid optional fields do not invalidate lazily parsed reports."""
+        report = """{"blocked-uri": "http://seclab.nu/image.png", "document-uri": "http://seclab.nu/",""" \
+                    + """ "violated-directive": "img-src 'none'", "original-policy": "img-src 'none'; \u0000"}"""
+        assert ReportParser(strict=True).parseString(report) == Report.INVALID()
+        cspReport = ReportParser(strict=True, lazy=True).parseString(report)
+        assert cspReport != Report.INVALID()
+        assert cspReport["original-policy"] == Policy.INVALID()
+
+    def testReportParser_parse_fields(self):
+        """Only the selected fields are parsed and kept."""
+        report = """{"blocked-uri": "http://seclab.nu/image.png", "document-url": "http://seclab.nu/",""" \
+                    + """ "referrer": "self", "violated-directive": "img-src 'none'",""" \
+                    + """ "original-policy": "img-src 'none'; \u0000"}"""
+        parser = ReportParser(strict=True, fields=("blocked-uri", "violated-directive", "referrer"))
+        cspReport = parser.parseString(report)
+        assert sorted(cspReport.keys()) == ["blocked-uri", "referrer", "violated-directive"]
+        assert cspReport["referrer"] == URI("http", "seclab.nu", None, "/")
+        assert ReportParser(strict=True, lazy=True, fields=("referrer",)).parseString(report)["referrer"] \
+                    == URI("http", "seclab.nu", None, "/")
+        assert parser.parseString("""{"blocked-uri": "http://seclab.nu/image.png"}""") == Report.INVALID()
+        missing = ReportParser(fields=("referrer",)).parseString("""{"blocked-uri": "http://seclab.nu/"}""")
+        assert missing is not Report.INVALID()
+        assert missing.keys() == []
+        projected = ReportParser(fields=("referrer", "status-code")).parseString(
+                    """{"blocked-uri": "http://seclab.nu/", "referrer": "http://seclab.nu/a", "status-code": 200}""")
+        assert projected is not Report.INVALID()
+        assert sorted(projected.keys()) == ["referrer", "status-code"]
+        assert projected["referrer"] == URI("http", "seclab.nu", None, "/a")
+        assert projected["status-code"] == 200
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
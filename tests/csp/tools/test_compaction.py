@@ -0,0 +1,105 @@
+'''
+Tests for compaction.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import datetime
+import os
+import unittest
+from csp.log import LogEntry
+from csp.tools.compaction import SegmentCompactor
+from csp.tools.fileio import DataWriter, DataReader, LogEntryDataReader, SegmentIndex
+from ..test_log import LogEntryTest
+import pytest
+
+
+class SegmentCompactorTest(unittest.TestCase):
+
+    timestamps = [datetime.datetime(2013, 12, 14, 2, 58, 35, 280001),
+                  datetime.datetime(2013, 12, 13, 23, 59, 59, 999999),
+                  datetime.datetime(2013, 12, 14, 0, 0, 0),
+                  datetime.datetime(2014, 1, 1, 12, 0, 0),
+                  datetime.datetime(2014, 1, 1, 12, 0, 1)]
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def setUp(self):
+        for name in ("reports", "segments", "archive"):
+            os.mkdir(name)
+        self.entries = []
+        for timestamp in SegmentCompactorTest.timestamps:
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["timestamp-utc"] = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+            self.entries.append(LogEntry(entry))
+            writer = DataWriter(os.path.join("reports", timestamp.strftime("reports_%Y-%m-%d_%H%M%S.%f.log")))
+            writer.store(self.entries[-1])
+            writer.close()
+        self.entries.sort(key=lambda entry: entry["timestamp-utc"])
+
+    def testCompact(self):
+        """Merges report files into sorted segments and archives the originals."""
+        indexes = SegmentCompactor(segmentSize=2, threads=2).compact("reports", "segments",
+                                                                      archiveDirectory="archive")
+        assert [index.getCount() for index in indexes] == [2, 2, 1]
+        assert indexes[0].getMinTimestamp() == "2013-12-13 23:59:59.999999"
+        assert indexes[-1].getMaxTimestamp() == "2014-01-01 12:00:01.000000"
+        assert os.listdir("reports") == []
+        assert len(os.listdir("archive")) == 5
+        assert len(os.listdir("segments")) == 6
+        assert [index.getSegmentFile() for index in SegmentIndex.listSegments("segments")] \
+                    == [index.getSegmentFile() for index in indexes]
+        reader = LogEntryDataReader()
+        assert reader.loadAll(indexes[0].getSegmentFile()) == self.entries[:2]
+        assert list(reader.iterateSegments("segments")) == self.entries
+
+    def testCompact_remove(self):
+        """Compacts only report files in a time range and deletes them."""
+        SegmentCompactor().compact("reports", "segments", start=datetime.datetime(2013, 12, 14),
+                                   removeOriginals=True)
+        assert len(os.listdir("reports")) == 1
+        SegmentCompactor().compact("reports", "segments")
+        assert len(os.listdir("reports")) == 1
+        assert len(DataReader().loadAll(SegmentIndex.listSegments("segments")[0].getSegmentFile())) == 1
+        assert list(LogEntryDataReader().iterateSegments("segments")) == self.entries
+
+    def testIterateSegments_timeRange(self):
+        """Reads only the entries in a time range from segments."""
+        SegmentCompactor(segmentSize=3).compact("reports", "segments")
+        reader = LogEntryDataReader()
+        start = datetime.datetime(2013, 12, 14)
+        end = datetime.datetime(2014, 1, 1, 12, 0, 1)
+        assert list(reader.iterateSegments("segments", start, end)) == self.entries[1:4]
+        assert list(reader.iterateSegments("segments", start=end)) == self.entries[4:]
+        assert list(reader.iterateSegments("segments", end=datetime.datetime(2000, 1, 1))) == []
+        index = SegmentIndex.load(SegmentIndex.listSegments("segments")[0].getSegmentFile())
+        assert index.findRange(end=start) == (0, index.findRange(start=start)[0])
+
+    def testIterateSegments_overlapping(self):
+        """Merges segments of separate compaction runs whose time ranges overlap."""
+        SegmentCompactor(segmentSize=10).compact("reports", "segments", archiveDirectory="archive")
+        late = []
+        for timestamp in (datetime.datetime(2013, 12, 14, 1, 0, 0), datetime.datetime(2013, 12, 31)):
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["timestamp-utc"] = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+            late.append(LogEntry(entry))
+            writer = DataWriter(os.path.join("reports", timestamp.strftime("reports_%Y-%m-%d_%H%M%S.%f.log")))
+            writer.store(late[-1])
+            writer.close()
+        SegmentCompactor(segmentSize=10).compact("reports", "segments", archiveDirectory="archive")
+        indexes = SegmentIndex.listSegments("segments")
+        assert len(indexes) == 2
+        assert SegmentIndex.groupOverlapping(indexes) == [indexes]
+        expected = sorted(self.entries + late, key=lambda entry: entry["timestamp-utc"])
+        reader = LogEntryDataReader()
+        assert list(reader.iterateSegments("segments")) == expected
+        start = datetime.datetime(2013, 12, 14)
+        end = datetime.datetime(2014, 1, 1, 12, 0, 1)
+        assert list(reader.iterateSegments("segments", start, end)) == expected[1:6]
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
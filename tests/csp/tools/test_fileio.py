@@ -4,17 +4,69 @@ Tests for fileio.py
 @author: Tobias Lauinger <toby@ccs.neu.edu>
 '''
 
+import datetime
+import itertools
+import os
+import tempfile
+import time
 import unittest
-from csp.tools.fileio import DataWriter, ReportDataReader, LogEntryDataReader, PolicyDataReader
+from csp.tools.fileio import DataWriter, DataReader, ReportDataReader, LogEntryDataReader, PolicyDataReader, \
+                            ParallelDataReader, iterReports, iterLogEntries, iterPolicies, findLineRanges, \
+                            openDataFile, DirectoryReader, ColumnarWriter, ColumnarFile, ColumnarReader, LineIndex, \
+                            FollowReader
+from csp.log import LogEntryParser
+from csp.log import LogEntry
+from csp.policy import PolicyParser
 from csp.report import Report
 from csp.directive import Directive
 from csp.sourceexpression import SourceExpression, URISourceExpression
 from csp.policy import Policy
 from csp.uri import URI
 from ..test_log import LogEntryTest
+from csp.tools import fileio
 import pytest
 
 
+class DataWriterTest(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def testStoreMany(self):
+        """Writes batches of objects and synchronises them to disk."""
+        for filename in ("lines.dat", "lines.dat.gz", "lines.dat.bz2"):
+            writer = DataWriter(filename, syncInterval=3)
+            writer.storeMany(["a", "b"])
+            writer.store("c")
+            writer.storeMany([])
+            if filename == "lines.dat":
+                with open(filename) as f:
+                    assert f.read() == "a\nb\nc\n"
+            writer.storeAll(str(i) for i in range(2500))
+            writer.close()
+            assert writer.getFilenames() == [filename]
+            assert DataReader().loadAll(filename) == ["a", "b", "c"] + [str(i) for i in range(2500)]
+
+    def testRotation(self):
+        """Rotates the output by size and age."""
+        writer = DataWriter("rotated.log.gz", maxFileSize=4)
+        writer.storeMany(["a", "b"])
+        writer.storeMany(["c"])
+        writer.store("d")
+        writer.close()
+        filenames = writer.getFilenames()
+        assert len(filenames) == 2
+        assert all(filename.startswith("rotated_") and filename.endswith(".log.gz") for filename in filenames)
+        assert [DataReader().loadAll(filename) for filename in filenames] == [["a", "b"], ["c", "d"]]
+        writer = DataWriter(os.path.join(os.getcwd(), "aged"), maxFileAge=0)
+        writer.storeAll(["a", "b", "c"])
+        writer.store("d")
+        writer.close()
+        assert len(writer.getFilenames()) == 2
+        assert [DataReader().loadAll(filename) for filename in writer.getFilenames()] == [["a", "b", "c"], ["d"]]
+
+
 class ReportDataReaderTest(unittest.TestCase):
     
     sampleURI1a = URI("http", "seclab.nu", None, None, None)
@@ -76,8 +128,297 @@ class LogEntryDataReaderTest(unittest.TestCase):
         dataOut = self.fileIn.loadAll(self.filename)
         assert len(dataOut) == 1
         assert LogEntryTest.cspLogEntry in dataOut
+
+    def testIterLogEntries(self):
+        """Streams valid LogEntries from a file, skipping invalid lines."""
+        self.fileOut.storeAll([LogEntryTest.cspLogEntry, "invalid", LogEntryTest.cspLogEntry])
+        self.fileOut.close()
+        entries = iterLogEntries(self.filename)
+        assert entries.next() == LogEntryTest.cspLogEntry
+        assert list(entries) == [LogEntryTest.cspLogEntry]
+
+    def testFindLineRanges(self):
+        """Byte ranges are aligned to lines and cover the whole file."""
+        self.fileOut.storeAll(["a", "bcd", "", "efghij", "k"])
+        self.fileOut.close()
+        ranges = findLineRanges(self.filename, 3)
+        assert ranges == [(0, 6), (6, 14), (14, 16)]
+        assert findLineRanges(self.filename, 1) == [(0, 2), (2, 6), (6, 7), (7, 14), (14, 16)]
+        assert findLineRanges(self.filename, 100) == [(0, 16)]
+        reader = DataReader()
+        lines = [line for (start, end) in ranges for line in reader.iterateRange(self.filename, start, end)]
+        assert lines == reader.loadAll(self.filename)
+
+    def testParallelDataReader(self):
+        """Parses a file in parallel by byte range, in file order."""
+        entries = []
+        for i in range(20):
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["id"] = i
+            entries.append(LogEntry(entry))
+        self.fileOut.storeAll(entries[:10] + ["invalid"] + entries[10:])
+        self.fileOut.close()
+        reader = ParallelDataReader(2, LogEntryParser, {"strict": True}, rangeSize=1000)
+        assert reader.loadAll(self.filename) == entries
+        counts = list(reader.mapRanges(self.filename, _countObjects))
+        assert len(counts) > 2
+        assert sum(counts) == 20
+        policies = ParallelDataReader(2, PolicyParser).loadAll(self.filename)
+        assert policies == []
+
+    def testParallelDataReader_backpressure(self):
+        """Submits only a bounded number of ranges ahead of a slow consumer."""
+        self.fileOut.storeAll([LogEntryTest.cspLogEntry] * 50)
+        self.fileOut.close()
+        os.mkdir("started")
+        maxPending = ParallelDataReader.pendingRangesPerProcess * 2
+        consumed = 0
+        for count in ParallelDataReader(2, rangeSize=1).mapRanges(self.filename, _recordStart):
+            consumed += 1
+            time.sleep(0.01)
+            assert consumed <= len(os.listdir("started")) <= consumed - 1 + maxPending
+        assert consumed == 50
+
+    def testCompressedFiles(self):
+        """Writes and reads back compressed files."""
+        for filename in ("entries.gz", "entries.bz2"):
+            writer = DataWriter(filename, compressionLevel=1)
+            writer.storeAll([LogEntryTest.cspLogEntry] * 3)
+            writer.close()
+            with open(filename, "rb") as f:
+                assert not "csp-report" in f.read()
+            with openDataFile(filename) as f:
+                assert f.readline().strip() == str(LogEntryTest.cspLogEntry)
+            assert self.fileIn.loadAll(filename) == [LogEntryTest.cspLogEntry] * 3
+            assert findLineRanges(filename, 10)[0][0] == 0
+            assert ParallelDataReader(1, rangeSize=10).loadAll(filename) == [LogEntryTest.cspLogEntry] * 3
+
+    @pytest.mark.skipif(fileio.lzma is None, reason="requires the backports.lzma module")
+    def testCompressedFiles_xz(self):
+        """Writes and reads back .xz files."""
+        writer = DataWriter("entries.xz", compressionLevel=1)
+        writer.storeAll([LogEntryTest.cspLogEntry] * 3)
+        writer.close()
+        with open("entries.xz", "rb") as f:
+            assert not "csp-report" in f.read()
+        assert self.fileIn.loadAll("entries.xz") == [LogEntryTest.cspLogEntry] * 3
+        assert list(self.fileIn.iterateFromRecord("entries.xz", 2)) == [LogEntryTest.cspLogEntry]
+        assert ParallelDataReader(1, rangeSize=10).loadAll("entries.xz") == [LogEntryTest.cspLogEntry] * 3
+
+    def testDirectoryReader(self):
+        """Reads per-report files in timestamp order."""
+        os.mkdir("reports")
+        entries = {}
+        for (i, name) in enumerate(["2013-12-14_025835.280001", "2013-12-13_235959.999999",
+                                    "2013-12-14_000000.000000", "2014-01-01_120000.000000"]):
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["id"] = i
+            entries[name] = LogEntry(entry)
+            writer = DataWriter(os.path.join("reports", "reports_%s.log" % name))
+            writer.store(entries[name])
+            writer.close()
+        with open(os.path.join("reports", "other.log"), "w") as f:
+            f.write(str(LogEntryTest.cspLogEntry))
+        with open(os.path.join("reports", "reports_2013-12-15_000000.000000.log"), "w") as f:
+            f.write("invalid\n")
+        reader = DirectoryReader(parser=LogEntryParser(strict=True), threads=2, batchSize=2)
+        assert reader.loadAll("reports") == [entries[name] for name in sorted(entries.keys())]
+        start = datetime.datetime(2013, 12, 14)
+        end = datetime.datetime(2014, 1, 1, 12)
+        assert map(os.path.basename, reader.listFiles("reports", start, end)) \
+                    == ["reports_2013-12-14_000000.000000.log", "reports_2013-12-14_025835.280001.log",
+                        "reports_2013-12-15_000000.000000.log"]
+        assert reader.loadAll("reports", start, end) \
+                    == [entries["2013-12-14_000000.000000"], entries["2013-12-14_025835.280001"]]
+        assert reader.loadAll("reports", end=datetime.datetime(2000, 1, 1)) == []
         
         
+class ColumnarTest(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def setUp(self):
+        self.entries = []
+        for i in range(300):
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["id"] = i
+            if i % 2 == 0:
+                del entry["policy-type"]
+            self.entries.append(LogEntry(entry))
+        writer = ColumnarWriter("entries.col")
+        writer.storeAll(self.entries)
+        writer.close()
+
+    def testColumnarFile(self):
+        """Reads single columns, dictionary-encoded and as timestamps."""
+        columnarFile = ColumnarFile("entries.col")
+        assert columnarFile.getCount() == 300
+        assert "csp-report/blocked-uri" in columnarFile.getColumnNames()
+        assert columnarFile.readColumn("id") == range(300)
+        assert columnarFile.readColumn("policy-type")[:2] == [None, LogEntryTest.cspLogEntry["policy-type"]]
+        assert columnarFile.readColumn("timestamp-utc")[0] == LogEntryTest.cspLogEntry["timestamp-utc"]
+        assert columnarFile.readTimestamps()[0] == 1386982923456789
+        assert columnarFile.readTimestamps("id") is None
+        columnarFile.close()
+
+    def testColumnarReader(self):
+        """Loads all or only some columns of the log entries."""
+        assert ColumnarReader().loadAll("entries.col") == self.entries
+        parser = LogEntryParser(fields=("id", "policy-type"))
+        entries = ColumnarReader(parser=parser).loadAll("entries.col", ("id", "policy-type"))
+        assert entries[0] == LogEntry({"id": 0})
+        assert entries[1] == LogEntry({"id": 1, "policy-type": LogEntryTest.cspLogEntry["policy-type"]})
+        parser = LogEntryParser(reportFields=("blocked-uri",))
+        entries = ColumnarReader(parser=parser).loadAll("entries.col", ("csp-report/blocked-uri",))
+        assert entries[0]["csp-report"]["blocked-uri"] == LogEntryTest.cspLogEntry["csp-report"]["blocked-uri"]
+
+    def testColumnarWriter_irregularTimestamps(self):
+        """Timestamps that cannot be restored exactly are dictionary-encoded."""
+        writer = ColumnarWriter("timestamps.col")
+        writer.storeAll([{"timestamp-utc": "2013-12-14 01:02:03"}, {"timestamp-utc": "2013-12-14 01:02:03.456789"}])
+        writer.close()
+        columnarFile = ColumnarFile("timestamps.col")
+        assert columnarFile.readColumn("timestamp-utc") == ["2013-12-14 01:02:03", "2013-12-14 01:02:03.456789"]
+        assert columnarFile.readTimestamps() is None
+        columnarFile.close()
+
+
+class LineIndexTest(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def setUp(self):
+        self.entries = []
+        for i in range(10):
+            entry = dict(LogEntryTest.cspLogEntry)
+            entry["timestamp-utc"] = "2013-12-14 01:02:%02d.000000" % i
+            entry["policy-type"] = "inline" if i % 3 == 0 else "regular"
+            self.entries.append(LogEntry(entry))
+        self.filename = "entries.dat"
+        writer = DataWriter(self.filename)
+        writer.storeAll(self.entries[:5] + [""] + self.entries[5:])
+        writer.close()
+
+    def testLineIndex(self):
+        """Builds, stores and loads an index."""
+        assert LineIndex.load(self.filename) is None
+        index = LineIndex.build(self.filename)
+        index.store()
+        loaded = LineIndex.load(self.filename)
+        assert loaded.getCount() == 10
+        assert [loaded.getOffset(i) for i in range(10)] == [index.getOffset(i) for i in range(10)]
+        assert loaded.findRecords(policyType="inline") == [0, 3, 6, 9]
+        assert loaded.findRecords(datetime.datetime(2013, 12, 14, 1, 2, 2), datetime.datetime(2013, 12, 14, 1, 2, 5),
+                                  "regular") == [2, 4]
+        shards = loaded.getShards(3)
+        assert len(shards) == 3
+        assert shards[0][0] == 0 and shards[-1][1] == os.path.getsize(self.filename)
+        reader = LogEntryDataReader()
+        assert [entry for (start, end) in shards for entry in reader.iterateRange(self.filename, start, end)] \
+                    == self.entries
+        assert ParallelDataReader(2, rangeSize=1000).loadAll(self.filename) == self.entries
+        with open(self.filename, "a") as f:
+            f.write(str(self.entries[0]) + "\n")
+        assert LineIndex.load(self.filename) is None
+
+    def testLineIndex_compressed(self):
+        """The index of a compressed file is out of date when the file is rewritten."""
+        writer = DataWriter("entries.dat.gz")
+        writer.storeAll(["a" * 10, "b" * 10, "c" * 10])
+        writer.close()
+        LineIndex.build("entries.dat.gz").store()
+        assert LineIndex.load("entries.dat.gz").getCount() == 3
+        assert list(DataReader().iterateFromRecord("entries.dat.gz", 2)) == ["c" * 10]
+        writer = DataWriter("entries.dat.gz")
+        writer.storeAll(["a", "b", "c", "d"])
+        writer.close()
+        assert LineIndex.load("entries.dat.gz") is None
+        assert list(DataReader().iterateFromRecord("entries.dat.gz", 2)) == ["c", "d"]
+        os.utime("entries.dat.gz", (0, 0))
+        LineIndex.build("entries.dat.gz").store()
+        assert LineIndex.load("entries.dat.gz").getCount() == 4
+        os.utime("entries.dat.gz", (1, 1))
+        assert LineIndex.load("entries.dat.gz") is None
+
+    def testDataReader_records(self):
+        """Seeks to records by number and time range."""
+        LineIndex.build(self.filename).store()
+        reader = LogEntryDataReader()
+        assert list(reader.iterateFromRecord(self.filename, 7)) == self.entries[7:]
+        assert list(reader.iterateFromRecord(self.filename, 10)) == []
+        start = datetime.datetime(2013, 12, 14, 1, 2, 4)
+        assert list(reader.iterateRecords(self.filename, start)) == self.entries[4:]
+        assert list(reader.iterateRecords(self.filename, start, policyType="inline")) == [self.entries[6],
+                                                                                           self.entries[9]]
+        os.remove(self.filename + ".idx")
+        assert list(reader.iterateRecords(self.filename, end=start)) == self.entries[:4]
+        assert ParallelDataReader(2, rangeSize=100).loadAll(self.filename) == self.entries
+
+
+class FollowReaderTest(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def _append(self, filename, data):
+        with open(filename, "a") as f:
+            f.write(data)
+
+    def testFollowFile(self):
+        """Returns appended complete lines and resumes from the checkpoint."""
+        self._append("reports.log", "a\nb\n")
+        reader = FollowReader(DataReader(), "checkpoint.json")
+        assert list(reader.poll("reports.log")) == ["a", "b"]
+        self._append("reports.log", "c\nd")
+        assert list(reader.poll("reports.log")) == ["c"]
+        assert reader.getCheckpoint() == ("reports.log", os.stat("reports.log").st_ino, 6)
+        self._append("reports.log", "\ne\n")
+        # a restarted reader continues after the last checkpoint
+        assert list(FollowReader(DataReader(), "checkpoint.json").poll("reports.log")) == ["d", "e"]
+        assert list(FollowReader(DataReader(), "checkpoint.json").poll("reports.log")) == []
+        assert list(FollowReader(DataReader()).poll("reports.log")) == ["a", "b", "c", "d", "e"]
+
+    def testFollowFile_rotation(self):
+        """Reads the rest of a rotated file before the new file, and restarts truncated files."""
+        self._append("reports.log", "a\n")
+        reader = FollowReader(DataReader(), "checkpoint.json")
+        assert list(reader.poll("reports.log")) == ["a"]
+        self._append("reports.log", "b\n")
+        os.rename("reports.log", "reports.log.1")
+        self._append("reports.log.1", "c\n")
+        self._append("reports.log", "d\n")
+        assert list(FollowReader(DataReader(), "checkpoint.json").poll("reports.log")) == ["b", "c", "d"]
+        assert list(reader.poll("reports.log")) == ["b", "c", "d"]
+        open("reports.log", "w").close()
+        assert list(reader.poll("reports.log")) == []
+        self._append("reports.log", "e\n")
+        assert list(reader.poll("reports.log")) == ["e"]
+
+    def testFollowDirectory(self):
+        """Follows the files in a directory in name order, including files added later."""
+        os.mkdir("reports")
+        writer = DataWriter(os.path.join("reports", "reports.log"), maxFileSize=2)
+        writer.storeMany(["a"])
+        writer.storeMany(["b"])
+        writer.flush()
+        self._append(os.path.join("reports", "reports.log.idx"), "x\n")
+        reader = FollowReader(DataReader(), "checkpoint.json")
+        assert list(reader.poll("reports")) == ["a", "b"]
+        writer.storeMany(["c"])
+        writer.close()
+        assert len(writer.getFilenames()) == 3
+        assert list(FollowReader(DataReader(), "checkpoint.json").poll("reports")) == ["c"]
+        os.remove(writer.getFilenames()[1])
+        assert list(reader.poll("reports")) == ["c"]
+        assert list(reader.follow("reports", timeout=0)) == []
+        assert list(DataReader().follow("reports", timeout=0, pollInterval=0)) == ["a", "c"]
+
+
 class PolicyDataReaderTest(unittest.TestCase):
     
     samplePolicy = Policy([Directive("default-src", ()),
@@ -101,8 +442,27 @@ class PolicyDataReaderTest(unittest.TestCase):
         dataOut = self.fileIn.loadAll(self.filename)
         assert len(dataOut) == 1
         assert PolicyDataReaderTest.samplePolicy in dataOut
+
+    def testIterPolicies(self):
+        """Streams Policies from a file and composes with itertools."""
+        self.fileOut.storeAll([PolicyDataReaderTest.samplePolicy] * 5)
+        self.fileOut.close()
+        assert list(itertools.islice(iterPolicies(self.filename), 2)) == [PolicyDataReaderTest.samplePolicy] * 2
+        assert len(list(DataReader(bufferSize=16).iterate(self.filename))) == 5
+        assert list(iterReports(self.filename)) == []
         
 
+def _countObjects(objects):
+    return sum(1 for _ in objects)
+
+
+def _recordStart(objects):
+    # creates a file for each range that is started by a worker (to count the submitted ranges)
+    (handle, _) = tempfile.mkstemp(dir="started")
+    os.close(handle)
+    return _countObjects(objects)
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
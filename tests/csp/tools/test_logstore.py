@@ -0,0 +1,98 @@
+'''
+Tests for logstore.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import datetime
+import os
+import sqlite3
+import unittest
+from csp.log import LogEntryParser
+from csp.tools.fileio import LogEntryDataReader
+from csp.tools.logstore import LogEntryStore
+from csp.uri import URI
+import pytest
+
+
+class LogEntryStoreTest(unittest.TestCase):
+
+    sampleLogEntries = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                                    "sample-logentries.dat")
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def setUp(self):
+        self.entries = LogEntryDataReader().loadAll(LogEntryStoreTest.sampleLogEntries)
+        self.store = LogEntryStore("entries.db")
+
+    def tearDown(self):
+        self.store.close()
+
+    def testLogEntryStore_roundTrip(self):
+        """All log entries are returned unchanged, ordered by timestamp."""
+        assert self.store.storeFile(LogEntryStoreTest.sampleLogEntries) == len(self.entries)
+        expected = sorted(self.entries, key=lambda entry: entry["timestamp-utc"])
+        assert list(self.store.query()) == expected
+        assert self.store.count() == len(self.entries)
+        assert list(self.store.query(limit=2)) == expected[:2]
+
+    def testLogEntryStore_normalised(self):
+        """Policies, URIs and user agents are stored only once."""
+        self.store.storeAll(self.entries)
+        self.store.storeAll(self.entries)
+        connection = sqlite3.connect("entries.db")
+        policies = set(str(entry["csp-report"]["original-policy"]) for entry in self.entries)
+        assert connection.execute("SELECT COUNT(*) FROM policies").fetchone()[0] == len(policies)
+        assert connection.execute("SELECT COUNT(*) FROM userAgents").fetchone()[0] == 1
+        assert connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 2 * len(self.entries)
+        connection.close()
+
+    def testLogEntryStore_query(self):
+        """Queries return the log entries that match all criteria."""
+        self.store.storeAll(self.entries)
+        self.store.close()
+        self.store = LogEntryStore("entries.db", LogEntryParser())
+        scriptEntries = [entry for entry in self.entries
+                         if entry["csp-report"]["violated-directive"].getType() == "script-src"]
+        assert len(scriptEntries) > 0
+        assert self.store.count(directiveType="script-src") == len(scriptEntries)
+        assert list(self.store.query(directiveType="script-src")) \
+                    == sorted(scriptEntries, key=lambda entry: entry["timestamp-utc"])
+        assert self.store.count(documentOrigin="http://example.seclab.nu") == 3
+        assert self.store.count(documentOrigin=URI("http", "other.example.seclab.nu", None, "/page")) == 2
+        assert self.store.count(documentOrigin="http://seclab.nu") == 0
+        hostEntries = [entry for entry in self.entries
+                       if entry["csp-report"]["blocked-uri"].getHost() == "example.seclab.nu"]
+        assert self.store.count(blockedHost="example.seclab.nu") == len(hostEntries)
+        policyType = self.entries[0]["policy-type"]
+        assert self.store.count(policyType=policyType, directiveType="script-src") \
+                    == len([entry for entry in scriptEntries if entry["policy-type"] == policyType])
+
+    def testLogEntryStore_rollback(self):
+        """Log entries stored after a failed transaction reference existing values."""
+        def failing():
+            yield self.entries[0]
+            raise IOError("read error")
+        with pytest.raises(IOError):
+            self.store.storeAll(failing())
+        assert self.store.count() == 0
+        self.store.store(self.entries[0])
+        assert self.store.count() == 1
+        assert list(self.store.query()) == [self.entries[0]]
+
+    def testLogEntryStore_timeRange(self):
+        """Log entries with a timestamp in [start, end) are returned."""
+        self.store.storeAll(self.entries)
+        timestamp = datetime.datetime(2013, 12, 14, 2, 58, 35, 286315)
+        assert self.store.count(start=timestamp) + self.store.count(end=timestamp) == len(self.entries)
+        assert self.store.count(start=timestamp, end=timestamp) == 0
+        assert self.store.count(start=timestamp, end=timestamp + datetime.timedelta(microseconds=1)) == 1
+        assert self.store.count(start=datetime.datetime(2014, 1, 1)) == 0
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,139 @@
+'''
+Tests for validator.py
+
+@author: Tobias Lauinger <toby@ccs.neu.edu>
+'''
+
+import json
+import unittest
+from csp.tools.validator import ReportValidator
+from csp.log import LogEntry
+from csp.report import Report, ReportParser
+from csp.uri import URI
+import pytest
+
+
+class ReportValidatorTest(unittest.TestCase):
+
+    documentURI = u"http://seclab.nu/page.html"
+    policy = u"default-src 'self'; script-src 'self' http://cdn.seclab.nu; img-src *"
+
+    @pytest.fixture(autouse=True)
+    def initdir(self, tmpdir):
+        tmpdir.chdir()
+
+    def setUp(self):
+        self.validator = ReportValidator()
+        self.parser = ReportParser(policyKeys=())
+
+    def _report(self, blockedURI, violatedDirective, policy=None, documentURI=None):
+        return {"blocked-uri": blockedURI,
+                "violated-directive": violatedDirective,
+                "document-uri": documentURI if documentURI is not None else ReportValidatorTest.documentURI,
+                "original-policy": policy if policy is not None else ReportValidatorTest.policy}
+
+    def _parse(self, blockedURI, violatedDirective, policy=None):
+        return self.parser.parseJsonDict(self._report(blockedURI, violatedDirective, policy))
+
+    def testValidateReport_violation(self):
+        report = self._parse(u"http://evil.com/x.js", u"script-src 'self' http://cdn.seclab.nu")
+        assert self.validator.validateReport(report) == ReportValidator.VIOLATION
+
+    def testValidateReport_bogus(self):
+        report = self._parse(u"http://cdn.seclab.nu/x.js", u"script-src 'self' http://cdn.seclab.nu")
+        assert self.validator.validateReport(report) == ReportValidator.BOGUS
+        report = self._parse(u"http://seclab.nu/style.css", u"style-src 'self'")
+        assert self.validator.validateReport(report) == ReportValidator.BOGUS
+
+    def testValidateReport_policyObject(self):
+        report = ReportParser().parseJsonDict(self._report(u"http://cdn.seclab.nu/x.js",
+                                                           u"script-src 'self' http://cdn.seclab.nu"))
+        assert self.validator.validateReport(report) == ReportValidator.BOGUS
+
+    def testValidateReport_inline(self):
+        report = self._parse(u"", u"script-src 'self' http://cdn.seclab.nu")
+        assert self.validator.validateReport(report, "inline") == ReportValidator.VIOLATION
+        report = self._parse(u"", u"script-src 'unsafe-inline'", u"script-src 'unsafe-inline'")
+        assert self.validator.validateReport(report, "inline") == ReportValidator.BOGUS
+        assert self.validator.validateReport(report, "eval") == ReportValidator.VIOLATION
+
+    def testValidateReport_unchecked(self):
+        assert self.validator.validateReport(Report.INVALID()) == ReportValidator.UNCHECKED
+        report = self._parse(u"", u"script-src 'self'")
+        assert self.validator.validateReport(report) == ReportValidator.UNCHECKED
+        report = Report({"blocked-uri": URI.INVALID(), "document-uri": URI.INVALID()})
+        assert self.validator.validateReport(report) == ReportValidator.UNCHECKED
+
+    def testValidateReport_invalidPolicy(self):
+        report = self._parse(u"http://evil.com/x.js", u"script-src 'self'", u"script-src 'self'; img-src")
+        assert self.validator.validateReport(report) == ReportValidator.UNCHECKED
+
+    def testValidateReport_policyParsedOnce(self):
+        for _ in range(3):
+            report = self._parse(u"http://evil.com/x.js", u"script-src 'self' http://cdn.seclab.nu")
+            self.validator.validateReport(report)
+        assert len(self.validator._policies) == 1
+        assert self.validator._policies.getMisses() == 1
+        assert self.validator._policies.getHits() == 2
+
+    def testValidateLogEntry(self):
+        entry = LogEntry({"csp-report": self._parse(u"", u"script-src 'self' http://cdn.seclab.nu"),
+                          "policy-type": "inline"})
+        assert self.validator.validateLogEntry(entry) == ReportValidator.VIOLATION
+        assert self.validator.validate(entry) == ReportValidator.VIOLATION
+        assert self.validator.validateLogEntry(LogEntry({"policy-type": "inline"})) == ReportValidator.UNCHECKED
+
+    def testValidateAll_getCounts(self):
+        reports = [self._parse(u"http://evil.com/x.js", u"script-src 'self' http://cdn.seclab.nu"),
+                   self._parse(u"http://cdn.seclab.nu/x.js", u"script-src 'self' http://cdn.seclab.nu"),
+                   self._parse(u"http://evil.com/x.js", u"script-src 'self' http://cdn.seclab.nu"),
+                   Report.INVALID()]
+        results = list(self.validator.validateAll(reports))
+        assert [verdict for (_, verdict) in results] == [ReportValidator.VIOLATION, ReportValidator.BOGUS,
+                                                         ReportValidator.VIOLATION, ReportValidator.UNCHECKED]
+        assert results[1][0] is reports[1]
+        assert self.validator.getCounts() == {ReportValidator.VIOLATION: 2, ReportValidator.BOGUS: 1,
+                                              ReportValidator.UNCHECKED: 1}
+
+    def _writeLogFile(self, filename):
+        entries = []
+        for i in range(25):
+            if i % 3 == 0:
+                blocked = u"http://cdn.seclab.nu/%d.js" % i
+            else:
+                blocked = u"http://evil%d.com/x.js" % i
+            entries.append({"csp-report": self._report(blocked, u"script-src 'self' http://cdn.seclab.nu"),
+                            "policy-type": "regular"})
+        with open(filename, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.write("not json\n")
+
+    def testValidateFile(self):
+        self._writeLogFile("entries.log")
+        results = []
+        counts = self.validator.validateFile("entries.log", lambda entry, verdict: results.append(verdict))
+        assert counts == {ReportValidator.VIOLATION: 16, ReportValidator.BOGUS: 9, ReportValidator.UNCHECKED: 0}
+        assert len(results) == 25
+        assert results[0] == ReportValidator.BOGUS and results[1] == ReportValidator.VIOLATION
+
+    def testValidateFile_processes(self):
+        self._writeLogFile("entries.log")
+        expected = []
+        self.validator.validateFile("entries.log", lambda entry, verdict: expected.append((entry, verdict)))
+        results = []
+        validator = ReportValidator()
+        counts = validator.validateFile("entries.log", lambda entry, verdict: results.append((entry, verdict)),
+                                        processes=2, chunkSize=4)
+        assert counts == {ReportValidator.VIOLATION: 16, ReportValidator.BOGUS: 9, ReportValidator.UNCHECKED: 0}
+        assert validator.getCounts() == counts
+        assert results == expected
+
+    def testValidateFile_reports(self):
+        with open("reports.log", "w") as f:
+            f.write(json.dumps(self._report(u"http://evil.com/x.js", u"script-src 'self'")) + "\n")
+            f.write(json.dumps(self._report(u"http://seclab.nu/x.js", u"script-src 'self'")) + "\n")
+        counts = self.validator.validateFile("reports.log", logEntries=False)
+        assert counts == {ReportValidator.VIOLATION: 1, ReportValidator.BOGUS: 1, ReportValidator.UNCHECKED: 0}
+        counts = ReportValidator().validateFile("reports.log", logEntries=False, processes=2)
+        assert counts == {ReportValidator.VIOLATION: 1, ReportValidator.BOGUS: 1, ReportValidator.UNCHECKED: 0}